@@ -0,0 +1,26 @@
+import time
+from bot.utils.security import make_admin_token, verify_admin_token
+from webapp.auth import VerifiedTokenCache
+
+REQUESTS = 100_000
+
+
+def bench(name: str, verify, token: str):
+    started = time.perf_counter()
+    for _ in range(REQUESTS):
+        verify(token)
+    elapsed = time.perf_counter() - started
+    print(f"{name}: {elapsed / REQUESTS * 1_000_000:7.2f} мкс/запит")
+
+
+def main():
+    token = make_admin_token(123456789)
+    cache = VerifiedTokenCache(maxsize=1024)
+
+    bench("jwt.decode на кожен запит", verify_admin_token, token)
+    bench("кеш перевірених токенів ", cache.verify, token)
+    print(f"\nСтатистика кешу: {cache.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+import asyncio
+import time
+from bot.utils.security import hash_password, hash_password_async
+
+REGISTRATIONS = 20
+DURATION_SEC = 3.0
+
+
+async def fake_update_stream(stop_at: float) -> tuple[int, float]:
+    # Імітація апдейтів інших користувачів: кожен апдейт - короткий хендлер
+    processed = 0
+    worst_delay = 0.0
+    while time.perf_counter() < stop_at:
+        started = time.perf_counter()
+        await asyncio.sleep(0.001)
+        worst_delay = max(worst_delay, time.perf_counter() - started)
+        processed += 1
+    return processed, worst_delay
+
+
+async def registrations(use_pool: bool, stop_at: float) -> int:
+    async def one():
+        if use_pool:
+            await hash_password_async("secret123")
+        else:
+            hash_password("secret123")
+            await asyncio.sleep(0)
+
+    done = 0
+    while time.perf_counter() < stop_at:
+        await asyncio.gather(*(one() for _ in range(REGISTRATIONS)))
+        done += REGISTRATIONS
+    return done
+
+
+async def run(use_pool: bool):
+    stop_at = time.perf_counter() + DURATION_SEC
+    (processed, worst_delay), hashed = await asyncio.gather(
+        fake_update_stream(stop_at),
+        registrations(use_pool, stop_at)
+    )
+    mode = "пул потоків" if use_pool else "синхронно "
+    print(
+        f"{mode}: апдейтів/с = {processed / DURATION_SEC:8.1f}, "
+        f"макс. затримка = {worst_delay * 1000:7.1f} мс, "
+        f"реєстрацій = {hashed}"
+    )
+
+
+async def main():
+    await run(use_pool=False)
+    await run(use_pool=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,51 @@
+import random
+import time
+from datetime import datetime, timezone, timedelta
+from webapp.dispatch import CourierLoadIndex, CityLoadIndex
+
+# Вартість однієї рекомендації кур'єра та однієї події замовлення для індексу в пам'яті
+COURIERS = 50
+PENDING_ORDERS = 5000
+DELIVERED_ORDERS = 20000
+SUGGESTIONS = 20000
+
+
+def main():
+    random.seed(1)
+    index_registry = CourierLoadIndex(slot_minutes=60, recent_days=7, ttl=600)
+    index = CityLoadIndex(time.monotonic())
+    now = datetime.now(timezone.utc)
+    base = now.timestamp()
+
+    for order_id in range(PENDING_ORDERS):
+        index.add_pending(order_id, random.randrange(COURIERS), base + random.uniform(0, 3 * 86400))
+    for order_id in range(PENDING_ORDERS, PENDING_ORDERS + DELIVERED_ORDERS):
+        index.add_delivered(order_id, random.randrange(COURIERS), base - random.uniform(0, 7 * 86400))
+    couriers = [{"id": i, "username": f"courier{i}", "tg_id": i} for i in range(COURIERS)]
+
+    times = [now + timedelta(minutes=random.randrange(3 * 24 * 60)) for _ in range(SUGGESTIONS)]
+    started = time.perf_counter()
+    for delivery_time in times:
+        index_registry.rank(index, couriers, delivery_time, 5)
+    per_suggestion = (time.perf_counter() - started) / SUGGESTIONS
+
+    events = []
+    for i in range(SUGGESTIONS):
+        order_id = 1_000_000 + i
+        events.append(("order_created", {
+            "id": order_id, "city_id": 1, "courier_id": random.randrange(COURIERS), "status": "pending",
+            "delivery_time": (now + timedelta(minutes=random.randrange(3 * 24 * 60))).isoformat()
+        }))
+        events.append(("order_status_changed", {"id": order_id, "city_id": 1, "status": "delivered"}))
+    started = time.perf_counter()
+    for event, data in events:
+        index_registry._apply(index, event, data)
+    per_event = (time.perf_counter() - started) / len(events)
+
+    print(f"Кур'єрів: {COURIERS}, замовлень в очікуванні: {PENDING_ORDERS}, доставлених за тиждень: {DELIVERED_ORDERS}")
+    print(f"{'✅' if per_suggestion < 1e-3 else '⚠️'} Рекомендація: {per_suggestion * 1e6:.1f} мкс")
+    print(f"Подія замовлення: {per_event * 1e6:.1f} мкс")
+
+
+if __name__ == "__main__":
+    main()
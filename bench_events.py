@@ -0,0 +1,49 @@
+import asyncio
+import time
+from webapp.events import EventBroker
+
+# Розсилка подій замовлень на сотні відкритих дашбордів одного міста:
+# більшість клієнтів встигає читати, кілька "повільних" не читають зовсім
+SUBSCRIBERS = 500
+SLOW_SUBSCRIBERS = 5
+EVENTS = 2000
+CHANNEL = "orders:1"
+
+
+async def main():
+    broker = EventBroker(queue_size=100)
+    received = [0] * SUBSCRIBERS
+    done = asyncio.Event()
+
+    async def client(index: int, queue: asyncio.Queue):
+        while True:
+            event, data = await queue.get()
+            received[index] += 1
+            if event != "resync" and data["id"] == EVENTS - 1:
+                return
+
+    queues = [broker.subscribe(CHANNEL) for _ in range(SUBSCRIBERS)]
+    tasks = [
+        asyncio.create_task(client(i, queue))
+        for i, queue in enumerate(queues[SLOW_SUBSCRIBERS:], start=SLOW_SUBSCRIBERS)
+    ]
+
+    started = time.perf_counter()
+    for i in range(EVENTS):
+        broker.publish(CHANNEL, "order_status_changed", {"id": i, "status": "delivered"})
+        # Клієнти отримують керування між подіями, як між HTTP-запитами адмінки
+        await asyncio.sleep(0)
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+
+    deliveries = sum(received)
+    stats = broker.stats()
+    print(f"Підписників: {SUBSCRIBERS}, подій: {EVENTS}, доставок: {deliveries}")
+    print(f"Час: {elapsed:.2f} с, {deliveries / elapsed:.0f} доставок/с, {elapsed / EVENTS * 1e6:.0f} мкс на подію")
+    print(f"Скинуто черг повільних клієнтів: {stats['dropped']}")
+    slow_sizes = {queue.qsize() for queue in queues[:SLOW_SUBSCRIBERS]}
+    print(f"{'✅' if max(slow_sizes) <= broker.queue_size else '⚠️'} Черги повільних клієнтів обмежені: {sorted(slow_sizes)}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
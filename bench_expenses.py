@@ -0,0 +1,43 @@
+import time
+from collections import defaultdict
+import numpy as np
+from webapp.expenses import aggregate_expenses
+
+ROWS = 3_000_000
+CATEGORIES = ["delivery", "marketing", "other", "rent", "salary", "utilities"]
+
+
+def python_loop(days, codes, amounts):
+    # Наївний варіант для порівняння: цикл по кожному рядку
+    by_month = defaultdict(float)
+    by_category = defaultdict(float)
+    for day, code, amount in zip(days.tolist(), codes.tolist(), amounts.tolist()):
+        by_month[(day.year, day.month)] += amount
+        by_category[code] += amount
+    return by_month, by_category
+
+
+def main():
+    rng = np.random.default_rng(42)
+    days = np.datetime64("2024-01-01") + rng.integers(0, 730, ROWS).astype("timedelta64[D]")
+    codes = rng.integers(0, len(CATEGORIES), ROWS)
+    amounts = rng.uniform(1, 500, ROWS).round(2)
+
+    revenue_days = np.datetime64("2024-01-01") + np.arange(730).astype("timedelta64[D]")
+    revenue = rng.uniform(1000, 5000, 730)
+    cost = revenue * 0.4
+
+    print(f"Синтетичних витрат: {ROWS:,}")
+    for period in ("day", "week", "month"):
+        started = time.perf_counter()
+        report = aggregate_expenses(days, codes, CATEGORIES, amounts, period, revenue_days, revenue, cost)
+        elapsed = time.perf_counter() - started
+        print(f"numpy {period:>5}: {elapsed * 1000:8.1f} мс, періодів = {len(report['buckets'])}")
+
+    started = time.perf_counter()
+    python_loop(days, codes, amounts)
+    print(f"цикл  month: {(time.perf_counter() - started) * 1000:8.1f} мс")
+
+
+if __name__ == "__main__":
+    main()
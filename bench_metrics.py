@@ -0,0 +1,63 @@
+import asyncio
+import time
+import httpx
+from fastapi import FastAPI
+from webapp.metrics import MetricsMiddleware, render_metrics
+
+# Порівняння пропускної здатності простого endpoint з MetricsMiddleware і без нього
+REQUESTS = 5000
+CONCURRENCY = 50
+ROUNDS = 5
+
+
+def build_app(with_metrics: bool) -> FastAPI:
+    app = FastAPI()
+    if with_metrics:
+        app.add_middleware(MetricsMiddleware)
+
+    @app.get("/api/items/{item_id}")
+    async def get_item(item_id: int):
+        return {"id": item_id, "name": f"item {item_id}"}
+
+    return app
+
+
+async def measure(app: FastAPI) -> float:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def worker(offset: int):
+            for i in range(offset, REQUESTS, CONCURRENCY):
+                response = await client.get(f"/api/items/{i}")
+                assert response.status_code == 200
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(i) for i in range(CONCURRENCY)))
+        return REQUESTS / (time.perf_counter() - started)
+
+
+async def main():
+    plain_app = build_app(False)
+    metrics_app = build_app(True)
+    await measure(plain_app)
+    await measure(metrics_app)
+
+    # Почергові прогони, щоб шум машини однаково впливав на обидва варіанти
+    plain, with_metrics = [], []
+    for _ in range(ROUNDS):
+        plain.append(await measure(plain_app))
+        with_metrics.append(await measure(metrics_app))
+
+    plain_rps = max(plain)
+    metrics_rps = max(with_metrics)
+    overhead = (plain_rps - metrics_rps) / plain_rps * 100
+    print(f"Без метрик:  {plain_rps:.0f} запитів/с")
+    print(f"З метриками: {metrics_rps:.0f} запитів/с")
+    print(f"{'✅' if overhead < 5 else '⚠️'} Накладні витрати: {overhead:.1f}%")
+
+    started = time.perf_counter()
+    body = render_metrics()
+    print(f"Рендер /metrics: {(time.perf_counter() - started) * 1000:.2f} мс, {len(body)} байт")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
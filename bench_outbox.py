@@ -0,0 +1,72 @@
+import asyncio
+import time
+from sqlalchemy import delete
+from database.base import Base
+from database.session import engine, AsyncSessionLocal
+from entities.models import NotificationOutbox
+from bot.utils.outbox import OutboxDispatcher, StubBot
+
+MESSAGES = 500
+CHATS = 100
+BURST = 10
+BURST_OTHER_CHATS = 20
+TEST_CHAT_BASE = 9_000_000_000
+
+
+async def run_until(bot: StubBot, done) -> float:
+    dispatcher = OutboxDispatcher(bot, AsyncSessionLocal)
+    dispatcher.poll_interval = 0.1
+    started = time.perf_counter()
+    task = asyncio.create_task(dispatcher.run())
+    while not done():
+        await asyncio.sleep(0.05)
+    elapsed = time.perf_counter() - started
+    task.cancel()
+    return elapsed
+
+
+async def cleanup():
+    async with AsyncSessionLocal() as session:
+        await session.execute(delete(NotificationOutbox).where(NotificationOutbox.chat_id >= TEST_CHAT_BASE))
+        await session.commit()
+
+
+async def main():
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all, tables=[NotificationOutbox.__table__])
+
+    # Сплеск призначень: по кілька замовлень на кожного кур'єра
+    async with AsyncSessionLocal() as session:
+        session.add_all([
+            NotificationOutbox(chat_id=TEST_CHAT_BASE + i % CHATS, text=f"Замовлення #{i}")
+            for i in range(MESSAGES)
+        ])
+        await session.commit()
+
+    bot = StubBot(latency=0.02)
+    elapsed = await run_until(bot, lambda: len(bot.messages) >= MESSAGES)
+    print(f"Відправлено: {len(bot.messages)} за {elapsed:.1f} с ({len(bot.messages) / elapsed:.1f} повідомлень/с)")
+    print(f"Відправок, які Telegram відхилив би з 429: {bot.throttled}")
+    await cleanup()
+
+    # Перепланування: багато повідомлень одному кур'єру, по одному - іншим.
+    # Інші чати не мають чекати, поки відпрацюють інтервали "гарячого" чату
+    async with AsyncSessionLocal() as session:
+        session.add_all([NotificationOutbox(chat_id=TEST_CHAT_BASE, text=f"Перенесено #{i}") for i in range(BURST)])
+        session.add_all([
+            NotificationOutbox(chat_id=TEST_CHAT_BASE + 1 + i, text=f"Замовлення #{i}")
+            for i in range(BURST_OTHER_CHATS)
+        ])
+        await session.commit()
+
+    bot = StubBot(latency=0.02)
+    others = lambda: sum(1 for chat_id, _ in bot.messages if chat_id != TEST_CHAT_BASE)
+    elapsed = await run_until(bot, lambda: others() >= BURST_OTHER_CHATS)
+    burst_sent = len(bot.messages) - others()
+    print(f"{'✅' if elapsed < 2 else '⚠️'} Сплеск в один чат ({BURST}): інші {BURST_OTHER_CHATS} чатів отримали все за {elapsed:.1f} с, "
+          f"з гарячого чату за цей час: {burst_sent}")
+    await cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
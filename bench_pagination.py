@@ -0,0 +1,69 @@
+import asyncio
+import time
+from datetime import datetime, timezone
+import httpx
+from sqlalchemy import delete
+from database.session import AsyncSessionLocal
+from entities.models import City, User, Order
+from bot.utils.security import make_admin_token
+from webapp.main import app
+
+# Обхід GET /api/orders курсором: замовлення вставлені однією транзакцією мають однаковий
+# created_at, тож сторінки розрізняє лише id. Кожне замовлення має трапитись рівно раз
+ORDERS = 1000
+PAGE = 100
+TEST_CHAT_BASE = 9_300_000_000
+
+
+async def main():
+    async with AsyncSessionLocal() as session:
+        # Окреме місто, щоб обхід не залежав від реальних замовлень
+        city = City(name="Bench pagination")
+        session.add(city)
+        await session.flush()
+        courier = User(tg_id=TEST_CHAT_BASE, username="bench_courier", password_hash="-", city_id=city.id)
+        session.add(courier)
+        await session.flush()
+        session.add_all([
+            Order(
+                city_id=city.id, courier_id=courier.id, receiver_id=courier.id,
+                delivery_time=datetime.now(timezone.utc), delivery_address="Bench", products="[]", status="pending"
+            )
+            for _ in range(ORDERS)
+        ])
+        await session.commit()
+        city_id = city.id
+
+    headers = {"X-Admin-Token": make_admin_token(0)}
+    seen: list[int] = []
+    pages = 0
+    cursor = None
+    started = time.perf_counter()
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        while True:
+            params = {"city_id": city_id, "limit": PAGE}
+            if cursor:
+                params["cursor"] = cursor
+            response = await client.get("/api/orders", params=params, headers=headers)
+            assert response.status_code == 200, response.status_code
+            data = response.json()
+            seen.extend(item["id"] for item in data["items"])
+            pages += 1
+            cursor = data["next_cursor"]
+            if not cursor or pages > ORDERS // PAGE + 1:
+                break
+    elapsed = time.perf_counter() - started
+
+    ok = len(seen) == ORDERS and len(set(seen)) == ORDERS and seen == sorted(seen, reverse=True)
+    print(f"Сторінок: {pages}, замовлень: {len(seen)} (унікальних {len(set(seen))}), {elapsed / pages * 1000:.1f} мс на сторінку")
+    print("✅ Кожне замовлення рівно один раз" if ok else "❌ Сторінки повторюються або пропускають замовлення")
+
+    async with AsyncSessionLocal() as session:
+        await session.execute(delete(Order).where(Order.city_id == city_id))
+        await session.execute(delete(User).where(User.city_id == city_id))
+        await session.execute(delete(City).where(City.id == city_id))
+        await session.commit()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,60 @@
+import random
+import time
+from bisect import insort
+from webapp.scheduling import plan_day, overlapping, check_slot, free_slots
+
+# Планувальник слотів на добі міста з десятками тисяч замовлень:
+# перевірка конфлікту при створенні замовлення та масове перепланування дня
+COURIERS = 1000
+ORDERS = 30000
+SLOT = 30 * 60
+DAY = 86400
+
+
+def main():
+    random.seed(1)
+    couriers = list(range(COURIERS))
+    orders = [
+        (order_id, random.randrange(COURIERS), float(random.randrange(0, DAY, 5 * 60)))
+        for order_id in range(ORDERS)
+    ]
+
+    # Бронювання по одному замовленню, як у create_order (з попередженням замість 409)
+    slots: dict[int, list[float]] = {c: [] for c in couriers}
+    overlaps = 0
+    started = time.perf_counter()
+    for order_id, courier_id, start in orders:
+        if check_slot(slots[courier_id], start, SLOT, allow_overlap=True):
+            overlaps += 1
+        insort(slots[courier_id], start)
+    booking = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for order_id, courier_id, start in orders[:5000]:
+        free_slots(slots[courier_id], start, SLOT, 5, 0.0)
+    suggest = (time.perf_counter() - started) / 5000
+
+    started = time.perf_counter()
+    plan, unplaceable = plan_day(orders, couriers, SLOT, DAY)
+    planning = time.perf_counter() - started
+
+    planned: dict[int, list[float]] = {c: [] for c in couriers}
+    for order_id, courier_id, start in plan:
+        insort(planned[courier_id], start)
+    remaining = sum(
+        len(overlapping(planned[c], start, SLOT)) - 1
+        for c in couriers
+        for start in planned[c]
+    ) // 2
+    original = {order_id: (courier_id, start) for order_id, courier_id, start in orders}
+    moved = sum(1 for order_id, courier_id, start in plan if original[order_id] != (courier_id, start))
+
+    print(f"Замовлень: {ORDERS}, кур'єрів: {COURIERS}, слот: {SLOT // 60} хв")
+    print(f"Бронювання з перевіркою конфлікту: {booking / ORDERS * 1e6:.1f} мкс на замовлення, перетинів: {overlaps}")
+    print(f"Пошук вільних слотів: {suggest * 1e6:.1f} мкс")
+    print(f"Перепланування дня: {planning * 1000:.0f} мс, змінено замовлень: {moved}, не розміщено: {len(unplaceable)}")
+    print(f"{'✅' if remaining == 0 else '⚠️'} Перетинів після перепланування: {remaining}")
+
+
+if __name__ == "__main__":
+    main()
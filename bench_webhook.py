@@ -0,0 +1,88 @@
+import asyncio
+import random
+import statistics
+import time
+import httpx
+from configuration.settings import settings
+from bot import webhook
+from bot.utils.update_queue import KeyedUpdateQueue
+
+# Навантаження на webhook синтетичними апдейтами без звернень до Telegram:
+# хендлер замінено на затримку, один "повільний" користувач обробляється в 20 разів довше
+USERS = 200
+UPDATES = 2000
+HANDLER_SEC = 0.01
+SLOW_USER = 1
+SLOW_HANDLER_SEC = 0.2
+
+
+def make_update(update_id: int, user_id: int) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "Load"},
+            "text": f"msg {update_id}"
+        }
+    }
+
+
+async def run(workers: int) -> dict:
+    received_at: dict[int, float] = {}
+    latencies: list[float] = []
+    order: dict[int, list[int]] = {}
+
+    async def fake_handler(update):
+        user_id = update.message.from_user.id
+        await asyncio.sleep(SLOW_HANDLER_SEC if user_id == SLOW_USER else HANDLER_SEC)
+        order.setdefault(user_id, []).append(update.update_id)
+        if user_id != SLOW_USER:
+            latencies.append(time.perf_counter() - received_at[update.update_id])
+
+    webhook.update_queue = KeyedUpdateQueue(fake_handler, workers=workers, max_pending=UPDATES)
+    webhook.update_queue.start()
+
+    # Без WEBHOOK_SECRET webhook відхиляє всі запити - для бенчмарку підставляємо тестовий
+    settings.WEBHOOK_SECRET = settings.WEBHOOK_SECRET or "bench"
+    headers = {"X-Telegram-Bot-Api-Secret-Token": settings.WEBHOOK_SECRET}
+    transport = httpx.ASGITransport(app=webhook.app)
+    started = time.perf_counter()
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for update_id in range(1, UPDATES + 1):
+            user_id = SLOW_USER if update_id % 100 == 0 else random.randint(2, USERS)
+            received_at[update_id] = time.perf_counter()
+            response = await client.post("/webhook", json=make_update(update_id, user_id), headers=headers)
+            assert response.status_code == 200, response.status_code
+    accepted = time.perf_counter() - started
+
+    await webhook.update_queue.join()
+    elapsed = time.perf_counter() - started
+    await webhook.update_queue.stop()
+
+    ordered = all(ids == sorted(ids) for ids in order.values())
+    latencies.sort()
+    return {
+        "accepted": accepted,
+        "elapsed": elapsed,
+        "ordered": ordered,
+        "p50": statistics.median(latencies),
+        "p95": latencies[int(len(latencies) * 0.95)],
+    }
+
+
+async def main():
+    print(f"{UPDATES} апдейтів від {USERS} користувачів, хендлер {HANDLER_SEC * 1000:.0f} мс")
+    for workers in (1, 16, 64):
+        result = await run(workers)
+        print(
+            f"✅ workers={workers:>3}: прийнято за {result['accepted']:.2f} с, "
+            f"оброблено за {result['elapsed']:.2f} с ({UPDATES / result['elapsed']:.0f} апдейтів/с), "
+            f"затримка інших користувачів p50={result['p50'] * 1000:.0f} мс p95={result['p95'] * 1000:.0f} мс, "
+            f"порядок по користувачах {'збережено' if result['ordered'] else 'ПОРУШЕНО'}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,11 +1,10 @@
 import asyncio
+import json
 import logging
-from aiogram import Bot, Dispatcher
-from aiogram.client.default import DefaultBotProperties
-from aiogram.enums import ParseMode
-from configuration.settings import settings
-from bot.routers import admin_cmd, registration
-from database.session import AsyncSessionLocal
+from database.session import engine, AsyncSessionLocal, pool_metrics
+from database.instrumentation import query_registry
+from bot.dispatcher import create_bot, create_dispatcher
+from bot.utils.outbox import OutboxDispatcher
 
 
 async def main():
@@ -14,23 +13,18 @@ async def main():
         format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
     )
     
-    bot = Bot(
-        token=settings.BOT_TOKEN,
-        default=DefaultBotProperties(parse_mode=ParseMode.HTML)
-    )
-    dp = Dispatcher()
-    
-    # Middleware для бази даних
-    @dp.update.middleware()
-    async def db_session_middleware(handler, event, data):
-        async with AsyncSessionLocal() as session:
-            data['session'] = session
-            return await handler(event, data)
-    
-    dp.include_router(admin_cmd.router)
-    dp.include_router(registration.router)
+    bot = create_bot()
+    dp, db_middleware = create_dispatcher()
     
-    await dp.start_polling(bot)
+    # Фонова відправка повідомлень з notification_outbox (лише в одному процесі, див. run_as_leader)
+    outbox_task = asyncio.create_task(OutboxDispatcher(bot, AsyncSessionLocal).run_as_leader(engine))
+    try:
+        await dp.start_polling(bot)
+    finally:
+        outbox_task.cancel()
+        logging.info("DB usage per update: %s", db_middleware.snapshot())
+        logging.info("DB pool: %s", pool_metrics.snapshot())
+        logging.info("DB queries: %s", json.dumps(query_registry.snapshot(), ensure_ascii=False))
 
 
 if __name__ == "__main__":
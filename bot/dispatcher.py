@@ -0,0 +1,31 @@
+from aiogram import Bot, Dispatcher
+from aiogram.client.default import DefaultBotProperties
+from aiogram.enums import ParseMode
+from configuration.settings import settings
+from bot.routers import admin_cmd, registration
+from database.session import AsyncSessionLocal
+from bot.utils.fsm_storage import DatabaseStorage
+from bot.utils.db_session import DbSessionMiddleware, HandlerNameMiddleware
+
+
+def create_bot() -> Bot:
+    return Bot(
+        token=settings.BOT_TOKEN,
+        default=DefaultBotProperties(parse_mode=ParseMode.HTML)
+    )
+
+
+def create_dispatcher() -> tuple[Dispatcher, DbSessionMiddleware]:
+    # Спільне налаштування для polling (python -m bot) та webhook (bot.webhook)
+    # Стани реєстрації зберігаються в БД і переживають перезапуск бота
+    dp = Dispatcher(storage=DatabaseStorage(AsyncSessionLocal))
+    
+    # Middleware для бази даних: сесія відкривається лише коли хендлер звертається до БД
+    db_middleware = DbSessionMiddleware(AsyncSessionLocal)
+    dp.update.middleware(db_middleware)
+    dp.message.middleware(HandlerNameMiddleware())
+    dp.callback_query.middleware(HandlerNameMiddleware())
+    
+    dp.include_router(admin_cmd.router)
+    dp.include_router(registration.router)
+    return dp, db_middleware
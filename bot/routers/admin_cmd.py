@@ -4,7 +4,7 @@ from aiogram.filters import Command
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from entities.models import Admin
-from bot.utils.security import check_password, make_admin_token
+from bot.utils.security import check_password_async, make_admin_token
 from configuration.settings import settings
 
 router = Router(name="admin_cmd_router")
@@ -30,7 +30,7 @@ async def admin_enter(message: Message, session: AsyncSession):
 
     password = parts[1]
 
-    if not check_password(password, adm.password_hash):
+    if not await check_password_async(password, adm.password_hash):
         await message.answer("🚫 Невірний пароль.")
         return
 
@@ -4,13 +4,24 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import Message, ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, text
 from entities.models import User, RegistrationRequest, City
-from bot.utils.security import hash_password
+from bot.utils.security import hash_password_async, check_password_async
+from bot.utils.cache import cache, CITIES_KEY
 
 router = Router()
 
 
+async def get_active_cities(session: AsyncSession) -> list[dict]:
+    async def load():
+        result = await session.execute(
+            select(City.id, City.name).where(City.is_active == True)
+        )
+        return [{"id": c.id, "name": c.name} for c in result.all()]
+    
+    return await cache.get_or_load(CITIES_KEY, load)
+
+
 class RegistrationStates(StatesGroup):
     waiting_for_password = State()
     waiting_for_password_confirm = State()
@@ -69,7 +80,8 @@ async def process_password(message: Message, state: FSMContext):
         await message.answer("❌ Пароль має містити мінімум 6 символів. Спробуйте ще раз:")
         return
     
-    await state.update_data(password=password)
+    # Стан FSM зберігається в БД, тому відкритий пароль туди не пишемо
+    await state.update_data(password_hash=await hash_password_async(password))
     await message.answer("🔐 Повторіть пароль для підтвердження:")
     await state.set_state(RegistrationStates.waiting_for_password_confirm)
 
@@ -85,18 +97,15 @@ async def process_password_confirm(message: Message, state: FSMContext, session:
         pass
     
     data = await state.get_data()
-    password = data.get("password")
+    password_hash = data.get("password_hash")
     
-    if password != password_confirm:
+    if not password_hash or not await check_password_async(password_confirm, password_hash):
         await message.answer("❌ Паролі не співпадають. Введіть пароль ще раз:")
         await state.set_state(RegistrationStates.waiting_for_password)
         return
     
-    # Отримуємо список міст
-    result = await session.execute(
-        select(City).where(City.is_active == True)
-    )
-    cities = result.scalars().all()
+    # Отримуємо список міст (з кешу)
+    cities = await get_active_cities(session)
     
     if not cities:
         await message.answer("❌ На жаль, наразі немає доступних міст. Зверніться до адміністратора.")
@@ -107,7 +116,7 @@ async def process_password_confirm(message: Message, state: FSMContext, session:
     keyboard_buttons = []
     row = []
     for city in cities:
-        row.append(KeyboardButton(text=city.name))
+        row.append(KeyboardButton(text=city["name"]))
         if len(row) == 2:
             keyboard_buttons.append(row)
             row = []
@@ -132,10 +141,8 @@ async def process_city(message: Message, state: FSMContext, session: AsyncSessio
     city_name = message.text
     
     # Перевіряємо чи існує місто
-    result = await session.execute(
-        select(City).where(City.name == city_name, City.is_active == True)
-    )
-    city = result.scalar_one_or_none()
+    cities = await get_active_cities(session)
+    city = next((c for c in cities if c["name"] == city_name), None)
     
     if not city:
         await message.answer("❌ Таке місто не знайдено. Виберіть місто з клавіатури.")
@@ -143,26 +150,34 @@ async def process_city(message: Message, state: FSMContext, session: AsyncSessio
     
     data = await state.get_data()
     username = data.get("username")
-    password = data.get("password")
-    
-    # Хешуємо пароль
-    password_hash = hash_password(password)
+    password_hash = data.get("password_hash")
+    if not password_hash:
+        if not data.get("password"):
+            await message.answer("❌ Сесія реєстрації застаріла. Введіть пароль ще раз:", reply_markup=ReplyKeyboardRemove())
+            await state.set_state(RegistrationStates.waiting_for_password)
+            return
+        # Стан, збережений до переходу на хеш, містить відкритий пароль
+        password_hash = await hash_password_async(data["password"])
     
     # Створюємо заявку на реєстрацію
     registration_request = RegistrationRequest(
         tg_id=message.from_user.id,
         username=username,
         password_hash=password_hash,
-        city_id=city.id,
+        city_id=city["id"],
         status="pending"
     )
     
     session.add(registration_request)
+    if session.bind.dialect.name == "postgresql":
+        # Адмінка слухає цей канал і показує заявку без перезавантаження сторінки;
+        # сповіщення доставляється лише після коміту
+        await session.execute(text("SELECT pg_notify('registration_requests', '')"))
     await session.commit()
     
     await message.answer(
         "✅ <b>Ваша заявка на реєстрацію відправлена!</b>\n\n"
-        f"Місто: <b>{city.name}</b>\n"
+        f"Місто: <b>{city['name']}</b>\n"
         f"Username: <code>@{username}</code>\n\n"
         "⏳ Очікуйте підтвердження адміністратора.",
         reply_markup=ReplyKeyboardRemove()
@@ -0,0 +1,99 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable
+from configuration.settings import settings
+
+CITIES_KEY = "cities:active"
+
+
+def couriers_key(city_id: int) -> str:
+    return f"couriers:{city_id}"
+
+
+class TTLCache:
+    # LRU-кеш з TTL; одночасні промахи по одному ключу чекають на один завантажувач
+    def __init__(self, maxsize: int = 1024, ttl: float = 60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._inflight: dict[Hashable, asyncio.Future] = {}
+        self._generation = 0
+
+    def get(self, key: Hashable) -> tuple[bool, Any]:
+        item = self._data.get(key)
+        if item is None:
+            return False, None
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return False, None
+        self._data.move_to_end(key)
+        return True, value
+
+    def set(self, key: Hashable, value: Any, ttl: float | None = None):
+        self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, *keys: Hashable):
+        # Без аргументів очищає весь кеш
+        self._generation += 1
+        if not keys:
+            self._data.clear()
+            self._inflight.clear()
+            return
+        for key in keys:
+            self._data.pop(key, None)
+            self._inflight.pop(key, None)
+
+    async def get_or_load(self, key: Hashable, loader: Callable[[], Awaitable[Any]], ttl: float | None = None) -> Any:
+        found, value = self.get(key)
+        if found:
+            self.hits += 1
+            return value
+
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self.hits += 1
+            return await asyncio.shield(pending)
+
+        self.misses += 1
+        generation = self._generation
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await loader()
+        except BaseException as e:
+            if not future.done():
+                future.set_exception(e if isinstance(e, Exception) else RuntimeError("Cache loader cancelled"))
+                # Позначаємо виняток як отриманий, якщо ніхто не чекав
+                future.exception()
+            raise
+        finally:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+        # Якщо за час завантаження був invalidate, значення вже застаріле
+        if generation == self._generation:
+            self.set(key, value, ttl)
+        future.set_result(value)
+        return value
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": len(self._data),
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+cache = TTLCache(maxsize=settings.CACHE_MAX_ITEMS, ttl=settings.CACHE_TTL_SEC)
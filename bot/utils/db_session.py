@@ -0,0 +1,78 @@
+from aiogram import BaseMiddleware
+from sqlalchemy.ext.asyncio import AsyncSession
+from database.instrumentation import QueryProfile, current_profile, profile_scope
+
+
+class LazySession:
+    # Заміна AsyncSession для хендлерів: справжня сесія створюється при першому
+    # зверненні (execute, add, commit...), тож апдейти без роботи з БД її не відкривають
+    def __init__(self, session_factory, profile: QueryProfile):
+        self._session_factory = session_factory
+        self._profile = profile
+        self._session: AsyncSession | None = None
+
+    @property
+    def opened(self) -> bool:
+        return self._session is not None
+
+    def _get(self) -> AsyncSession:
+        if self._session is None:
+            self._session = self._session_factory()
+            self._profile.sessions += 1
+        return self._session
+
+    def __getattr__(self, name):
+        return getattr(self._get(), name)
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+class DbSessionMiddleware(BaseMiddleware):
+    # Передає хендлерам lazy-сесію в data['session'] та збирає статистику:
+    # скільки сесій і запитів реально використав кожен апдейт
+    def __init__(self, session_factory):
+        self.session_factory = session_factory
+        self.updates = 0
+        self.sessions = 0
+        self.queries = 0
+        self.max_queries = 0
+
+    async def __call__(self, handler, event, data):
+        with profile_scope(f"bot:{event.event_type}", "update") as profile:
+            session = LazySession(self.session_factory, profile)
+            data['session'] = session
+            try:
+                return await handler(event, data)
+            finally:
+                await session.close()
+                self.record(profile)
+
+    def record(self, profile: QueryProfile):
+        self.updates += 1
+        self.sessions += profile.sessions
+        self.queries += profile.queries
+        self.max_queries = max(self.max_queries, profile.queries)
+
+    def snapshot(self) -> dict:
+        return {
+            "updates": self.updates,
+            "sessions": self.sessions,
+            "queries": self.queries,
+            "max_queries_per_update": self.max_queries,
+            "sessions_per_update": round(self.sessions / self.updates, 3) if self.updates else 0.0,
+            "queries_per_update": round(self.queries / self.updates, 3) if self.updates else 0.0,
+        }
+
+
+class HandlerNameMiddleware(BaseMiddleware):
+    # Внутрішній middleware: підписує профіль апдейту ім'ям хендлера, що його обробив
+    async def __call__(self, handler, event, data):
+        profile = current_profile.get()
+        handler_object = data.get("handler")
+        if profile is not None and handler_object is not None:
+            callback = handler_object.callback
+            profile.name = f"bot:{callback.__module__.rsplit('.', 1)[-1]}.{callback.__name__}"
+        return await handler(event, data)
@@ -0,0 +1,177 @@
+import asyncio
+import contextvars
+import json
+import logging
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Any, Mapping
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, StateType, StorageKey
+from sqlalchemy import select, delete
+from sqlalchemy.dialects import postgresql, sqlite
+from configuration.settings import settings
+from entities.models import FsmState
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CachedState:
+    state: str | None = None
+    data: dict[str, Any] = field(default_factory=dict)
+    dirty: bool = False
+    loaded_at: float = field(default_factory=time.monotonic)
+
+
+class DatabaseStorage(BaseStorage):
+    # FSM-сховище в таблиці fsm_states з кешем у пам'яті.
+    # Зміни пишуться в кеш і скидаються в БД пачкою раз на flush_interval (write-back);
+    # читання йде з кешу, поки запис молодший за cache_ttl, інакше - з БД.
+    # Кеш не синхронізується між процесами: при кількох процесах бота cache_ttl і flush_interval
+    # мають бути 0 (значення за замовчуванням), інакше процеси читають застарілий стан і перезаписують один одного
+    def __init__(
+        self,
+        session_factory,
+        state_ttl: float | None = None,
+        cache_ttl: float | None = None,
+        flush_interval: float | None = None
+    ):
+        self.session_factory = session_factory
+        self.state_ttl = settings.FSM_STATE_TTL_SEC if state_ttl is None else state_ttl
+        self.cache_ttl = settings.FSM_CACHE_TTL_SEC if cache_ttl is None else cache_ttl
+        self.flush_interval = settings.FSM_FLUSH_SEC if flush_interval is None else flush_interval
+        self.key_builder = DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        self.entries: dict[str, CachedState] = {}
+        self.reads = 0
+        self.db_reads = 0
+        self.flushes = 0
+        self._flusher: asyncio.Task | None = None
+        self._last_cleanup = 0.0
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        entry = await self._entry(key)
+        entry.state = state.state if isinstance(state, State) else state
+        entry.dirty = True
+        entry.loaded_at = time.monotonic()
+        await self._schedule_flush()
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        return (await self._entry(key)).state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        entry = await self._entry(key)
+        entry.data = dict(data)
+        entry.dirty = True
+        entry.loaded_at = time.monotonic()
+        await self._schedule_flush()
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        return dict((await self._entry(key)).data)
+
+    async def close(self) -> None:
+        if self._flusher is not None:
+            self._flusher.cancel()
+            self._flusher = None
+        await self.flush()
+
+    async def _entry(self, key: StorageKey) -> CachedState:
+        self.reads += 1
+        db_key = self.key_builder.build(key)
+        entry = self.entries.get(db_key)
+        if entry is not None and (entry.dirty or time.monotonic() - entry.loaded_at < self.cache_ttl):
+            return entry
+
+        self.db_reads += 1
+        async with self.session_factory() as session:
+            row = await session.scalar(select(FsmState).where(FsmState.key == db_key))
+
+        entry = CachedState()
+        if row is not None and not self._expired(row.expires_at):
+            entry.state = row.state
+            entry.data = json.loads(row.data) if row.data else {}
+        self.entries[db_key] = entry
+        return entry
+
+    @staticmethod
+    def _expired(expires_at: datetime | None) -> bool:
+        if expires_at is None:
+            return False
+        if expires_at.tzinfo is None:
+            expires_at = expires_at.replace(tzinfo=timezone.utc)
+        return expires_at <= datetime.now(timezone.utc)
+
+    async def _schedule_flush(self):
+        # flush_interval <= 0 - запис одразу в БД (кілька процесів бота без спільного кешу)
+        if self.flush_interval <= 0:
+            await self.flush()
+            await self.cleanup()
+            return
+        if self._flusher is None or self._flusher.done():
+            # Порожній контекст: інакше задача успадкує ContextVars першого апдейту
+            # і всі подальші запити flush записувалися б у його QueryProfile
+            self._flusher = asyncio.create_task(self._flush_loop(), context=contextvars.Context())
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+                await self.cleanup()
+            except Exception:
+                logger.exception("FSM storage flush failed")
+
+    async def flush(self):
+        dirty = {k: e for k, e in self.entries.items() if e.dirty}
+        if not dirty:
+            return
+        for entry in dirty.values():
+            entry.dirty = False
+
+        now = datetime.now(timezone.utc)
+        expires_at = now + timedelta(seconds=self.state_ttl)
+        to_delete = [k for k, e in dirty.items() if e.state is None and not e.data]
+        to_upsert = [
+            {"key": k, "state": e.state, "data": json.dumps(e.data), "updated_at": now, "expires_at": expires_at}
+            for k, e in dirty.items() if e.state is not None or e.data
+        ]
+
+        try:
+            async with self.session_factory() as session:
+                if to_delete:
+                    await session.execute(delete(FsmState).where(FsmState.key.in_(to_delete)))
+                if to_upsert:
+                    dialect_insert = postgresql.insert if session.bind.dialect.name == "postgresql" else sqlite.insert
+                    stmt = dialect_insert(FsmState)
+                    stmt = stmt.on_conflict_do_update(
+                        index_elements=[FsmState.key],
+                        set_={
+                            "state": stmt.excluded.state,
+                            "data": stmt.excluded.data,
+                            "updated_at": stmt.excluded.updated_at,
+                            "expires_at": stmt.excluded.expires_at,
+                        }
+                    )
+                    await session.execute(stmt, to_upsert)
+                await session.commit()
+        except Exception:
+            # Не втрачаємо зміни: наступний flush спробує ще раз
+            for entry in dirty.values():
+                entry.dirty = True
+            raise
+        self.flushes += 1
+
+    async def cleanup(self):
+        # Раз на хвилину: видалення покинутих станів з БД та старих записів кешу
+        if time.monotonic() - self._last_cleanup < 60:
+            return
+        self._last_cleanup = time.monotonic()
+
+        stale = time.monotonic() - self.cache_ttl
+        for db_key, entry in list(self.entries.items()):
+            if not entry.dirty and entry.loaded_at < stale:
+                del self.entries[db_key]
+
+        async with self.session_factory() as session:
+            await session.execute(delete(FsmState).where(FsmState.expires_at < datetime.now(timezone.utc)))
+            await session.commit()
@@ -0,0 +1,254 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from aiogram.exceptions import TelegramRetryAfter, TelegramForbiddenError, TelegramBadRequest
+from sqlalchemy import select, update, func, literal
+from configuration.settings import settings
+from entities.models import NotificationOutbox
+
+logger = logging.getLogger(__name__)
+
+
+class TelegramRateLimiter:
+    # Глобальний ліміт (повідомлень/с) та мінімальний інтервал між повідомленнями в один чат
+    def __init__(self, global_rate: float, chat_interval: float):
+        self.global_interval = 1.0 / global_rate
+        self.chat_interval = chat_interval
+        self.next_global = 0.0
+        self.next_by_chat: dict[int, float] = {}
+
+    def chat_delay(self, chat_id: int) -> float:
+        return max(0.0, self.next_by_chat.get(chat_id, 0.0) - time.monotonic())
+
+    async def acquire(self, chat_id: int):
+        now = time.monotonic()
+        ready_at = max(self.next_global, self.next_by_chat.get(chat_id, 0.0))
+        if ready_at > now:
+            await asyncio.sleep(ready_at - now)
+            now = time.monotonic()
+        self.next_global = max(now, self.next_global) + self.global_interval
+        self.next_by_chat[chat_id] = now + self.chat_interval
+
+    def pause(self, seconds: float):
+        # Після 429 зупиняємо всі відправки на retry_after
+        self.next_global = max(self.next_global, time.monotonic() + seconds)
+
+    def prune(self):
+        now = time.monotonic()
+        for chat_id, ready_at in list(self.next_by_chat.items()):
+            if ready_at <= now:
+                del self.next_by_chat[chat_id]
+
+
+# Ключ pg_advisory_lock: лише власник лока відправляє повідомлення, тож ліміти
+# TelegramRateLimiter (пам'ять процесу) не множаться на кількість воркерів uvicorn
+OUTBOX_LOCK_ID = 0x6F7574626F78
+
+
+def backoff_delay(attempts: int) -> float:
+    return min(2 ** attempts * 5, 3600)
+
+
+class OutboxDispatcher:
+    # Вичитує notification_outbox пачками та відправляє повідомлення з урахуванням лімітів Telegram.
+    # bot - будь-який об'єкт з async send_message(chat_id, text), наприклад aiogram Bot або StubBot
+    def __init__(self, bot, session_factory, limiter: TelegramRateLimiter | None = None):
+        self.bot = bot
+        self.session_factory = session_factory
+        self.limiter = limiter or TelegramRateLimiter(
+            settings.TELEGRAM_GLOBAL_RATE,
+            settings.TELEGRAM_CHAT_INTERVAL_SEC
+        )
+        self.batch_size = settings.OUTBOX_BATCH_SIZE
+        self.poll_interval = settings.OUTBOX_POLL_SEC
+        self.max_attempts = settings.OUTBOX_MAX_ATTEMPTS
+        self.lease = settings.OUTBOX_LEASE_SEC
+        self.sent = 0
+        self.failed = 0
+
+    async def run(self):
+        while True:
+            try:
+                processed = await self.drain_batch()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Outbox dispatcher error")
+                processed = 0
+            if processed < self.batch_size:
+                self.limiter.prune()
+                await asyncio.sleep(self.poll_interval)
+
+    async def run_as_leader(self, engine, retry_interval: float = 10.0):
+        # Кожен процес бота викликає це при старті; диспетчер працює лише в тому, хто взяв лок.
+        # Лок сесійний і тримається на окремому з'єднанні: якщо процес або з'єднання впаде,
+        # PostgreSQL відпустить лок і його підхопить інший процес
+        if engine.dialect.name != "postgresql":
+            await self.run()
+            return
+        while True:
+            try:
+                async with engine.connect() as conn:
+                    if await conn.scalar(select(func.pg_try_advisory_lock(OUTBOX_LOCK_ID))):
+                        logger.info("Outbox dispatcher: this process is the leader")
+                        await self.run_while_connected(conn, retry_interval)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Outbox leader connection lost")
+            await asyncio.sleep(retry_interval)
+
+    async def run_while_connected(self, conn, check_interval: float):
+        task = asyncio.create_task(self.run())
+        try:
+            while not task.done():
+                await asyncio.sleep(check_interval)
+                # Без живого з'єднання лок уже відпущено - зупиняємось, щоб не слати вдвох
+                await conn.execute(select(literal(1)))
+        finally:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            try:
+                # З'єднання повертається в пул - сесійний лок треба відпустити явно
+                await conn.execute(select(func.pg_advisory_unlock(OUTBOX_LOCK_ID)))
+            except Exception:
+                pass
+
+    async def drain_batch(self) -> int:
+        # Три коротких кроки замість однієї транзакції на всю пачку: рядки не лишаються
+        # заблокованими, поки диспетчер чекає ліміт, паузу після 429 чи відповідь Telegram
+        messages = await self.claim_batch()
+        for message in messages:
+            await self.deliver(message)
+        if messages:
+            await self.record_results(messages)
+        return len(messages)
+
+    async def claim_batch(self) -> list[NotificationOutbox]:
+        # Захоплені рядки переходять у sending з орендою в next_attempt_at: якщо процес
+        # впаде посеред відправки, після закінчення оренди повідомлення забере наступний прохід
+        # З кожного чату береться лише найстаріше повідомлення: інтервал між повідомленнями в чат
+        # інакше відпрацьовувався б всередині пачки, і сплеск в один чат затримував би всі інші
+        now = datetime.now(timezone.utc)
+        due = (
+            select(
+                NotificationOutbox.id,
+                func.row_number().over(
+                    partition_by=NotificationOutbox.chat_id, order_by=NotificationOutbox.id
+                ).label("position")
+            )
+            .where(
+                NotificationOutbox.status.in_(("pending", "sending")),
+                NotificationOutbox.next_attempt_at <= now
+            )
+            .subquery()
+        )
+        async with self.session_factory() as session:
+            result = await session.execute(
+                select(NotificationOutbox)
+                .where(NotificationOutbox.id.in_(select(due.c.id).where(due.c.position == 1)))
+                .order_by(NotificationOutbox.id)
+                .limit(self.batch_size)
+                .with_for_update(skip_locked=True)
+            )
+            messages = result.scalars().all()
+
+            claimed = []
+            for message in messages:
+                delay = self.limiter.chat_delay(message.chat_id)
+                if delay > 0:
+                    # Чат ще "гарячий" - відкладаємо, щоб не блокувати інші чати
+                    message.status = "pending"
+                    message.next_attempt_at = now + timedelta(seconds=delay)
+                    continue
+                message.status = "sending"
+                message.next_attempt_at = now + timedelta(seconds=self.lease)
+                claimed.append(message)
+
+            await session.commit()
+            session.expunge_all()
+        return claimed
+
+    async def record_results(self, messages: list[NotificationOutbox]):
+        # Один executemany по первинному ключу; status у WHERE не дає перезаписати рядок,
+        # оренду якого вже перехопив інший процес
+        async with self.session_factory() as session:
+            await session.execute(
+                update(NotificationOutbox).where(NotificationOutbox.status == "sending"),
+                [
+                    {
+                        "id": m.id,
+                        "status": m.status,
+                        "attempts": m.attempts,
+                        "last_error": m.last_error,
+                        "next_attempt_at": m.next_attempt_at,
+                        "sent_at": m.sent_at,
+                    }
+                    for m in messages
+                ],
+                execution_options={"synchronize_session": False}
+            )
+            await session.commit()
+
+    async def deliver(self, message: NotificationOutbox):
+        await self.limiter.acquire(message.chat_id)
+        try:
+            await self.bot.send_message(chat_id=message.chat_id, text=message.text)
+        except TelegramRetryAfter as e:
+            self.limiter.pause(e.retry_after)
+            message.status = "pending"
+            message.next_attempt_at = datetime.now(timezone.utc) + timedelta(seconds=e.retry_after)
+            message.last_error = str(e)
+            return
+        except (TelegramForbiddenError, TelegramBadRequest) as e:
+            # Бот заблокований або чат не існує - повтор не допоможе
+            self.mark_failed(message, str(e))
+            return
+        except Exception as e:
+            message.attempts += 1
+            message.last_error = str(e)
+            if message.attempts >= self.max_attempts:
+                self.mark_failed(message, str(e))
+            else:
+                message.status = "pending"
+                message.next_attempt_at = datetime.now(timezone.utc) + timedelta(seconds=backoff_delay(message.attempts))
+            return
+
+        message.status = "sent"
+        message.sent_at = datetime.now(timezone.utc)
+        message.attempts += 1
+        self.sent += 1
+
+    def mark_failed(self, message: NotificationOutbox, error: str):
+        message.status = "failed"
+        message.last_error = error
+        self.failed += 1
+        logger.warning("Outbox message %s failed: %s", message.id, error)
+
+
+class StubBot:
+    # Заміна aiogram Bot для тестів та навантаження: запам'ятовує повідомлення
+    # і рахує відправки, які Telegram відхилив би з 429
+    def __init__(self, global_rate: float = 30.0, chat_interval: float = 1.0, latency: float = 0.0):
+        self.global_rate = global_rate
+        self.chat_interval = chat_interval
+        self.latency = latency
+        self.messages: list[tuple[int, str]] = []
+        self.throttled = 0
+        self._recent: deque[float] = deque()
+        self._last_by_chat: dict[int, float] = {}
+
+    async def send_message(self, chat_id: int, text: str, **kwargs):
+        now = time.monotonic()
+        while self._recent and now - self._recent[0] > 1.0:
+            self._recent.popleft()
+        last = self._last_by_chat.get(chat_id)
+        if len(self._recent) >= self.global_rate or (last is not None and now - last < self.chat_interval):
+            self.throttled += 1
+        self._recent.append(now)
+        self._last_by_chat[chat_id] = now
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.messages.append((chat_id, text))
@@ -1,14 +1,30 @@
+import asyncio
 import bcrypt
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 import jwt
 from configuration.settings import settings
 
+# bcrypt відпускає GIL, тому окремого пулу потоків достатньо, щоб не блокувати event loop
+_bcrypt_executor = ThreadPoolExecutor(
+    max_workers=settings.BCRYPT_MAX_WORKERS,
+    thread_name_prefix="bcrypt"
+)
+
 def hash_password(p: str) -> str:
     return bcrypt.hashpw(p.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
 
 def check_password(p: str, h: str) -> bool:
     return bcrypt.checkpw(p.encode("utf-8"), h.encode("utf-8"))
 
+async def hash_password_async(p: str) -> str:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_bcrypt_executor, hash_password, p)
+
+async def check_password_async(p: str, h: str) -> bool:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_bcrypt_executor, check_password, p, h)
+
 def make_admin_token(tg_id: int) -> str:
     exp_min = int(getattr(settings, "ADMIN_JWT_EXPIRES_MIN", 120))
     payload = {"tg_id": tg_id, "exp": datetime.now(timezone.utc) + timedelta(minutes=exp_min)}
@@ -0,0 +1,111 @@
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Awaitable, Callable, Hashable
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFull(Exception):
+    pass
+
+
+def update_owner(update) -> Hashable:
+    # Ключ впорядкування: користувач (або чат), інакше сам апдейт
+    event = update.event
+    user = getattr(event, "from_user", None)
+    if user is not None:
+        return ("user", user.id)
+    chat = getattr(event, "chat", None)
+    if chat is not None:
+        return ("chat", chat.id)
+    return ("update", update.update_id)
+
+
+class KeyedUpdateQueue:
+    # Обмежена черга апдейтів з пулом воркерів.
+    # Апдейти одного ключа (користувача) обробляються строго по черзі,
+    # різні ключі - паралельно, тому повільний хендлер блокує лише свого користувача
+    def __init__(
+        self,
+        handler: Callable[[Any], Awaitable[Any]],
+        workers: int = 16,
+        max_pending: int = 1000,
+        key_func: Callable[[Any], Hashable] = update_owner
+    ):
+        self.handler = handler
+        self.workers = workers
+        self.max_pending = max_pending
+        self.key_func = key_func
+        self.pending: dict[Hashable, deque] = {}
+        self.ready: asyncio.Queue = asyncio.Queue()
+        self.size = 0
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+        self._tasks: list[asyncio.Task] = []
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self, drain: bool = True):
+        if drain:
+            await self.join()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def put(self, update):
+        if self.size >= self.max_pending:
+            self.rejected += 1
+            raise QueueFull()
+        key = self.key_func(update)
+        self.size += 1
+        self._idle.clear()
+        queue = self.pending.get(key)
+        if queue is not None:
+            # Ключ вже в роботі або в черзі готових - воркер підхопить після попереднього
+            queue.append(update)
+            return
+        self.pending[key] = deque([update])
+        self.ready.put_nowait(key)
+
+    async def join(self):
+        await self._idle.wait()
+
+    async def _worker(self):
+        while True:
+            key = await self.ready.get()
+            queue = self.pending[key]
+            update = queue.popleft()
+            try:
+                await self.handler(update)
+                self.processed += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                self.failed += 1
+                logger.exception("Update processing failed")
+            finally:
+                self.size -= 1
+                if queue:
+                    self.ready.put_nowait(key)
+                else:
+                    del self.pending[key]
+                if self.size == 0:
+                    self._idle.set()
+
+    def stats(self) -> dict:
+        return {
+            "pending": self.size,
+            "active_keys": len(self.pending),
+            "processed": self.processed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+        }
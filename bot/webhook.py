@@ -0,0 +1,96 @@
+import asyncio
+import logging
+import secrets
+from contextlib import asynccontextmanager
+from aiogram.types import Update
+from fastapi import FastAPI, Request, Response, HTTPException
+from configuration.settings import settings
+from database.session import engine, AsyncSessionLocal, pool_metrics
+from database.instrumentation import query_registry
+from bot.dispatcher import create_bot, create_dispatcher
+from bot.utils.outbox import OutboxDispatcher
+from bot.utils.update_queue import KeyedUpdateQueue, QueueFull
+
+# Webhook-режим бота: uvicorn bot.webhook:app (один процес)
+# Апдейт лише кладеться в чергу, відповідь Telegram повертається одразу;
+# обробка йде пулом корутин із збереженням порядку в межах одного користувача.
+# Порядок тримає KeyedUpdateQueue у пам'яті процесу, тому кількох воркерів uvicorn
+# бути не повинно: апдейти одного користувача потрапили б у різні процеси
+
+logger = logging.getLogger(__name__)
+
+bot = create_bot()
+dp, db_middleware = create_dispatcher()
+
+
+async def process_update(update: Update):
+    await dp.feed_update(bot, update)
+
+
+update_queue = KeyedUpdateQueue(
+    process_update,
+    workers=settings.UPDATE_WORKERS,
+    max_pending=settings.UPDATE_QUEUE_SIZE
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if settings.WEBHOOK_URL and not settings.WEBHOOK_SECRET:
+        # Без секрету /webhook приймав би апдейти від будь-кого
+        raise RuntimeError("WEBHOOK_SECRET is required when WEBHOOK_URL is set")
+    update_queue.start()
+    # Диспетчер outbox запускається в кожному воркері, але відправляє лише лідер (advisory lock)
+    outbox_task = asyncio.create_task(OutboxDispatcher(bot, AsyncSessionLocal).run_as_leader(engine))
+    if settings.WEBHOOK_URL:
+        # max_connections=1 (за замовчуванням): Telegram шле наступний апдейт після відповіді
+        # на попередній, тож черга отримує апдейти користувача в порядку їх появи
+        await bot.set_webhook(
+            str(settings.WEBHOOK_URL),
+            secret_token=settings.WEBHOOK_SECRET,
+            allowed_updates=dp.resolve_used_update_types(),
+            max_connections=settings.WEBHOOK_MAX_CONNECTIONS
+        )
+    try:
+        yield
+    finally:
+        outbox_task.cancel()
+        await update_queue.stop()
+        await dp.storage.close()
+        await bot.session.close()
+        logger.info("DB usage per update: %s", db_middleware.snapshot())
+        logger.info("DB pool: %s", pool_metrics.snapshot())
+
+
+app = FastAPI(title="Vapeshop Bot Webhook", lifespan=lifespan)
+
+
+def check_secret(request: Request):
+    # Без WEBHOOK_SECRET ендпоінти закриті: інакше апдейти та статистику отримував би будь-хто
+    if not settings.WEBHOOK_SECRET:
+        raise HTTPException(status_code=403, detail="WEBHOOK_SECRET is not configured")
+    received = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+    if not secrets.compare_digest(received, settings.WEBHOOK_SECRET):
+        raise HTTPException(status_code=403, detail="Invalid secret token")
+
+
+@app.post("/webhook")
+async def telegram_webhook(request: Request):
+    check_secret(request)
+    try:
+        update = Update.model_validate(await request.json(), context={"bot": bot})
+    except ValueError:
+        # Некоректний JSON або не апдейт Telegram (ValidationError - підклас ValueError)
+        raise HTTPException(status_code=400, detail="Invalid update")
+    try:
+        update_queue.put(update)
+    except QueueFull:
+        # Telegram повторить доставку пізніше
+        return Response(status_code=503)
+    return Response(status_code=200)
+
+
+@app.get("/webhook/stats")
+async def webhook_stats(request: Request):
+    check_secret(request)
+    return {"queue": update_queue.stats(), "db": db_middleware.snapshot(), "pool": pool_metrics.snapshot(), "queries": query_registry.snapshot()}
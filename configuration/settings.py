@@ -4,10 +4,50 @@ from pydantic import AnyUrl, AnyHttpUrl
 class Settings(BaseSettings):
     BOT_TOKEN: str
     DB_URL: AnyUrl | str
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30.0
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    DB_STATEMENT_CACHE_SIZE: int = 100
+    SLOW_QUERY_MS: float = 200.0
+    N_PLUS_ONE_THRESHOLD: int = 10
+    QUERY_LOG_TOP: int = 20
 
     ADMIN_PANEL_URL: AnyHttpUrl
     ADMIN_JWT_SECRET: str
     ADMIN_JWT_EXPIRES_MIN: int = 120
+    AUTH_CACHE_SIZE: int = 1024
+    METRICS_TOKEN: str | None = None
+
+    BCRYPT_MAX_WORKERS: int = 4
+
+    CACHE_TTL_SEC: float = 60.0
+    CACHE_MAX_ITEMS: int = 1024
+
+    FSM_STATE_TTL_SEC: float = 86400.0
+    # 0 - без кешу: безпечно для кількох процесів бота. Кеш і відкладений запис - лише для одного процесу
+    FSM_CACHE_TTL_SEC: float = 0.0
+    FSM_FLUSH_SEC: float = 0.0
+
+    WEBHOOK_URL: AnyHttpUrl | None = None
+    WEBHOOK_SECRET: str | None = None
+    WEBHOOK_MAX_CONNECTIONS: int = 1
+    UPDATE_WORKERS: int = 16
+    UPDATE_QUEUE_SIZE: int = 1000
+
+    EVENTS_POLL_SEC: float = 2.0
+
+    DISPATCH_SLOT_MINUTES: int = 60
+    DISPATCH_RECENT_DAYS: int = 7
+    DISPATCH_INDEX_TTL_SEC: float = 600.0
+
+    OUTBOX_BATCH_SIZE: int = 50
+    OUTBOX_POLL_SEC: float = 1.0
+    OUTBOX_MAX_ATTEMPTS: int = 8
+    OUTBOX_LEASE_SEC: float = 300.0
+    TELEGRAM_GLOBAL_RATE: float = 25.0
+    TELEGRAM_CHAT_INTERVAL_SEC: float = 1.0
 
     model_config = SettingsConfigDict(
         env_file=".env",
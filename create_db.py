@@ -1,11 +1,15 @@
 import asyncio
+from sqlalchemy import text
 from database.base import Base
 from database.session import engine
-from entities.models import Admin, City, Product, User, RegistrationRequest, Order  # Імпортуємо моделі!
+from entities.models import Admin, City, Product, User, RegistrationRequest, Order, OrderItem, StockMovement, SalesDailyRollup, Expense, NotificationOutbox, FsmState  # Імпортуємо моделі!
 
 
 async def create_tables():
     async with engine.begin() as conn:
+        if conn.dialect.name == "postgresql":
+            # Потрібно для триграмних індексів пошуку товарів
+            await conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
         await conn.run_sync(Base.metadata.create_all)
     print("✅ Таблиці створено успішно!")
 
@@ -0,0 +1,156 @@
+import heapq
+import json
+import logging
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from configuration.settings import settings
+
+logger = logging.getLogger("db.queries")
+
+
+@dataclass
+class QueryProfile:
+    # Запити одного HTTP-запиту адмінки або одного апдейту бота
+    name: str
+    kind: str
+    sessions: int = 0
+    queries: int = 0
+    db_time: float = 0.0
+    statements: Counter = field(default_factory=Counter)
+    started_at: float = field(default_factory=time.perf_counter)
+
+
+@dataclass
+class NameStats:
+    calls: int = 0
+    queries: int = 0
+    db_time: float = 0.0
+    max_queries: int = 0
+    n_plus_one: int = 0
+
+
+# Профіль поточного запиту/апдейту; події рушія SQLAlchemy виконуються в тому ж контексті
+current_profile: ContextVar[QueryProfile | None] = ContextVar("current_query_profile", default=None)
+
+
+def short_sql(statement: str, limit: int = 500) -> str:
+    statement = " ".join(statement.split())
+    return statement if len(statement) <= limit else statement[:limit] + "..."
+
+
+class QueryRegistry:
+    def __init__(self, slow_query_ms: float, n_plus_one_threshold: int, top: int):
+        self.slow_query_sec = slow_query_ms / 1000
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self.top = top
+        self.by_name: dict[str, NameStats] = {}
+        self.total_queries = 0
+        self.total_db_time = 0.0
+        self.slowest: list[tuple[float, str, str]] = []  # min-heap (тривалість, ім'я, SQL)
+        self.slow_log: deque = deque(maxlen=top)
+        self.n_plus_one_log: deque = deque(maxlen=top)
+
+    def record_query(self, statement: str, duration: float, profile: QueryProfile | None):
+        self.total_queries += 1
+        self.total_db_time += duration
+        name = profile.name if profile is not None else "background"
+        if profile is not None:
+            profile.queries += 1
+            profile.db_time += duration
+            profile.statements[statement] += 1
+
+        if len(self.slowest) < self.top:
+            heapq.heappush(self.slowest, (duration, name, statement))
+        elif duration > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, (duration, name, statement))
+
+        if duration >= self.slow_query_sec:
+            entry = {"event": "slow_query", "name": name, "ms": round(duration * 1000, 2), "sql": short_sql(statement)}
+            self.slow_log.append(entry)
+            logger.warning(json.dumps(entry, ensure_ascii=False))
+
+    def finish(self, profile: QueryProfile):
+        stats = self.by_name.setdefault(profile.name, NameStats())
+        stats.calls += 1
+        stats.queries += profile.queries
+        stats.db_time += profile.db_time
+        stats.max_queries = max(stats.max_queries, profile.queries)
+
+        for statement, count in profile.statements.items():
+            if count > self.n_plus_one_threshold:
+                # Один і той самий запит багато разів за запит/апдейт - ймовірно N+1
+                stats.n_plus_one += 1
+                entry = {"event": "n_plus_one", "name": profile.name, "count": count, "sql": short_sql(statement)}
+                self.n_plus_one_log.append(entry)
+                logger.warning(json.dumps(entry, ensure_ascii=False))
+
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(json.dumps({
+                "event": profile.kind,
+                "name": profile.name,
+                "sessions": profile.sessions,
+                "queries": profile.queries,
+                "db_ms": round(profile.db_time * 1000, 2),
+                "total_ms": round((time.perf_counter() - profile.started_at) * 1000, 2)
+            }, ensure_ascii=False))
+
+    def snapshot(self) -> dict:
+        return {
+            "total_queries": self.total_queries,
+            "total_db_ms": round(self.total_db_time * 1000, 2),
+            "by_name": {
+                name: {
+                    "calls": s.calls,
+                    "queries": s.queries,
+                    "avg_queries": round(s.queries / s.calls, 2),
+                    "max_queries": s.max_queries,
+                    "db_ms": round(s.db_time * 1000, 2),
+                    "avg_db_ms": round(s.db_time / s.calls * 1000, 3),
+                    "n_plus_one": s.n_plus_one,
+                }
+                for name, s in sorted(self.by_name.items(), key=lambda item: item[1].db_time, reverse=True)
+            },
+            "slowest": [
+                {"name": name, "ms": round(duration * 1000, 2), "sql": short_sql(statement)}
+                for duration, name, statement in sorted(self.slowest, reverse=True)
+            ],
+            "slow_queries": list(self.slow_log),
+            "n_plus_one": list(self.n_plus_one_log),
+        }
+
+
+query_registry = QueryRegistry(settings.SLOW_QUERY_MS, settings.N_PLUS_ONE_THRESHOLD, settings.QUERY_LOG_TOP)
+
+
+@contextmanager
+def profile_scope(name: str, kind: str):
+    profile = QueryProfile(name=name, kind=kind)
+    token = current_profile.set(profile)
+    try:
+        yield profile
+    finally:
+        current_profile.reset(token)
+        query_registry.finish(profile)
+
+
+def instrument_engine(engine: AsyncEngine):
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_started"].pop()
+        query_registry.record_query(statement, time.perf_counter() - started, current_profile.get())
+
+    @event.listens_for(sync_engine, "handle_error")
+    def handle_error(context):
+        if context.connection is not None and context.connection.info.get("query_started"):
+            context.connection.info["query_started"].pop()
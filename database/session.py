@@ -1,8 +1,122 @@
+import time
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from configuration.settings import settings
+from database.instrumentation import instrument_engine
+
+# Межі гістограми очікування з'єднання, секунди
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+
+class PoolMetrics:
+    def __init__(self):
+        self.pool = None
+        self.checkouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.wait_buckets = [0] * (len(WAIT_BUCKETS) + 1)
+        self.overflow_events = 0
+        self.timeouts = 0
+        self.connects = 0
+        self.open_connections = 0
+        self.invalidations = 0
+
+    def record_wait(self, seconds: float):
+        self.checkouts += 1
+        self.wait_total += seconds
+        self.wait_max = max(self.wait_max, seconds)
+        for i, bound in enumerate(WAIT_BUCKETS):
+            if seconds <= bound:
+                self.wait_buckets[i] += 1
+                return
+        self.wait_buckets[-1] += 1
+
+    def snapshot(self) -> dict:
+        pool = self.pool
+        return {
+            "pool_size": pool.size() if pool is not None else 0,
+            "checked_out": pool.checkedout() if pool is not None else 0,
+            "idle": pool.checkedin() if pool is not None else 0,
+            "overflow": max(pool.overflow(), 0) if pool is not None else 0,
+            "checkouts": self.checkouts,
+            "wait_avg_ms": round(self.wait_total / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+            "wait_max_ms": round(self.wait_max * 1000, 3),
+            "wait_buckets": {
+                **{f"le_{bound}": count for bound, count in zip(WAIT_BUCKETS, self.wait_buckets)},
+                "le_inf": self.wait_buckets[-1]
+            },
+            "overflow_events": self.overflow_events,
+            "timeouts": self.timeouts,
+            "connects": self.connects,
+            "open_connections": self.open_connections,
+            "invalidations": self.invalidations,
+        }
+
+
+pool_metrics = PoolMetrics()
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    # QueuePool, що міряє час очікування вільного з'єднання
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            pool_metrics.timeouts += 1
+            raise
+        pool_metrics.record_wait(time.perf_counter() - started)
+        return connection
+
+
+def engine_options(db_url: str) -> dict:
+    if db_url.startswith("sqlite") and ":memory:" in db_url:
+        return {}
+    options = {
+        "poolclass": InstrumentedPool,
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+    }
+    if db_url.startswith("postgresql+asyncpg"):
+        # Кеш підготовлених запитів asyncpg; 0 - для PgBouncer у режимі transaction
+        options["connect_args"] = {"statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE}
+    return options
+
+
+engine = create_async_engine(str(settings.DB_URL), echo=False, **engine_options(str(settings.DB_URL)))
+pool_metrics.pool = engine.sync_engine.pool
+instrument_engine(engine)
+
+
+@event.listens_for(engine.sync_engine, "connect")
+def on_connect(dbapi_connection, connection_record):
+    pool_metrics.connects += 1
+    pool_metrics.open_connections += 1
+    # Нове з'єднання понад pool_size - пул переповнений
+    if isinstance(pool_metrics.pool, InstrumentedPool) and pool_metrics.open_connections > pool_metrics.pool.size():
+        pool_metrics.overflow_events += 1
+
+
+@event.listens_for(engine.sync_engine, "close")
+def on_close(dbapi_connection, connection_record):
+    pool_metrics.open_connections -= 1
+
+
+@event.listens_for(engine.sync_engine, "close_detached")
+def on_close_detached(dbapi_connection):
+    pool_metrics.open_connections -= 1
+
+
+@event.listens_for(engine.sync_engine, "invalidate")
+def on_invalidate(dbapi_connection, connection_record, exception):
+    pool_metrics.invalidations += 1
 
-engine = create_async_engine(str(settings.DB_URL), echo=False)
 
 AsyncSessionLocal = sessionmaker(
     engine, class_=AsyncSession, expire_on_commit=False
@@ -1,5 +1,5 @@
-from datetime import datetime
-from sqlalchemy import BigInteger, String, Boolean, DateTime, Text, func, Integer, Float, ForeignKey
+from datetime import date, datetime
+from sqlalchemy import BigInteger, String, Boolean, Date, DateTime, Text, func, text, Integer, Float, ForeignKey, Index, UniqueConstraint
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from database.base import Base
 
@@ -31,12 +31,23 @@ class City(Base):
         server_default=func.now(),
         nullable=True
     )
+    # Лічильники змін для ETag: збільшуються при кожному записі товарів/замовлень міста
+    products_version: Mapped[int] = mapped_column(Integer, default=1, server_default="1")
+    orders_version: Mapped[int] = mapped_column(Integer, default=1, server_default="1")
 
     products: Mapped[list["Product"]] = relationship(back_populates="city")
 
 
 class Product(Base):
     __tablename__ = "products"
+    __table_args__ = (
+        # Ключ для upsert при масовому імпорті прайсу міста
+        UniqueConstraint("city_id", "code", name="uq_products_city_id_code"),
+        # Триграмні індекси для пошуку (потрібне розширення pg_trgm)
+        Index("ix_products_name_trgm", "name", postgresql_using="gin", postgresql_ops={"name": "gin_trgm_ops"}),
+        Index("ix_products_code_trgm", "code", postgresql_using="gin", postgresql_ops={"code": "gin_trgm_ops"}),
+        Index("ix_products_flavor_trgm", "flavor", postgresql_using="gin", postgresql_ops={"flavor": "gin_trgm_ops"}),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
     code: Mapped[str] = mapped_column(String(50), index=True)
@@ -48,6 +59,8 @@ class Product(Base):
     sold_quantity: Mapped[int] = mapped_column(Integer, default=0)
     avg_sale_price: Mapped[float | None] = mapped_column(Float, nullable=True)
     stock: Mapped[int] = mapped_column(Integer, default=0)
+    # Версія рядка для оптимістичного блокування при редагуванні
+    version: Mapped[int] = mapped_column(Integer, default=1, server_default="1")
     
     city_id: Mapped[int] = mapped_column(ForeignKey("cities.id"), index=True)
     city: Mapped["City"] = relationship(back_populates="products")
@@ -61,6 +74,12 @@ class Product(Base):
 
 class User(Base):
     __tablename__ = "users"
+    __table_args__ = (
+        # Лічильники користувачів по містах (GROUP BY city_id, is_active) читаються лише з індексу
+        Index("ix_users_city_id_is_active", "city_id", "is_active"),
+        # Пошук по username через ILIKE (потрібне розширення pg_trgm)
+        Index("ix_users_username_trgm", "username", postgresql_using="gin", postgresql_ops={"username": "gin_trgm_ops"}),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
     tg_id: Mapped[int] = mapped_column(BigInteger, unique=True, index=True)
@@ -78,6 +97,15 @@ class User(Base):
 
 class RegistrationRequest(Base):
     __tablename__ = "registration_requests"
+    __table_args__ = (
+        # Частковий індекс під чергу заявок: у ньому лише pending, тому він маленький
+        Index(
+            "ix_registration_requests_pending_created_at",
+            "created_at", "id",
+            postgresql_where=text("status = 'pending'"),
+            sqlite_where=text("status = 'pending'")
+        ),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
     tg_id: Mapped[int] = mapped_column(BigInteger, index=True)
@@ -95,6 +123,13 @@ class RegistrationRequest(Base):
 
 class Order(Base):
     __tablename__ = "orders"
+    __table_args__ = (
+        # Під keyset-пагінацію списку замовлень по місту
+        Index("ix_orders_city_id_created_at_id", "city_id", "created_at", "id"),
+        Index("ix_orders_created_at_id", "created_at", "id"),
+        # Виписки та підсумки продажів рахують доставлені замовлення по дню доставки
+        Index("ix_orders_status_delivered_at", "status", "delivered_at"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
     city_id: Mapped[int] = mapped_column(ForeignKey("cities.id"), index=True)
@@ -105,10 +140,119 @@ class Order(Base):
     receiver: Mapped["User"] = relationship(foreign_keys=[receiver_id])
     delivery_time: Mapped[datetime] = mapped_column(DateTime(timezone=True))
     delivery_address: Mapped[str] = mapped_column(Text)
-    products: Mapped[str] = mapped_column(Text)  # JSON string
+    products: Mapped[str] = mapped_column(Text)  # JSON string (застаріле, дублює order_items)
+    items: Mapped[list["OrderItem"]] = relationship(back_populates="order", cascade="all, delete-orphan")
     status: Mapped[str] = mapped_column(String(50), default="pending")  # pending, delivered, cancelled
+    # Фактичний час доставки (зміни статусу на delivered); delivery_time - лише запланований слот
+    delivered_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
     created_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True),
         server_default=func.now(),
         nullable=True
     )
+
+
+class OrderItem(Base):
+    __tablename__ = "order_items"
+    __table_args__ = (
+        # Агрегація продажів по товару без звернення до таблиці
+        Index("ix_order_items_product_id_order_id", "product_id", "order_id", "quantity", "unit_price"),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    order_id: Mapped[int] = mapped_column(ForeignKey("orders.id", ondelete="CASCADE"), index=True)
+    order: Mapped["Order"] = relationship(back_populates="items")
+    product_id: Mapped[int] = mapped_column(ForeignKey("products.id"))
+    product: Mapped["Product"] = relationship()
+    quantity: Mapped[int] = mapped_column(Integer)
+    unit_price: Mapped[float] = mapped_column(Float)
+
+
+class StockMovement(Base):
+    __tablename__ = "stock_movements"
+    __table_args__ = (
+        Index("ix_stock_movements_product_id_created_at", "product_id", "created_at"),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    product_id: Mapped[int] = mapped_column(ForeignKey("products.id", ondelete="CASCADE"))
+    order_id: Mapped[int | None] = mapped_column(ForeignKey("orders.id", ondelete="SET NULL"), index=True, nullable=True)
+    quantity: Mapped[int] = mapped_column(Integer)  # >0 надходження, <0 списання
+    reason: Mapped[str] = mapped_column(String(50))  # purchase, reserve, release, adjust
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+        nullable=True
+    )
+
+
+class SalesDailyRollup(Base):
+    __tablename__ = "sales_daily_rollups"
+    __table_args__ = (
+        UniqueConstraint("day", "city_id", "courier_id", "product_id", name="uq_sales_daily_rollups_key"),
+        Index("ix_sales_daily_rollups_city_id_day", "city_id", "day"),
+    )
+
+    # Денні підсумки доставлених замовлень; оновлюються при зміні статусу замовлення
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    day: Mapped[date] = mapped_column(Date, index=True)
+    city_id: Mapped[int] = mapped_column(ForeignKey("cities.id"))
+    courier_id: Mapped[int] = mapped_column(ForeignKey("users.id"), index=True)
+    product_id: Mapped[int] = mapped_column(ForeignKey("products.id", ondelete="CASCADE"), index=True)
+    quantity: Mapped[int] = mapped_column(Integer, default=0)
+    revenue: Mapped[float] = mapped_column(Float, default=0)
+    cost: Mapped[float] = mapped_column(Float, default=0)
+
+
+class Expense(Base):
+    __tablename__ = "expenses"
+    __table_args__ = (
+        Index("ix_expenses_city_id_spent_at", "city_id", "spent_at"),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    city_id: Mapped[int] = mapped_column(ForeignKey("cities.id"))
+    city: Mapped["City"] = relationship()
+    category: Mapped[str] = mapped_column(String(100))  # rent, salary, delivery, ...
+    amount: Mapped[float] = mapped_column(Float)
+    description: Mapped[str | None] = mapped_column(Text, nullable=True)
+    spent_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), index=True)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+        nullable=True
+    )
+
+
+class NotificationOutbox(Base):
+    __tablename__ = "notification_outbox"
+    __table_args__ = (
+        # Диспетчер вибирає pending-повідомлення, яким настав час відправки
+        Index("ix_notification_outbox_status_next_attempt_at", "status", "next_attempt_at"),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    chat_id: Mapped[int] = mapped_column(BigInteger)
+    text: Mapped[str] = mapped_column(Text)
+    order_id: Mapped[int | None] = mapped_column(ForeignKey("orders.id", ondelete="SET NULL"), nullable=True)
+    status: Mapped[str] = mapped_column(String(50), default="pending")  # pending, sending, sent, failed
+    attempts: Mapped[int] = mapped_column(Integer, default=0)
+    last_error: Mapped[str | None] = mapped_column(Text, nullable=True)
+    next_attempt_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    sent_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+        nullable=True
+    )
+
+
+class FsmState(Base):
+    __tablename__ = "fsm_states"
+
+    # Ключ aiogram StorageKey: bot_id:chat_id:user_id[:thread_id]:destiny
+    key: Mapped[str] = mapped_column(String(255), primary_key=True)
+    state: Mapped[str | None] = mapped_column(String(255), nullable=True)
+    data: Mapped[str] = mapped_column(Text, default="{}")  # JSON string
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True))
+    expires_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), index=True, nullable=True)
@@ -0,0 +1,31 @@
+import asyncio
+from sqlalchemy import text, update
+from database.session import engine, AsyncSessionLocal
+from entities.models import Order
+
+
+async def migrate_delivered_at():
+    # Колонка та індекс для виписок по фактичному часу доставки
+    async with engine.begin() as conn:
+        if conn.dialect.name == "postgresql":
+            await conn.execute(text("ALTER TABLE orders ADD COLUMN IF NOT EXISTS delivered_at TIMESTAMPTZ"))
+            await conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_orders_status_delivered_at ON orders (status, delivered_at)"
+            ))
+
+    # Для вже доставлених замовлень фактичний час невідомий - беремо запланований слот
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(
+            update(Order)
+            .where(Order.status == "delivered", Order.delivered_at.is_(None))
+            .values(delivered_at=Order.delivery_time)
+            .execution_options(synchronize_session=False)
+        )
+        await session.commit()
+
+    print(f"✅ delivered_at заповнено для {result.rowcount} замовлень")
+    print("⚠️ Після міграції перерахуйте підсумки: python rebuild_rollups.py")
+
+
+if __name__ == "__main__":
+    asyncio.run(migrate_delivered_at())
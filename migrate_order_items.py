@@ -0,0 +1,75 @@
+import asyncio
+from sqlalchemy import select, exists
+from database.base import Base
+from database.session import engine, AsyncSessionLocal
+from entities.models import Order, OrderItem, Product
+from webapp.orders import parse_legacy_products
+
+BATCH_SIZE = 1000
+
+
+async def migrate_order_items():
+    # Створюємо таблицю order_items, якщо її ще немає
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all, tables=[OrderItem.__table__])
+
+    migrated = 0
+    skipped = []
+    last_id = 0
+
+    async with AsyncSessionLocal() as session:
+        while True:
+            # Замовлення без рядків order_items, пачками по id
+            result = await session.execute(
+                select(Order.id, Order.city_id, Order.products)
+                .where(
+                    Order.id > last_id,
+                    ~exists().where(OrderItem.order_id == Order.id)
+                )
+                .order_by(Order.id)
+                .limit(BATCH_SIZE)
+            )
+            orders = result.all()
+            if not orders:
+                break
+            last_id = orders[-1].id
+
+            parsed = {}
+            for order in orders:
+                try:
+                    parsed[order.id] = parse_legacy_products(order.products)
+                except (ValueError, TypeError, AttributeError):
+                    skipped.append(order.id)
+
+            product_ids = {item.product_id for items in parsed.values() for item in items}
+            result = await session.execute(
+                select(Product.id, Product.sale_price).where(Product.id.in_(product_ids))
+            )
+            prices = {row.id: row.sale_price for row in result.all()}
+
+            rows = []
+            for order_id, items in parsed.items():
+                if any(item.product_id not in prices for item in items):
+                    skipped.append(order_id)
+                    continue
+                for item in items:
+                    rows.append({
+                        "order_id": order_id,
+                        "product_id": item.product_id,
+                        "quantity": item.quantity,
+                        "unit_price": item.unit_price if item.unit_price is not None else prices[item.product_id]
+                    })
+
+            if rows:
+                await session.execute(OrderItem.__table__.insert(), rows)
+            await session.commit()
+            migrated += len(parsed)
+            print(f"✅ Оброблено замовлень: {migrated}")
+
+    if skipped:
+        print(f"⚠️ Не вдалося перенести замовлення: {sorted(set(skipped))}")
+    print("\n✅ Міграцію order_items завершено!")
+
+
+if __name__ == "__main__":
+    asyncio.run(migrate_order_items())
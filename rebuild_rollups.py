@@ -0,0 +1,33 @@
+import asyncio
+import sys
+from datetime import date, timedelta
+from sqlalchemy import select, func
+from database.base import Base
+from database.session import engine, AsyncSessionLocal
+from entities.models import Order, SalesDailyRollup
+from webapp.statements import rebuild_rollups, today_utc
+
+
+async def main():
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all, tables=[SalesDailyRollup.__table__])
+
+    async with AsyncSessionLocal() as session:
+        # Без аргументів - перерахунок усієї історії замовлень
+        if len(sys.argv) == 3:
+            date_from, date_to = date.fromisoformat(sys.argv[1]), date.fromisoformat(sys.argv[2])
+        else:
+            first = await session.scalar(select(func.min(Order.delivered_at)))
+            if not first:
+                print("ℹ️ Замовлень немає")
+                return
+            # Запас в один день на різницю часових поясів
+            date_from, date_to = first.date() - timedelta(days=1), today_utc()
+
+        await rebuild_rollups(session, date_from, date_to)
+        await session.commit()
+        print(f"✅ Підсумки перераховано за {date_from} - {date_to}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,85 @@
+import asyncio
+from collections import defaultdict
+from datetime import timedelta
+from sqlalchemy import select, delete
+from database.session import AsyncSessionLocal
+from entities.models import City, User, Order, NotificationOutbox
+from webapp.scheduling import replan_city_day
+from webapp.statements import today_utc, day_bounds
+
+# Перепланування дня з перевантаженим кур'єром: кожне передане замовлення має дати
+# повідомлення і новому, і попередньому кур'єру, перенесене - тому самому кур'єру
+COURIERS = 5
+ORDERS = 20
+SLOT = 3600
+TEST_CHAT_BASE = 9_100_000_000
+
+
+async def stress_replan():
+    day_start, day_end = day_bounds(today_utc())
+    async with AsyncSessionLocal() as session:
+        # Окреме місто: реальні кур'єри не отримають тестових повідомлень
+        city = City(name="Stress replan")
+        session.add(city)
+        await session.flush()
+        couriers = [
+            User(tg_id=TEST_CHAT_BASE + i, username=f"stress_courier{i}", password_hash="-", city_id=city.id)
+            for i in range(COURIERS)
+        ]
+        # Активні користувачі міста - кандидати в кур'єри, тому отримувач неактивний
+        receiver = User(
+            tg_id=TEST_CHAT_BASE + COURIERS, username="stress_receiver", password_hash="-", city_id=city.id, is_active=False
+        )
+        session.add_all([*couriers, receiver])
+        await session.flush()
+        # Усі замовлення на одного кур'єра в один час
+        session.add_all([
+            Order(
+                city_id=city.id,
+                courier_id=couriers[0].id,
+                receiver_id=receiver.id,
+                delivery_time=day_start + timedelta(hours=12),
+                delivery_address=f"Stress {i}",
+                products="[]",
+                status="pending"
+            )
+            for i in range(ORDERS)
+        ])
+        await session.commit()
+        city_id = city.id
+        tg_by_user = {c.id: c.tg_id for c in couriers}
+
+    async with AsyncSessionLocal() as session:
+        result = await replan_city_day(session, city_id, day_start, day_end, SLOT, apply=True)
+        await session.commit()
+
+    async with AsyncSessionLocal() as session:
+        rows = (await session.execute(
+            select(NotificationOutbox.order_id, NotificationOutbox.chat_id)
+            .where(NotificationOutbox.chat_id >= TEST_CHAT_BASE, NotificationOutbox.chat_id < TEST_CHAT_BASE + COURIERS)
+        )).all()
+        chats_by_order = defaultdict(set)
+        for order_id, chat_id in rows:
+            chats_by_order[order_id].add(chat_id)
+
+        missing = []
+        for change in result["changes"]:
+            expected = {tg_by_user[change["courier_id"]]}
+            if change["courier_id"] != change["previous_courier_id"]:
+                expected.add(tg_by_user[change["previous_courier_id"]])
+            if chats_by_order[change["id"]] != expected:
+                missing.append(change["id"])
+
+        print(f"Замовлень: {result['orders']}, змінено: {result['changed']}, не розміщено: {len(result['unplaceable'])}")
+        print(f"Повідомлень в outbox: {len(rows)}")
+        print("✅ Повідомлено всіх кур'єрів" if not missing else f"❌ Неповні повідомлення для замовлень {missing}")
+
+        await session.execute(delete(NotificationOutbox).where(NotificationOutbox.order_id.in_(chats_by_order.keys())))
+        await session.execute(delete(Order).where(Order.city_id == city_id))
+        await session.execute(delete(User).where(User.city_id == city_id))
+        await session.execute(delete(City).where(City.id == city_id))
+        await session.commit()
+
+
+if __name__ == "__main__":
+    asyncio.run(stress_replan())
@@ -0,0 +1,173 @@
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+from fastapi import HTTPException
+from sqlalchemy import select, delete, func, text
+from database.session import engine, AsyncSessionLocal
+from entities.models import City, User, Product, Order, OrderItem, StockMovement, NotificationOutbox
+from webapp.orders import reserve_stock, OrderItemCreate
+from webapp.main import create_order, OrderCreate
+
+INITIAL_STOCK = 100
+CONCURRENT_ORDERS = 500
+QUANTITY = 1
+# Повний шлях create_order: різні товари, тож спільним лишається лише рядок міста (версії ETag)
+CHECKOUT_ORDERS = 200
+CHECKOUT_PRODUCTS = 50
+TEST_CHAT_BASE = 9_200_000_000
+
+
+async def one_order(product_id: int) -> bool:
+    async with AsyncSessionLocal() as session:
+        try:
+            await reserve_stock(session, None, [OrderItem(product_id=product_id, quantity=QUANTITY)])
+            await session.commit()
+            return True
+        except HTTPException:
+            await session.rollback()
+            return False
+
+
+async def sample_locks(stop: asyncio.Event) -> int:
+    # Максимальна кількість блокувань у pg_locks під час навантаження
+    if engine.dialect.name != "postgresql":
+        return 0
+    peak = 0
+    async with engine.connect() as conn:
+        while not stop.is_set():
+            peak = max(peak, await conn.scalar(text("SELECT count(*) FROM pg_locks")))
+            await asyncio.sleep(0.01)
+    return peak
+
+
+async def stress_stock():
+    async with AsyncSessionLocal() as session:
+        city = (await session.execute(select(City).limit(1))).scalar_one_or_none()
+        if not city:
+            print("❌ Немає жодного міста. Спочатку запусти add_cities.py")
+            return
+        product = Product(
+            code="STRESS",
+            name="Stress test",
+            purchase_price=1.0,
+            purchase_quantity=INITIAL_STOCK,
+            sale_price=1.0,
+            stock=INITIAL_STOCK,
+            city_id=city.id
+        )
+        session.add(product)
+        await session.flush()
+        # Як і create_product: початковий залишок - надходження в журналі, інакше сума журналу не зійдеться
+        session.add(StockMovement(product_id=product.id, quantity=INITIAL_STOCK, reason="purchase"))
+        await session.commit()
+        product_id = product.id
+
+    stop = asyncio.Event()
+    locks_task = asyncio.create_task(sample_locks(stop))
+    results = await asyncio.gather(*(one_order(product_id) for _ in range(CONCURRENT_ORDERS)))
+    stop.set()
+    peak_locks = await locks_task
+
+    async with AsyncSessionLocal() as session:
+        stock = await session.scalar(select(Product.stock).where(Product.id == product_id))
+        ledger = await session.scalar(
+            select(func.sum(StockMovement.quantity)).where(StockMovement.product_id == product_id)
+        )
+
+        accepted = sum(results)
+        print(f"Прийнято замовлень: {accepted} з {CONCURRENT_ORDERS}")
+        print(f"Залишок: {stock} (очікується {INITIAL_STOCK - accepted * QUANTITY})")
+        print(f"Сума по журналу: {ledger}")
+        print(f"Пік pg_locks: {peak_locks}")
+        print("✅ Перепродажу немає" if stock >= 0 and accepted * QUANTITY <= INITIAL_STOCK else "❌ ПЕРЕПРОДАЖ!")
+        print("✅ Журнал збігається із залишком" if ledger == stock else f"❌ Журнал ({ledger}) не збігається із залишком ({stock})!")
+
+        await session.execute(delete(StockMovement).where(StockMovement.product_id == product_id))
+        await session.execute(delete(Product).where(Product.id == product_id))
+        await session.commit()
+
+
+async def one_checkout(city_id: int, courier_id: int, receiver_id: int, product_id: int, delivery_time: datetime) -> bool:
+    async with AsyncSessionLocal() as session:
+        try:
+            await create_order(
+                OrderCreate(
+                    city_id=city_id,
+                    courier_id=courier_id,
+                    receiver_id=receiver_id,
+                    delivery_time=delivery_time.isoformat(),
+                    delivery_address="Stress",
+                    items=[OrderItemCreate(product_id=product_id, quantity=QUANTITY)],
+                    allow_overlap=True
+                ),
+                admin_id=0,
+                db=session
+            )
+            return True
+        except HTTPException:
+            await session.rollback()
+            return False
+
+
+async def stress_checkout():
+    async with AsyncSessionLocal() as session:
+        # Окреме місто: повідомлення кур'єру в outbox не дійдуть до реальних чатів
+        city = City(name="Stress checkout")
+        session.add(city)
+        await session.flush()
+        courier = User(tg_id=TEST_CHAT_BASE, username="stress_courier", password_hash="-", city_id=city.id)
+        receiver = User(tg_id=TEST_CHAT_BASE + 1, username="stress_receiver", password_hash="-", city_id=city.id)
+        products = [
+            Product(
+                code=f"STRESS{i}", name="Stress test", purchase_price=1.0, purchase_quantity=INITIAL_STOCK,
+                sale_price=1.0, stock=INITIAL_STOCK, city_id=city.id
+            )
+            for i in range(CHECKOUT_PRODUCTS)
+        ]
+        session.add_all([courier, receiver, *products])
+        await session.flush()
+        session.add_all([StockMovement(product_id=p.id, quantity=INITIAL_STOCK, reason="purchase") for p in products])
+        await session.commit()
+        city_id, product_ids = city.id, [p.id for p in products]
+        courier_id, receiver_id = courier.id, receiver.id
+
+    delivery_time = datetime.now(timezone.utc) + timedelta(days=1)
+    stop = asyncio.Event()
+    locks_task = asyncio.create_task(sample_locks(stop))
+    started = time.perf_counter()
+    results = await asyncio.gather(*(
+        one_checkout(city_id, courier_id, receiver_id, product_ids[i % CHECKOUT_PRODUCTS], delivery_time + timedelta(minutes=i))
+        for i in range(CHECKOUT_ORDERS)
+    ))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    peak_locks = await locks_task
+
+    async with AsyncSessionLocal() as session:
+        stock = await session.scalar(select(func.sum(Product.stock)).where(Product.city_id == city_id))
+        ledger = await session.scalar(
+            select(func.sum(StockMovement.quantity)).where(StockMovement.product_id.in_(product_ids))
+        )
+        accepted = sum(results)
+        print(f"create_order: {accepted} з {CHECKOUT_ORDERS} за {elapsed:.2f} с ({accepted / elapsed:.0f} замовлень/с)")
+        print(f"Пік pg_locks: {peak_locks}")
+        print("✅ Журнал збігається із залишком" if ledger == stock else f"❌ Журнал ({ledger}) не збігається із залишком ({stock})!")
+
+        order_ids = select(Order.id).where(Order.city_id == city_id)
+        await session.execute(delete(NotificationOutbox).where(NotificationOutbox.order_id.in_(order_ids)))
+        await session.execute(delete(OrderItem).where(OrderItem.order_id.in_(order_ids)))
+        await session.execute(delete(StockMovement).where(StockMovement.product_id.in_(product_ids)))
+        await session.execute(delete(Order).where(Order.city_id == city_id))
+        await session.execute(delete(Product).where(Product.city_id == city_id))
+        await session.execute(delete(User).where(User.city_id == city_id))
+        await session.execute(delete(City).where(City.id == city_id))
+        await session.commit()
+
+
+async def main():
+    await stress_stock()
+    await stress_checkout()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
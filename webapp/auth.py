@@ -0,0 +1,117 @@
+import time
+from collections import OrderedDict
+from fastapi import Request, Response, HTTPException
+from bot.utils.security import verify_admin_token
+from configuration.settings import settings
+
+TOKEN_COOKIE = "admin_token"
+
+
+class VerifiedTokenCache:
+    # LRU перевірених токенів: повторний запит з тим самим токеном не декодує JWT
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._claims: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+        self._revoked: dict[str, float] = {}
+
+    def verify(self, token: str) -> dict:
+        now = time.time()
+        if token in self._revoked:
+            raise HTTPException(status_code=401, detail="Token revoked")
+
+        item = self._claims.get(token)
+        if item is not None:
+            expires_at, claims = item
+            if expires_at > now:
+                self._claims.move_to_end(token)
+                self.hits += 1
+                return claims
+            del self._claims[token]
+
+        self.misses += 1
+        try:
+            claims = verify_admin_token(token)
+            int(claims["tg_id"])
+        except Exception:
+            raise HTTPException(status_code=401, detail="Invalid token")
+
+        self._claims[token] = (float(claims["exp"]), claims)
+        while len(self._claims) > self.maxsize:
+            self._claims.popitem(last=False)
+        return claims
+
+    def revoke(self, token: str):
+        # Токен тримаємо у списку відкликаних лише до його exp
+        item = self._claims.pop(token, None)
+        if item is not None:
+            expires_at = item[0]
+        else:
+            try:
+                expires_at = float(verify_admin_token(token)["exp"])
+            except Exception:
+                # Недійсний або прострочений токен і так не пройде перевірку
+                return
+        self._revoked[token] = expires_at
+
+        now = time.time()
+        for revoked, revoked_until in list(self._revoked.items()):
+            if revoked_until <= now:
+                del self._revoked[revoked]
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._claims),
+            "revoked": len(self._revoked),
+        }
+
+
+token_cache = VerifiedTokenCache(maxsize=settings.AUTH_CACHE_SIZE)
+
+
+def set_token_cookie(response: Response, token: str):
+    # Сторінки адмінки та їхні fetch/EventSource/WebSocket автентифікуються HttpOnly cookie:
+    # токен недоступний JS і не потрапляє в URL запитів. Lax - бо посилання відкривається з Telegram
+    claims = token_cache.verify(token)
+    response.set_cookie(
+        TOKEN_COOKIE,
+        token,
+        max_age=max(int(float(claims["exp"]) - time.time()), 0),
+        httponly=True,
+        secure=str(settings.ADMIN_PANEL_URL).startswith("https"),
+        samesite="lax"
+    )
+
+
+def clear_token_cookie(response: Response):
+    response.delete_cookie(TOKEN_COOKIE, httponly=True, samesite="lax")
+
+
+def extract_token(request: Request) -> str | None:
+    # Порядок: Authorization: Bearer, X-Admin-Token, cookie, ?token= (посилання з бота)
+    authorization = request.headers.get("authorization")
+    if authorization and authorization.lower().startswith("bearer "):
+        return authorization[7:].strip()
+    return (
+        request.headers.get("x-admin-token")
+        or request.cookies.get(TOKEN_COOKIE)
+        or request.query_params.get("token")
+    )
+
+
+def require_admin_token(request: Request) -> str:
+    token = extract_token(request)
+    if not token:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    token_cache.verify(token)
+    return token
+
+
+def require_admin(request: Request) -> int:
+    token = extract_token(request)
+    if not token:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    return int(token_cache.verify(token)["tg_id"])
@@ -0,0 +1,209 @@
+import codecs
+import csv
+import io
+import math
+import zipfile
+from typing import AsyncIterator, Iterable, Iterator
+from openpyxl import load_workbook
+from openpyxl.utils.exceptions import InvalidFileException
+from sqlalchemy import select, insert, exists, literal
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from database.session import AsyncSessionLocal
+from entities.models import Product, StockMovement
+from webapp.etag import bump_city_versions
+from webapp.search import product_search
+
+CHUNK_SIZE = 1000
+EXPORT_BATCH_SIZE = 1000
+# Excel у російсько/українській локалі зберігає CSV у cp1251
+CSV_ENCODINGS = ("utf-8-sig", "cp1251")
+MAX_INT = 2 ** 31 - 1
+
+REQUIRED_COLUMNS = {"code", "name", "purchase_price", "sale_price"}
+EXPORT_COLUMNS = [
+    "code", "name", "flavor", "purchase_price", "purchase_quantity",
+    "sale_price", "sold_quantity", "avg_sale_price", "stock"
+]
+
+
+def detect_encoding(binary_file) -> str:
+    # Файл перевіряється цілком до імпорту (блоками, без читання в пам'ять), щоб помилка
+    # декодування не зупинила імпорт після того, як перші чанки вже закомічені
+    for encoding in CSV_ENCODINGS:
+        decoder = codecs.getincrementaldecoder(encoding)()
+        binary_file.seek(0)
+        try:
+            while block := binary_file.read(64 * 1024):
+                decoder.decode(block)
+            decoder.decode(b"", final=True)
+        except UnicodeDecodeError:
+            continue
+        binary_file.seek(0)
+        return encoding
+    raise ValueError("Unsupported file encoding, expected UTF-8 or Windows-1251")
+
+
+def iter_csv_rows(binary_file) -> Iterator[dict]:
+    # Кодування перевіряється одразу при виклику, а рядки читаються построково
+    text = io.TextIOWrapper(binary_file, encoding=detect_encoding(binary_file), newline="")
+    sample = text.readline()
+    if not sample.strip():
+        raise ValueError("Empty file")
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+    except csv.Error:
+        dialect = csv.excel
+    header = next(csv.reader([sample], dialect))
+    reader = csv.DictReader(text, fieldnames=[h.strip().lower() for h in header], dialect=dialect)
+    return iter(reader)
+
+
+def iter_xlsx_rows(binary_file) -> Iterator[dict]:
+    # Книга відкривається одразу (бита - ValueError до імпорту), рядки - потоком у read_only режимі
+    try:
+        workbook = load_workbook(binary_file, read_only=True, data_only=True)
+    except (zipfile.BadZipFile, InvalidFileException, KeyError, OSError) as e:
+        raise ValueError(f"Invalid xlsx file: {e}")
+    return read_xlsx_rows(workbook)
+
+
+def read_xlsx_rows(workbook) -> Iterator[dict]:
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [str(h or "").strip().lower() for h in next(rows, [])]
+        for values in rows:
+            yield {key: ("" if value is None else str(value)) for key, value in zip(header, values)}
+    finally:
+        workbook.close()
+
+
+def parse_row(raw: dict) -> dict:
+    missing = [c for c in REQUIRED_COLUMNS if not (raw.get(c) or "").strip()]
+    if missing:
+        raise ValueError(f"Missing columns: {', '.join(sorted(missing))}")
+
+    def number(key: str, cast, default=None):
+        value = (raw.get(key) or "").strip().replace(",", ".")
+        if not value:
+            return default
+        result = float(value)
+        # nan/inf float() приймає, але в ціни та залишки вони потрапити не повинні
+        if not math.isfinite(result):
+            raise ValueError(f"{key} must be a finite number")
+        if result < 0:
+            raise ValueError(f"{key} must not be negative")
+        if cast is int:
+            if result > MAX_INT:
+                raise ValueError(f"{key} is too large")
+            return int(result)
+        return result
+
+    code = raw["code"].strip()
+    if len(code) > 50:
+        raise ValueError("code is too long")
+
+    purchase_quantity = number("purchase_quantity", int, 0)
+    return {
+        "code": code,
+        "name": raw["name"].strip()[:255],
+        "flavor": (raw.get("flavor") or "").strip()[:255] or None,
+        "purchase_price": number("purchase_price", float),
+        "purchase_quantity": purchase_quantity,
+        "sale_price": number("sale_price", float),
+        "stock": number("stock", int, purchase_quantity),
+    }
+
+
+def upsert_statement(dialect_name: str):
+    # Залишок існуючих товарів імпорт не змінює: він ведеться через журнал руху товару
+    dialect_insert = postgresql.insert if dialect_name == "postgresql" else sqlite.insert
+    stmt = dialect_insert(Product)
+    return stmt.on_conflict_do_update(
+        index_elements=[Product.city_id, Product.code],
+        set_={
+            "name": stmt.excluded.name,
+            "flavor": stmt.excluded.flavor,
+            "purchase_price": stmt.excluded.purchase_price,
+            "purchase_quantity": stmt.excluded.purchase_quantity,
+            "sale_price": stmt.excluded.sale_price,
+            "version": Product.version + 1,
+        }
+    )
+
+
+async def import_products(db: AsyncSession, city_id: int, rows: Iterable[dict]) -> dict:
+    stmt = upsert_statement(db.bind.dialect.name)
+    errors = []
+    seen_codes = set()
+    imported = 0
+    chunk = []
+
+    async def flush():
+        nonlocal imported
+        if not chunk:
+            return
+        await db.execute(stmt, chunk)
+        # Для нових товарів фіксуємо початковий залишок у журналі
+        codes = [row["code"] for row in chunk]
+        await db.execute(
+            insert(StockMovement).from_select(
+                ["product_id", "quantity", "reason"],
+                select(Product.id, Product.stock, literal("purchase")).where(
+                    Product.city_id == city_id,
+                    Product.code.in_(codes),
+                    ~exists().where(StockMovement.product_id == Product.id)
+                )
+            )
+        )
+        # Кожен чанк комітиться окремо, тож версія міста й пошук оновлюються разом з ним:
+        # якщо імпорт обірветься, вже записані товари не сховаються за старим ETag
+        await bump_city_versions(db, city_id, products=True)
+        await db.commit()
+        product_search.invalidate(city_id)
+        imported += len(chunk)
+        chunk.clear()
+
+    # Рядок 1 - заголовок
+    for row_number, raw in enumerate(rows, start=2):
+        try:
+            row = parse_row(raw)
+        except (ValueError, TypeError, OverflowError) as e:
+            errors.append({"row": row_number, "error": str(e)})
+            continue
+
+        if row["code"] in seen_codes:
+            errors.append({"row": row_number, "error": f"Duplicate code {row['code']}"})
+            continue
+        seen_codes.add(row["code"])
+
+        row["city_id"] = city_id
+        chunk.append(row)
+        if len(chunk) >= CHUNK_SIZE:
+            await flush()
+
+    await flush()
+    return {"imported": imported, "failed": len(errors), "errors": errors}
+
+
+async def export_products_csv(city_id: int) -> AsyncIterator[str]:
+    # Окрема сесія: генератор живе довше за запит, а рядки читаються серверним курсором
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+
+    async with AsyncSessionLocal() as session:
+        result = await session.stream(
+            select(*[getattr(Product, c) for c in EXPORT_COLUMNS])
+            .where(Product.city_id == city_id)
+            .order_by(Product.id)
+            .execution_options(yield_per=EXPORT_BATCH_SIZE)
+        )
+        async for partition in result.partitions():
+            writer.writerows(partition)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue()
@@ -0,0 +1,216 @@
+import asyncio
+import time
+from bisect import bisect_left, insort
+from dataclasses import dataclass, field
+from datetime import datetime, timezone, timedelta
+from sqlalchemy import select, or_, and_
+from sqlalchemy.ext.asyncio import AsyncSession
+from configuration.settings import settings
+from entities.models import Order
+from webapp.orders import order_events
+from webapp.scheduling import overlapping, to_timestamp
+
+# Ваги рейтингу (менше - краще): конфлікт слоту важить більше за кілька замовлень у черзі,
+# кількість недавніх доставок лише розподіляє роботу між рівними кур'єрами
+CONFLICT_WEIGHT = 10.0
+PENDING_WEIGHT = 1.0
+RECENT_WEIGHT = 0.1
+
+
+@dataclass
+class CourierLoad:
+    # Відсортовані часи доставки: bisect замість перебору
+    pending_slots: list[float] = field(default_factory=list)
+    delivered: list[float] = field(default_factory=list)
+
+
+class CityLoadIndex:
+    # Навантаження кур'єрів одного міста. Замовлення зберігаються за id,
+    # тому повторне застосування тієї самої події нічого не змінює
+    PRUNE_INTERVAL = 60.0
+
+    def __init__(self, built_at: float):
+        self.built_at = built_at
+        self.pruned_at = built_at
+        self.couriers: dict[int, CourierLoad] = {}
+        self.pending: dict[int, tuple[int, float]] = {}
+        self.delivered: dict[int, tuple[int, float]] = {}
+
+    def load(self, courier_id: int) -> CourierLoad:
+        load = self.couriers.get(courier_id)
+        if load is None:
+            load = self.couriers[courier_id] = CourierLoad()
+        return load
+
+    def add_pending(self, order_id: int, courier_id: int, slot: float):
+        if order_id in self.pending or order_id in self.delivered:
+            return
+        self.pending[order_id] = (courier_id, slot)
+        insort(self.load(courier_id).pending_slots, slot)
+
+    def add_delivered(self, order_id: int, courier_id: int, slot: float):
+        if order_id in self.delivered:
+            return
+        self.delivered[order_id] = (courier_id, slot)
+        insort(self.load(courier_id).delivered, slot)
+
+    def set_status(self, order_id: int, status: str):
+        entry = self.pending.pop(order_id, None)
+        if entry is None:
+            return
+        courier_id, slot = entry
+        slots = self.load(courier_id).pending_slots
+        del slots[bisect_left(slots, slot)]
+        if status == "delivered":
+            self.add_delivered(order_id, courier_id, slot)
+
+    def prune(self, recent_from: float):
+        # Старі доставки вибувають з вікна не частіше ніж раз на PRUNE_INTERVAL
+        now = time.monotonic()
+        if now - self.pruned_at < self.PRUNE_INTERVAL:
+            return
+        self.pruned_at = now
+        for order_id, (courier_id, slot) in list(self.delivered.items()):
+            if slot < recent_from:
+                del self.delivered[order_id]
+        for load in self.couriers.values():
+            del load.delivered[:bisect_left(load.delivered, recent_from)]
+
+
+class CourierLoadIndex:
+    # Індекси міст будуються одним запитом при першому зверненні (і раз на TTL як страховка
+    # від втрачених подій), далі оновлюються подіями замовлень з order_events
+    def __init__(self, slot_minutes: int, recent_days: int, ttl: float):
+        self.slot_duration = slot_minutes * 60
+        self.recent_window = recent_days * 86400
+        self.ttl = ttl
+        self.cities: dict[int, CityLoadIndex] = {}
+        self.builds = 0
+        self.events = 0
+        self._building: dict[int, list[tuple[str, dict]]] = {}
+        self._inflight: dict[int, asyncio.Future] = {}
+
+    def apply(self, channel: str, event: str, data: dict):
+        if event not in ("order_created", "order_status_changed", "orders_replanned"):
+            return
+        city_id = data["city_id"]
+        buffered = self._building.get(city_id)
+        if buffered is not None:
+            # Індекс міста зараз будується - подію застосуємо після запиту
+            buffered.append((event, data))
+        if event == "orders_replanned":
+            # Масова зміна - індекс міста перебудується при наступному зверненні
+            self.cities.pop(city_id, None)
+            return
+        index = self.cities.get(city_id)
+        if index is not None:
+            self.events += 1
+            self._apply(index, event, data)
+
+    def _apply(self, index: CityLoadIndex, event: str, data: dict):
+        if event == "order_created":
+            if data["status"] == "pending":
+                slot = to_timestamp(datetime.fromisoformat(data["delivery_time"]))
+                index.add_pending(data["id"], data["courier_id"], slot)
+        else:
+            index.set_status(data["id"], data["status"])
+
+    async def get(self, db: AsyncSession, city_id: int) -> CityLoadIndex:
+        index = self.cities.get(city_id)
+        if index is not None and time.monotonic() - index.built_at < self.ttl:
+            return index
+        pending = self._inflight.get(city_id)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[city_id] = future
+        try:
+            index = await self.build(db, city_id)
+            future.set_result(index)
+            return index
+        except BaseException as e:
+            future.set_exception(e if isinstance(e, Exception) else RuntimeError("Index build cancelled"))
+            future.exception()
+            raise
+        finally:
+            del self._inflight[city_id]
+
+    async def build(self, db: AsyncSession, city_id: int) -> CityLoadIndex:
+        # LISTEN має працювати до знімка: інакше індекс не бачить записів інших воркерів
+        # до наступної перебудови, навіть якщо в цьому процесі ніхто не відкривав стрім замовлень
+        await order_events.ensure_listening()
+        self._building[city_id] = []
+        try:
+            recent_from = datetime.now(timezone.utc) - timedelta(seconds=self.recent_window)
+            result = await db.execute(
+                select(Order.id, Order.courier_id, Order.delivery_time, Order.status).where(
+                    Order.city_id == city_id,
+                    or_(
+                        Order.status == "pending",
+                        and_(Order.status == "delivered", Order.delivery_time >= recent_from)
+                    )
+                )
+            )
+            index = CityLoadIndex(time.monotonic())
+            for row in result.all():
+                if row.status == "pending":
+                    index.add_pending(row.id, row.courier_id, to_timestamp(row.delivery_time))
+                else:
+                    index.add_delivered(row.id, row.courier_id, to_timestamp(row.delivery_time))
+            # Події, що прийшли під час запиту, могли не потрапити в його знімок
+            stale = False
+            for event, data in self._building[city_id]:
+                if event == "orders_replanned":
+                    stale = True
+                else:
+                    self._apply(index, event, data)
+        finally:
+            del self._building[city_id]
+
+        self.builds += 1
+        if not stale:
+            self.cities[city_id] = index
+        return index
+
+    def rank(self, index: CityLoadIndex, couriers: list[dict], delivery_time: datetime, limit: int) -> list[dict]:
+        slot = to_timestamp(delivery_time)
+        recent_from = time.time() - self.recent_window
+        index.prune(recent_from)
+
+        ranked = []
+        empty = CourierLoad()
+        for courier in couriers:
+            load = index.couriers.get(courier["id"], empty)
+            slots = load.pending_slots
+            conflicts = len(overlapping(slots, slot, self.slot_duration))
+            pending = len(slots)
+            recent = len(load.delivered)
+            nearest = bisect_left(slots, slot)
+            neighbours = slots[max(nearest - 1, 0):nearest + 1]
+            gap = min((abs(s - slot) for s in neighbours), default=None)
+            ranked.append({
+                **courier,
+                "score": round(conflicts * CONFLICT_WEIGHT + pending * PENDING_WEIGHT + recent * RECENT_WEIGHT, 2),
+                "conflicts": conflicts,
+                "pending": pending,
+                "recent_deliveries": recent,
+                "nearest_slot_minutes": round(gap / 60) if gap is not None else None
+            })
+
+        ranked.sort(key=lambda c: (c["score"], c["id"]))
+        return ranked[:limit]
+
+    def stats(self) -> dict:
+        return {
+            "cities": len(self.cities),
+            "pending_orders": sum(len(index.pending) for index in self.cities.values()),
+            "builds": self.builds,
+            "events": self.events,
+        }
+
+
+courier_index = CourierLoadIndex(
+    settings.DISPATCH_SLOT_MINUTES, settings.DISPATCH_RECENT_DAYS, settings.DISPATCH_INDEX_TTL_SEC
+)
+order_events.add_hook(courier_index.apply)
@@ -0,0 +1,62 @@
+import hashlib
+from fastapi import Request, Response
+from sqlalchemy import select, update, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from entities.models import City
+
+
+async def bump_city_versions(db: AsyncSession, city_id: int, products: bool = False, orders: bool = False):
+    # Лічильники змін міста збільшуються в транзакції запису; коміт робить викликач.
+    # Викликати якомога ближче до коміту - UPDATE тримає блокування рядка міста
+    values = {}
+    if products:
+        values["products_version"] = City.products_version + 1
+    if orders:
+        values["orders_version"] = City.orders_version + 1
+    if values:
+        await db.execute(
+            update(City)
+            .where(City.id == city_id)
+            .values(**values)
+            .execution_options(synchronize_session=False)
+        )
+
+
+async def products_version(db: AsyncSession, city_id: int) -> int | None:
+    return await db.scalar(select(City.products_version).where(City.id == city_id))
+
+
+async def orders_version(db: AsyncSession, city_id: int | None = None) -> str:
+    if city_id:
+        return str(await db.scalar(select(City.orders_version).where(City.id == city_id)))
+    # Для всіх міст: лічильники лише ростуть, тому сума змінюється при кожному записі
+    total, count = (await db.execute(
+        select(func.coalesce(func.sum(City.orders_version), 0), func.count(City.id))
+    )).one()
+    return f"{total}.{count}"
+
+
+def make_etag(*parts) -> str:
+    # Слабкий ETag: тіло може віддаватись як стиснутим, так і ні
+    digest = hashlib.blake2b(":".join(map(str, parts)).encode("utf-8"), digest_size=12).hexdigest()
+    return f'W/"{digest}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # Порівняння слабке: W/ ігнорується (RFC 9110, If-None-Match)
+    opaque = etag.removeprefix("W/")
+    return any(candidate.strip().removeprefix("W/") == opaque for candidate in header.split(","))
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers=cache_headers(etag))
+
+
+def cache_headers(etag: str) -> dict:
+    # no-cache: браузер зберігає відповідь, але перед використанням перевіряє її через If-None-Match
+    return {"ETag": etag, "Cache-Control": "private, no-cache"}
@@ -0,0 +1,245 @@
+import asyncio
+import json
+import logging
+import uuid
+from collections import defaultdict
+from typing import AsyncIterator, Awaitable, Callable
+from fastapi import Request, WebSocket
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from configuration.settings import settings
+
+logger = logging.getLogger(__name__)
+
+HEARTBEAT_SEC = 15.0
+# PostgreSQL відхиляє NOTIFY з payload від 8000 байт - помилка зірвала б транзакцію запису
+NOTIFY_PAYLOAD_LIMIT = 7900
+
+
+class EventBroker:
+    # Pub/sub у межах процесу: кожен підписник (SSE/WebSocket-клієнт) має свою обмежену чергу.
+    # Повільний клієнт не гальмує інших: при переповненні його черга очищується
+    # і він отримує подію resync, після якої перечитує дані через API
+    def __init__(self, queue_size: int = 100):
+        self.queue_size = queue_size
+        self.subscribers: dict[str, set[asyncio.Queue]] = defaultdict(set)
+        self.published = 0
+        self.dropped = 0
+
+    def subscribe(self, channel: str) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self.subscribers[channel].add(queue)
+        return queue
+
+    def unsubscribe(self, channel: str, queue: asyncio.Queue):
+        subscribers = self.subscribers.get(channel)
+        if subscribers is None:
+            return
+        subscribers.discard(queue)
+        if not subscribers:
+            del self.subscribers[channel]
+
+    def publish(self, channel: str, event: str, data: dict):
+        self.published += 1
+        for queue in self.subscribers.get(channel, ()):
+            try:
+                queue.put_nowait((event, data))
+            except asyncio.QueueFull:
+                self.dropped += 1
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(("resync", {}))
+
+    def stats(self) -> dict:
+        return {
+            "channels": len(self.subscribers),
+            "subscribers": sum(len(s) for s in self.subscribers.values()),
+            "published": self.published,
+            "dropped": self.dropped,
+        }
+
+
+broker = EventBroker()
+
+
+def format_sse(event: str, data: dict, event_id: int | None = None) -> str:
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, ensure_ascii=False, default=str)}")
+    return "\n".join(lines) + "\n\n"
+
+
+async def sse_stream(request: Request, channel: str, queue: asyncio.Queue) -> AsyncIterator[str]:
+    # Підписка створюється викликачем до початку стріму, щоб не пропустити події
+    try:
+        yield "retry: 3000\n\n"
+        while True:
+            try:
+                event, data = await asyncio.wait_for(queue.get(), timeout=HEARTBEAT_SEC)
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    return
+                # Коментар-heartbeat не дає проксі закрити "тихе" з'єднання
+                yield ": ping\n\n"
+                continue
+            yield format_sse(event, data, data.get("id"))
+    finally:
+        broker.unsubscribe(channel, queue)
+
+
+async def websocket_stream(websocket: WebSocket, channel: str, queue: asyncio.Queue):
+    # Клієнт нічого не надсилає; читання потрібне лише щоб помітити відключення
+    receiver = asyncio.create_task(websocket.receive())
+    # Один getter живе між ітераціями: скасований після heartbeat getter міг би вже забрати подію з черги
+    getter = asyncio.create_task(queue.get())
+    try:
+        while True:
+            done, _ = await asyncio.wait({receiver, getter}, timeout=HEARTBEAT_SEC, return_when=asyncio.FIRST_COMPLETED)
+            if receiver in done:
+                if receiver.result()["type"] == "websocket.disconnect":
+                    return
+                receiver = asyncio.create_task(websocket.receive())
+            if getter in done:
+                event, data = getter.result()
+                getter = asyncio.create_task(queue.get())
+                await websocket.send_json({"event": event, "data": data})
+            elif not done:
+                await websocket.send_json({"event": "ping"})
+    finally:
+        receiver.cancel()
+        getter.cancel()
+        broker.unsubscribe(channel, queue)
+
+
+class PostgresNotifyListener:
+    # Окреме з'єднання asyncpg з LISTEN: процес бота або інші воркери адмінки
+    # роблять pg_notify у своїй транзакції, сповіщення приходить після коміту
+    def __init__(self):
+        self.connection = None
+        self.handlers: dict[str, Callable[[str], None]] = {}
+
+    @staticmethod
+    def enabled() -> bool:
+        return str(settings.DB_URL).startswith("postgresql+asyncpg")
+
+    async def listen(self, channel: str, handler: Callable[[str], None]):
+        import asyncpg
+
+        if self.connection is None or self.connection.is_closed():
+            dsn = str(settings.DB_URL).replace("postgresql+asyncpg", "postgresql", 1)
+            self.connection = await asyncpg.connect(dsn)
+            for existing_channel, existing_handler in self.handlers.items():
+                await self._add(existing_channel, existing_handler)
+        if channel not in self.handlers:
+            self.handlers[channel] = handler
+            await self._add(channel, handler)
+
+    async def _add(self, channel: str, handler: Callable[[str], None]):
+        await self.connection.add_listener(channel, lambda conn, pid, ch, payload: handler(payload))
+
+
+notify_listener = PostgresNotifyListener()
+
+
+class ChangeFeed:
+    # Фоновий цикл, який перечитує зміни з БД і публікує їх у broker.
+    # Прокидається від NOTIFY (PostgreSQL) або раз на poll_interval (SQLite, втрачене сповіщення);
+    # запускається при першому підписнику, один на процес незалежно від кількості клієнтів
+    def __init__(self, channel: str, fetch: Callable[[], Awaitable[int]], poll_interval: float):
+        self.channel = channel
+        self.fetch = fetch
+        self.poll_interval = poll_interval
+        self.wakeup = asyncio.Event()
+        self.task: asyncio.Task | None = None
+
+    def notify(self, payload: str = ""):
+        self.wakeup.set()
+
+    async def ensure_started(self):
+        if self.task is not None and not self.task.done():
+            return
+        if PostgresNotifyListener.enabled():
+            try:
+                await notify_listener.listen(self.channel, self.notify)
+            except Exception:
+                logger.exception("LISTEN %s failed, falling back to polling", self.channel)
+        self.task = asyncio.create_task(self.run())
+
+    async def run(self):
+        while True:
+            try:
+                await self.fetch()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Change feed %s failed", self.channel)
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+
+
+class NotifyRelay:
+    # Події, які мають дійти до підписників усіх процесів адмінки.
+    # stage() викликається в транзакції: на PostgreSQL подія йде через pg_notify і доставляється
+    # іншим процесам лише після коміту; локальні підписники отримують її з publish_committed()
+    # одразу після коміту, а власні сповіщення з LISTEN відкидаються за origin
+    def __init__(self, notify_channel: str):
+        self.notify_channel = notify_channel
+        self.origin = uuid.uuid4().hex
+        self.listening = False
+        # Синхронні обробники всіх подій (локальних і з інших воркерів), напр. індекси в пам'яті
+        self.hooks: list[Callable[[str, str, dict], None]] = []
+
+    def add_hook(self, hook: Callable[[str, str, dict], None]):
+        self.hooks.append(hook)
+
+    def dispatch(self, channel: str, event: str, data: dict):
+        for hook in self.hooks:
+            try:
+                hook(channel, event, data)
+            except Exception:
+                logger.exception("Event hook failed for %s", event)
+        broker.publish(channel, event, data)
+
+    async def stage(self, db: AsyncSession, channel: str, event: str, data: dict, compact: tuple[str, ...] = ("id", "city_id")):
+        # Локальні підписники отримують data повністю. Якщо payload для інших воркерів
+        # не влазить у ліміт NOTIFY, туди йдуть лише поля compact з позначкою truncated -
+        # клієнт перечитує рядок через API
+        db.info.setdefault("staged_events", []).append((channel, event, data))
+        if db.bind.dialect.name == "postgresql":
+            payload = self.payload(channel, event, data)
+            if len(payload.encode("utf-8")) >= NOTIFY_PAYLOAD_LIMIT:
+                payload = self.payload(channel, event, {
+                    **{key: data[key] for key in compact if key in data}, "truncated": True
+                })
+            await db.execute(select(func.pg_notify(self.notify_channel, payload)))
+
+    def payload(self, channel: str, event: str, data: dict) -> str:
+        return json.dumps(
+            {"origin": self.origin, "channel": channel, "event": event, "data": data},
+            ensure_ascii=False,
+            default=str
+        )
+
+    def publish_committed(self, db: AsyncSession):
+        for channel, event, data in db.info.pop("staged_events", []):
+            self.dispatch(channel, event, data)
+
+    async def ensure_listening(self):
+        if self.listening or not PostgresNotifyListener.enabled():
+            return
+        try:
+            await notify_listener.listen(self.notify_channel, self.on_notify)
+            self.listening = True
+        except Exception:
+            logger.exception("LISTEN %s failed, events from other workers are not relayed", self.notify_channel)
+
+    def on_notify(self, payload: str):
+        message = json.loads(payload)
+        if message["origin"] == self.origin:
+            return
+        self.dispatch(message["channel"], message["event"], message["data"])
@@ -0,0 +1,154 @@
+from datetime import date
+import numpy as np
+from fastapi import HTTPException
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from entities.models import Expense
+from webapp.statements import daily_revenue, day_bounds
+
+PERIODS = ("day", "week", "month")
+
+
+def columns(rows: list, count: int) -> list[tuple]:
+    # Транспонування рядків результату в колонки для numpy
+    return list(zip(*rows)) if rows else [()] * count
+
+
+def to_buckets(days: np.ndarray, period: str) -> np.ndarray:
+    # days - масив datetime64[D]; повертає початок періоду для кожного елемента
+    if period == "day":
+        return days
+    if period == "week":
+        # 1970-01-01 - четвер, тому зсув +3 дає понеділок як початок тижня
+        offsets = (days.astype(np.int64) + 3) % 7
+        return days - offsets.astype("timedelta64[D]")
+    if period == "month":
+        return days.astype("datetime64[M]").astype("datetime64[D]")
+    raise HTTPException(status_code=400, detail="period must be day, week or month")
+
+
+def bucket_index(buckets: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    # Аналог np.unique(return_inverse=True) для дат, але за O(n) без сортування
+    if not len(buckets):
+        return np.array([], dtype="datetime64[D]"), np.array([], dtype=np.int64)
+    ordinals = buckets.astype(np.int64)
+    low = ordinals.min()
+    offsets = ordinals - low
+    present = np.bincount(offsets) > 0
+    compact = np.cumsum(present) - 1
+    return (np.flatnonzero(present) + low).astype("datetime64[D]"), compact[offsets]
+
+
+def aggregate_expenses(
+    days: np.ndarray,
+    category_codes: np.ndarray,
+    category_names: list[str],
+    amounts: np.ndarray,
+    period: str,
+    revenue_days: np.ndarray | None = None,
+    revenue: np.ndarray | None = None,
+    cost: np.ndarray | None = None
+) -> dict:
+    # Усі підсумки рахуються векторно (bincount), без циклу по рядках.
+    # category_codes - індекси в category_names для кожного рядка витрат
+    if revenue_days is None:
+        revenue_days = np.array([], dtype="datetime64[D]")
+        revenue = np.array([], dtype=np.float64)
+        cost = np.array([], dtype=np.float64)
+
+    expense_buckets = to_buckets(days, period)
+    revenue_buckets = to_buckets(revenue_days, period)
+    buckets, inverse = bucket_index(np.concatenate([expense_buckets, revenue_buckets]))
+    expense_index = inverse[:len(expense_buckets)]
+    revenue_index = inverse[len(expense_buckets):]
+    bucket_count = len(buckets)
+    category_count = len(category_names)
+
+    expenses_by_bucket = np.bincount(expense_index, weights=amounts, minlength=bucket_count)
+    revenue_by_bucket = np.bincount(revenue_index, weights=revenue, minlength=bucket_count)
+    cost_by_bucket = np.bincount(revenue_index, weights=cost, minlength=bucket_count)
+    category_totals = np.bincount(category_codes, weights=amounts, minlength=category_count)
+
+    # Матриця період x категорія через один bincount по плоскому індексу
+    matrix = np.bincount(
+        expense_index * category_count + category_codes,
+        weights=amounts,
+        minlength=bucket_count * category_count
+    ).reshape(bucket_count, category_count)
+
+    net_by_bucket = revenue_by_bucket - cost_by_bucket - expenses_by_bucket
+
+    return {
+        "period": period,
+        "buckets": [
+            {
+                "start": str(bucket),
+                "expenses": round(float(expenses), 2),
+                "revenue": round(float(rev), 2),
+                "cost": round(float(cst), 2),
+                "net_profit": round(float(net), 2),
+                "categories": {
+                    name: round(float(value), 2)
+                    for name, value in zip(category_names, row)
+                    if value
+                }
+            }
+            for bucket, expenses, rev, cst, net, row in zip(
+                buckets, expenses_by_bucket, revenue_by_bucket, cost_by_bucket, net_by_bucket, matrix
+            )
+        ],
+        "categories": {
+            name: round(float(value), 2) for name, value in zip(category_names, category_totals)
+        },
+        "total": {
+            "expenses": round(float(amounts.sum()), 2),
+            "revenue": round(float(revenue.sum()), 2),
+            "cost": round(float(cost.sum()), 2),
+            "net_profit": round(float(revenue.sum() - cost.sum() - amounts.sum()), 2)
+        }
+    }
+
+
+async def build_expense_report(
+    db: AsyncSession,
+    date_from: date,
+    date_to: date,
+    period: str,
+    city_id: int | None = None
+) -> dict:
+    if period not in PERIODS:
+        raise HTTPException(status_code=400, detail="period must be day, week or month")
+    if date_from > date_to:
+        raise HTTPException(status_code=400, detail="date_from is after date_to")
+
+    # Один запит на весь діапазон: БД згортає рядки до (день, категорія),
+    # далі періоди та підсумки рахуються векторно
+    start, _ = day_bounds(date_from)
+    _, end = day_bounds(date_to)
+    day = func.date(Expense.spent_at)
+    query = (
+        select(day, Expense.category, func.sum(Expense.amount))
+        .where(Expense.spent_at >= start, Expense.spent_at < end)
+        .group_by(day, Expense.category)
+    )
+    if city_id:
+        query = query.where(Expense.city_id == city_id)
+    result = await db.execute(query)
+    day_column, category_column, amount_column = columns(result.all(), 3)
+
+    revenue_rows = await daily_revenue(db, date_from, date_to, city_id)
+    revenue_days, revenue, cost = columns(revenue_rows, 3)
+
+    # Після GROUP BY рядків небагато, тому факторизація категорій дешева
+    category_names, category_codes = np.unique(np.array(category_column, dtype=str), return_inverse=True)
+
+    return aggregate_expenses(
+        np.array(day_column, dtype="datetime64[D]"),
+        category_codes.astype(np.int64),
+        category_names.tolist(),
+        np.array(amount_column, dtype=np.float64),
+        period,
+        np.array(revenue_days, dtype="datetime64[D]"),
+        np.array(revenue, dtype=np.float64),
+        np.array(cost, dtype=np.float64)
+    )
@@ -1,192 +1,187 @@
-from fastapi import FastAPI, Request, Depends, HTTPException
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi import FastAPI, Request, Response, Depends, HTTPException, Query, UploadFile, File, WebSocket
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse, PlainTextResponse, RedirectResponse
 from fastapi.staticfiles import StaticFiles
-from starlette.templating import Jinja2Templates
+from starlette.middleware.gzip import GZipMiddleware
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, delete
-from database.session import AsyncSessionLocal
-from bot.utils.security import verify_admin_token
-from entities.models import RegistrationRequest, User, City, Product, Order
+from sqlalchemy import select, insert, delete, update, func, literal
+from sqlalchemy.orm import joinedload, selectinload
+from sqlalchemy.exc import IntegrityError
+from configuration.settings import settings
+from database.session import AsyncSessionLocal, pool_metrics
+from database.instrumentation import query_registry
+from webapp.profiling import QueryProfileMiddleware
+from webapp.metrics import MetricsMiddleware, TimedJinja2Templates, render_metrics
+from webapp.auth import require_admin, require_admin_token, token_cache, set_token_cookie, clear_token_cookie
+from bot.utils.cache import cache, CITIES_KEY, couriers_key
+from webapp.search import product_search
+from webapp.catalog import iter_csv_rows, iter_xlsx_rows, import_products, export_products_csv
+from webapp.orders import (
+    OrderItemCreate, parse_legacy_products, build_order_items, serialize_items, reserve_stock, change_order_status,
+    enqueue_courier_notification, stage_order_created, order_events, orders_channel
+)
+from webapp.statements import build_statement, today_utc, day_bounds
+from webapp.expenses import build_expense_report
+from webapp.dispatch import courier_index
+from webapp.users import city_user_counts, list_users, export_users_csv
+from webapp.scheduling import check_slot, free_slots, replan_city_day, to_timestamp, to_datetime, MAX_FREE_SLOTS
+from webapp.registrations import process_registrations, list_pending_requests, registration_feed, MAX_BATCH_SIZE, REGISTRATIONS_CHANNEL
+from webapp.events import broker, sse_stream, websocket_stream
+from webapp.pagination import created_key, before_cursor
+from webapp.etag import bump_city_versions, products_version, orders_version, make_etag, etag_matches, not_modified, cache_headers
+from entities.models import User, City, Product, Order, OrderItem, StockMovement, Expense
 from pydantic import BaseModel
-from datetime import datetime
+from datetime import date, datetime, timezone
 import json
+import base64
+import secrets
+from urllib.parse import urlencode
 
 app = FastAPI(title="Vapeshop Admin")
+app.add_middleware(QueryProfileMiddleware)
+app.add_middleware(GZipMiddleware, minimum_size=1024)
+app.add_middleware(MetricsMiddleware)
 
-templates = Jinja2Templates(directory="webapp/templates")
+templates = TimedJinja2Templates(directory="webapp/templates")
 app.mount("/static", StaticFiles(directory="webapp/static"), name="static")
 
 async def get_db():
     async with AsyncSessionLocal() as s:
         yield s
 
-def require_admin(token: str) -> int:
-    try:
-        payload = verify_admin_token(token)
-        return int(payload["tg_id"])
-    except Exception:
-        raise HTTPException(status_code=401, detail="Invalid token")
+def render_admin_page(request: Request, token: str, name: str, page_title: str, active_page: str) -> Response:
+    # Токен з посилання бота (?token=) переноситься в cookie, а адреса очищується від нього,
+    # щоб токен не лишався в історії браузера та заголовку Referer
+    if "token" in request.query_params:
+        query = urlencode([(k, v) for k, v in request.query_params.multi_items() if k != "token"])
+        response = RedirectResponse(str(request.url.replace(query=query)), status_code=303)
+    else:
+        response = templates.TemplateResponse(name, {
+            "request": request,
+            "page_title": page_title,
+            "active_page": active_page
+        })
+    set_token_cookie(response, token)
+    return response
+
 
 @app.get("/", response_class=HTMLResponse)
-async def index(request: Request, token: str, db: AsyncSession = Depends(get_db)):
-    _ = require_admin(token)
-    
-    # Отримуємо всі заявки зі статусом pending
-    result = await db.execute(
-        select(RegistrationRequest)
-        .where(RegistrationRequest.status == "pending")
-        .order_by(RegistrationRequest.created_at.desc())
-    )
-    requests = result.scalars().all()
-    
-    return templates.TemplateResponse("index.html", {
-        "request": request,
-        "token": token,
-        "requests": requests,
-        "page_title": "Заявки на реєстрацію",
-        "active_page": "registration"
-    })
+async def index(request: Request, token: str = Depends(require_admin_token)):
+    # Заявки підвантажуються сторінкою через /api/registration-requests та SSE
+    return render_admin_page(request, token, "index.html", "Заявки на реєстрацію", "registration")
 
 @app.get("/cities", response_class=HTMLResponse)
-async def cities(request: Request, token: str, db: AsyncSession = Depends(get_db)):
-    _ = require_admin(token)
-    
-    return templates.TemplateResponse("cities.html", {
-        "request": request,
-        "token": token,
-        "page_title": "Города",
-        "active_page": "cities"
-    })
+async def cities(request: Request, token: str = Depends(require_admin_token), db: AsyncSession = Depends(get_db)):
+    return render_admin_page(request, token, "cities.html", "Города", "cities")
 
 @app.get("/order-tips", response_class=HTMLResponse)
-async def order_tips(request: Request, token: str, db: AsyncSession = Depends(get_db)):
-    _ = require_admin(token)
-    
-    return templates.TemplateResponse("order_tips.html", {
-        "request": request,
-        "token": token,
-        "page_title": "Советы по заказам",
-        "active_page": "order-tips"
-    })
+async def order_tips(request: Request, token: str = Depends(require_admin_token), db: AsyncSession = Depends(get_db)):
+    return render_admin_page(request, token, "order_tips.html", "Советы по заказам", "order-tips")
 
 @app.get("/assign-order", response_class=HTMLResponse)
-async def assign_order(request: Request, token: str, db: AsyncSession = Depends(get_db)):
-    _ = require_admin(token)
-    
-    return templates.TemplateResponse("assign_order.html", {
-        "request": request,
-        "token": token,
-        "page_title": "Назначить заказ",
-        "active_page": "assign-order"
-    })
+async def assign_order(request: Request, token: str = Depends(require_admin_token), db: AsyncSession = Depends(get_db)):
+    return render_admin_page(request, token, "assign_order.html", "Назначить заказ", "assign-order")
 
 @app.get("/statements", response_class=HTMLResponse)
-async def statements(request: Request, token: str, db: AsyncSession = Depends(get_db)):
-    _ = require_admin(token)
-    
-    return templates.TemplateResponse("statements.html", {
-        "request": request,
-        "token": token,
-        "page_title": "Выписки",
-        "active_page": "statements"
-    })
+async def statements(request: Request, token: str = Depends(require_admin_token), db: AsyncSession = Depends(get_db)):
+    return render_admin_page(request, token, "statements.html", "Выписки", "statements")
 
 @app.get("/users-database", response_class=HTMLResponse)
-async def users_database(request: Request, token: str, db: AsyncSession = Depends(get_db)):
-    _ = require_admin(token)
-    
-    return templates.TemplateResponse("users_database.html", {
-        "request": request,
-        "token": token,
-        "page_title": "База данных пользователей по городам",
-        "active_page": "users-database"
-    })
+async def users_database(request: Request, token: str = Depends(require_admin_token), db: AsyncSession = Depends(get_db)):
+    return render_admin_page(request, token, "users_database.html", "База данных пользователей по городам", "users-database")
 
 @app.get("/expenses", response_class=HTMLResponse)
-async def expenses(request: Request, token: str, db: AsyncSession = Depends(get_db)):
-    _ = require_admin(token)
-    
-    return templates.TemplateResponse("expenses.html", {
-        "request": request,
-        "token": token,
-        "page_title": "Расходы",
-        "active_page": "expenses"
-    })
+async def expenses(request: Request, token: str = Depends(require_admin_token), db: AsyncSession = Depends(get_db)):
+    return render_admin_page(request, token, "expenses.html", "Расходы", "expenses")
 
 @app.get("/registration-requests", response_class=HTMLResponse)
-async def registration_requests(request: Request, token: str, db: AsyncSession = Depends(get_db)):
-    _ = require_admin(token)
-    
-    # Отримуємо всі заявки зі статусом pending
-    result = await db.execute(
-        select(RegistrationRequest)
-        .where(RegistrationRequest.status == "pending")
-        .order_by(RegistrationRequest.created_at.desc())
-    )
-    requests = result.scalars().all()
-    
-    return templates.TemplateResponse("registration_requests.html", {
-        "request": request,
-        "token": token,
-        "requests": requests,
-        "page_title": "Заявки на реєстрацію",
-        "active_page": "registration"
-    })
+async def registration_requests(request: Request, token: str = Depends(require_admin_token)):
+    return render_admin_page(request, token, "registration_requests.html", "Заявки на реєстрацію", "registration")
 
-@app.post("/api/registration-requests/{request_id}/approve")
-async def approve_registration(request_id: int, token: str, db: AsyncSession = Depends(get_db)):
-    _ = require_admin(token)
-    
-    # Отримуємо заявку
-    result = await db.execute(
-        select(RegistrationRequest).where(RegistrationRequest.id == request_id)
-    )
-    reg_request = result.scalar_one_or_none()
-    
-    if not reg_request:
-        raise HTTPException(status_code=404, detail="Request not found")
+REGISTRATION_ERRORS = {
+    "not_found": (404, "Request not found"),
+    "already_processed": (400, "Request already processed"),
+    "duplicate_tg_id": (409, "User with this Telegram ID already exists"),
+}
+
+
+class RegistrationBatch(BaseModel):
+    ids: list[int]
+
+
+async def run_registration_batch(db: AsyncSession, request_ids: list[int], action: str) -> list[dict]:
+    if len(request_ids) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_SIZE} requests per batch")
     
-    if reg_request.status != "pending":
-        raise HTTPException(status_code=400, detail="Request already processed")
+    results = await process_registrations(db, request_ids, action)
+    await db.commit()
     
-    # Створюємо користувача
-    new_user = User(
-        tg_id=reg_request.tg_id,
-        username=reg_request.username,
-        password_hash=reg_request.password_hash,
-        city_id=reg_request.city_id,
-        is_active=True
+    approved_cities = {r["city_id"] for r in results if r["outcome"] == "approved"}
+    if approved_cities:
+        cache.invalidate(*(couriers_key(city_id) for city_id in approved_cities))
+    
+    processed = [r for r in results if r["outcome"] in ("approved", "rejected")]
+    if processed:
+        broker.publish(REGISTRATIONS_CHANNEL, "registration_processed", {
+            "items": [{"id": r["id"], "outcome": r["outcome"]} for r in processed]
+        })
+    return results
+
+
+@app.get("/api/registration-requests")
+async def get_registration_requests(
+    cursor: str | None = None,
+    city_id: int | None = None,
+    limit: int = Query(50, ge=1, le=200),
+    admin_id: int = Depends(require_admin),
+    db: AsyncSession = Depends(get_db)
+):
+    return await list_pending_requests(db, limit, cursor, city_id)
+
+
+@app.get("/api/registration-requests/stream")
+async def stream_registration_requests(request: Request, admin_id: int = Depends(require_admin)):
+    # SSE: registration_created - нова заявка від бота, registration_processed - оброблені заявки
+    await registration_feed.feed.ensure_started()
+    queue = broker.subscribe(REGISTRATIONS_CHANNEL)
+    return StreamingResponse(
+        sse_stream(request, REGISTRATIONS_CHANNEL, queue),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
     )
+
+
+@app.post("/api/registration-requests/batch/approve")
+async def approve_registrations_batch(batch: RegistrationBatch, admin_id: int = Depends(require_admin), db: AsyncSession = Depends(get_db)):
+    results = await run_registration_batch(db, batch.ids, "approve")
     
-    db.add(new_user)
+    return {"status": "success", "results": results}
+
+
+@app.post("/api/registration-requests/batch/reject")
+async def reject_registrations_batch(batch: RegistrationBatch, admin_id: int = Depends(require_admin), db: AsyncSession = Depends(get_db)):
+    results = await run_registration_batch(db, batch.ids, "reject")
     
-    # Оновлюємо статус заявки
-    reg_request.status = "approved"
+    return {"status": "success", "results": results}
+
+
+@app.post("/api/registration-requests/{request_id}/approve")
+async def approve_registration(request_id: int, admin_id: int = Depends(require_admin), db: AsyncSession = Depends(get_db)):
+    [result] = await run_registration_batch(db, [request_id], "approve")
     
-    await db.commit()
+    if result["outcome"] in REGISTRATION_ERRORS:
+        status_code, detail = REGISTRATION_ERRORS[result["outcome"]]
+        raise HTTPException(status_code=status_code, detail=detail)
     
     return {"status": "success", "message": "User approved"}
 
+
 @app.post("/api/registration-requests/{request_id}/reject")
-async def reject_registration(request_id: int, token: str, db: AsyncSession = Depends(get_db)):
-    _ = require_admin(token)
-    
-    # Отримуємо заявку
-    result = await db.execute(
-        select(RegistrationRequest).where(RegistrationRequest.id == request_id)
-    )
-    reg_request = result.scalar_one_or_none()
-    
-    if not reg_request:
-        raise HTTPException(status_code=404, detail="Request not found")
+async def reject_registration(request_id: int, admin_id: int = Depends(require_admin), db: AsyncSession = Depends(get_db)):
+    [result] = await run_registration_batch(db, [request_id], "reject")
     
-    if reg_request.status != "pending":
-        raise HTTPException(status_code=400, detail="Request already processed")
-    
-    # Оновлюємо статус заявки
-    reg_request.status = "rejected"
-    
-    await db.commit()
+    if result["outcome"] in REGISTRATION_ERRORS:
+        status_code, detail = REGISTRATION_ERRORS[result["outcome"]]
+        raise HTTPException(status_code=status_code, detail=detail)
     
     return {"status": "success", "message": "Request rejected"}
 
@@ -202,6 +197,7 @@ class ProductCreate(BaseModel):
     city_id: int
 
 class ProductUpdate(BaseModel):
+    version: int
     code: str | None = None
     name: str | None = None
     flavor: str | None = None
@@ -213,19 +209,35 @@ class ProductUpdate(BaseModel):
 
 
 @app.get("/api/cities/{city_id}/products")
-async def get_city_products(city_id: int, token: str, search: str = "", db: AsyncSession = Depends(get_db)):
-    _ = require_admin(token)
-    
-    query = select(Product).where(Product.city_id == city_id)
-    
+async def get_city_products(
+    city_id: int,
+    request: Request,
+    response: Response,
+    search: str = "",
+    limit: int = Query(100, ge=1, le=500),
+    offset: int = Query(0, ge=0),
+    admin_id: int = Depends(require_admin),
+    db: AsyncSession = Depends(get_db)
+):
+    # Умовний запит: перевірка лічильника міста замість завантаження товарів
+    etag = make_etag("products", city_id, await products_version(db, city_id))
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    response.headers.update(cache_headers(etag))
+    
+    search = search.strip()
     if search:
-        query = query.where(
-            (Product.name.ilike(f"%{search}%")) | 
-            (Product.code.ilike(f"%{search}%"))
+        # Ранжований пошук через pg_trgm (або n-грамний індекс на SQLite)
+        products = await product_search.search(db, city_id, search, limit, offset)
+    else:
+        result = await db.execute(
+            select(Product)
+            .where(Product.city_id == city_id)
+            .order_by(Product.id)
+            .limit(limit)
+            .offset(offset)
         )
-    
-    result = await db.execute(query)
-    products = result.scalars().all()
+        products = result.scalars().all()
     
     return [
         {
@@ -238,16 +250,15 @@ async def get_city_products(city_id: int, token: str, search: str = "", db: Asyn
             "sale_price": p.sale_price,
             "sold_quantity": p.sold_quantity,
             "avg_sale_price": p.avg_sale_price,
-            "stock": p.stock
+            "stock": p.stock,
+            "version": p.version
         }
         for p in products
     ]
 
 
 @app.post("/api/products")
-async def create_product(product: ProductCreate, token: str, db: AsyncSession = Depends(get_db)):
-    _ = require_admin(token)
-    
+async def create_product(product: ProductCreate, admin_id: int = Depends(require_admin), db: AsyncSession = Depends(get_db)):
     new_product = Product(
         code=product.code,
         name=product.name,
@@ -260,80 +271,284 @@ async def create_product(product: ProductCreate, token: str, db: AsyncSession =
     )
     
     db.add(new_product)
+    await db.flush()
+    db.add(StockMovement(
+        product_id=new_product.id,
+        quantity=new_product.stock,
+        reason="purchase"
+    ))
+    await bump_city_versions(db, new_product.city_id, products=True)
     await db.commit()
+    product_search.invalidate(new_product.city_id)
     
     return {"status": "success", "id": new_product.id}
 
 
 @app.put("/api/products/{product_id}")
-async def update_product(product_id: int, product: ProductUpdate, token: str, db: AsyncSession = Depends(get_db)):
-    _ = require_admin(token)
-    
-    result = await db.execute(
-        select(Product).where(Product.id == product_id)
-    )
-    db_product = result.scalar_one_or_none()
-    
-    if not db_product:
-        raise HTTPException(status_code=404, detail="Product not found")
-    
+async def update_product(product_id: int, product: ProductUpdate, admin_id: int = Depends(require_admin), db: AsyncSession = Depends(get_db)):
+    values = {}
     if product.code:
-        db_product.code = product.code
+        values["code"] = product.code
     if product.name:
-        db_product.name = product.name
+        values["name"] = product.name
     if product.flavor is not None:
-        db_product.flavor = product.flavor
+        values["flavor"] = product.flavor
     if product.purchase_price:
-        db_product.purchase_price = product.purchase_price
+        values["purchase_price"] = product.purchase_price
     if product.purchase_quantity is not None:
-        db_product.purchase_quantity = product.purchase_quantity
+        values["purchase_quantity"] = product.purchase_quantity
     if product.sale_price:
-        db_product.sale_price = product.sale_price
+        values["sale_price"] = product.sale_price
     if product.sold_quantity is not None:
-        db_product.sold_quantity = product.sold_quantity
+        values["sold_quantity"] = product.sold_quantity
     if product.stock is not None:
-        db_product.stock = product.stock
+        values["stock"] = product.stock
+        # Ручне коригування залишку фіксуємо в журналі руху товару.
+        # Якщо версія застаріла, UPDATE нижче не спрацює і транзакція відкотиться
+        await db.execute(
+            insert(StockMovement).from_select(
+                ["product_id", "quantity", "reason"],
+                select(Product.id, product.stock - Product.stock, literal("adjust")).where(
+                    Product.id == product_id,
+                    Product.version == product.version,
+                    Product.stock != product.stock
+                )
+            )
+        )
+    
+    # Оптимістичне блокування: один умовний UPDATE замість read-modify-write
+    result = await db.execute(
+        update(Product)
+        .where(Product.id == product_id, Product.version == product.version)
+        .values(**values, version=Product.version + 1)
+        .returning(Product.city_id, Product.version)
+        .execution_options(synchronize_session=False)
+    )
+    row = result.first()
+    
+    if row is None:
+        await db.rollback()
+        current_version = await db.scalar(select(Product.version).where(Product.id == product_id))
+        if current_version is None:
+            raise HTTPException(status_code=404, detail="Product not found")
+        raise HTTPException(
+            status_code=409,
+            detail={"message": "Product was modified by another user", "version": current_version}
+        )
     
+    await bump_city_versions(db, row.city_id, products=True)
     await db.commit()
+    product_search.invalidate(row.city_id)
     
-    return {"status": "success"}
+    return {"status": "success", "version": row.version}
 
 
 @app.delete("/api/products/{product_id}")
-async def delete_product(product_id: int, token: str, db: AsyncSession = Depends(get_db)):
-    _ = require_admin(token)
-    
-    await db.execute(
-        delete(Product).where(Product.id == product_id)
-    )
-    await db.commit()
+async def delete_product(product_id: int, admin_id: int = Depends(require_admin), db: AsyncSession = Depends(get_db)):
+    # Рядки order_items посилаються на товар без каскаду: проданий товар видаляти не можна,
+    # інакше замовлення втратять позиції. Перевірка дає зрозумілу відповідь і на SQLite без FK,
+    # IntegrityError - на випадок замовлення, створеного паралельно
+    if await db.scalar(select(OrderItem.id).where(OrderItem.product_id == product_id).limit(1)):
+        raise HTTPException(status_code=409, detail="Product has orders and cannot be deleted")
+    try:
+        result = await db.execute(
+            delete(Product).where(Product.id == product_id).returning(Product.city_id)
+        )
+        city_id = result.scalar_one_or_none()
+        if city_id is not None:
+            await bump_city_versions(db, city_id, products=True)
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=409, detail="Product has orders and cannot be deleted")
+    if city_id is not None:
+        product_search.invalidate(city_id)
     
     return {"status": "success"}
 
 
-@app.get("/api/cities")
-async def get_cities(token: str, db: AsyncSession = Depends(get_db)):
-    _ = require_admin(token)
+@app.post("/api/cities/{city_id}/products/import")
+async def import_city_products(
+    city_id: int,
+    file: UploadFile = File(...),
+    admin_id: int = Depends(require_admin),
+    db: AsyncSession = Depends(get_db)
+):
+    if not await db.scalar(select(City.id).where(City.id == city_id)):
+        raise HTTPException(status_code=404, detail="City not found")
     
-    result = await db.execute(
-        select(City).where(City.is_active == True)
+    filename = (file.filename or "").lower()
+    try:
+        if filename.endswith(".xlsx"):
+            rows = iter_xlsx_rows(file.file)
+        elif filename.endswith(".csv") or file.content_type in ("text/csv", "application/vnd.ms-excel"):
+            rows = iter_csv_rows(file.file)
+        else:
+            raise HTTPException(status_code=415, detail="Expected .csv or .xlsx file")
+    except ValueError as e:
+        # Кодування та формат перевіряються до запису першого чанка
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    # Версія міста та пошук оновлюються з кожним закоміченим чанком
+    report = await import_products(db, city_id, rows)
+    
+    return {"status": "success", **report}
+
+
+@app.get("/api/cities/{city_id}/products/export")
+async def export_city_products(city_id: int, admin_id: int = Depends(require_admin)):
+    return StreamingResponse(
+        export_products_csv(city_id),
+        media_type="text/csv; charset=utf-8",
+        headers={"Content-Disposition": f'attachment; filename="products_city_{city_id}.csv"'}
+    )
+
+
+@app.get("/api/users/by-city")
+async def get_users_by_city(admin_id: int = Depends(require_admin), db: AsyncSession = Depends(get_db)):
+    return await city_user_counts(db)
+
+
+@app.get("/api/users")
+async def get_users(
+    city_id: int | None = None,
+    search: str = "",
+    is_active: bool | None = None,
+    cursor: str | None = None,
+    limit: int = Query(50, ge=1, le=200),
+    admin_id: int = Depends(require_admin),
+    db: AsyncSession = Depends(get_db)
+):
+    return await list_users(db, limit, cursor, city_id, search.strip(), is_active)
+
+
+@app.get("/api/cities/{city_id}/users/export")
+async def export_city_users(city_id: int, admin_id: int = Depends(require_admin)):
+    return StreamingResponse(
+        export_users_csv(city_id),
+        media_type="text/csv; charset=utf-8",
+        headers={"Content-Disposition": f'attachment; filename="users_city_{city_id}.csv"'}
     )
-    cities = result.scalars().all()
+
+
+@app.get("/api/cities")
+async def get_cities(request: Request, response: Response, admin_id: int = Depends(require_admin), db: AsyncSession = Depends(get_db)):
+    async def load():
+        result = await db.execute(
+            select(City.id, City.name).where(City.is_active == True)
+        )
+        return [{"id": c.id, "name": c.name} for c in result.all()]
+    
+    cities = await cache.get_or_load(CITIES_KEY, load)
+    # Список міст маленький і лежить у кеші, тому ETag рахується з його вмісту
+    etag = make_etag("cities", *(f"{c['id']}={c['name']}" for c in cities))
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    response.headers.update(cache_headers(etag))
+    return cities
+
+
+@app.get("/api/cache/stats")
+async def get_cache_stats(admin_id: int = Depends(require_admin)):
+    return {"cache": cache.stats(), "auth": token_cache.stats()}
+
+
+@app.get("/api/db/pool")
+async def get_pool_stats(admin_id: int = Depends(require_admin)):
+    return pool_metrics.snapshot()
+
+
+@app.get("/api/db/queries")
+async def get_query_stats(admin_id: int = Depends(require_admin)):
+    return query_registry.snapshot()
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics(request: Request):
+    # Формат Prometheus text exposition. Скрейпер передає METRICS_TOKEN;
+    # якщо його не задано, метрики бачить лише адмін (як /api/db/queries)
+    if settings.METRICS_TOKEN:
+        if not secrets.compare_digest(request.headers.get("Authorization", ""), f"Bearer {settings.METRICS_TOKEN}"):
+            raise HTTPException(status_code=401, detail="Invalid metrics token")
+    else:
+        require_admin(request)
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+@app.post("/api/auth/logout")
+async def logout(response: Response, token: str = Depends(require_admin_token)):
+    token_cache.revoke(token)
+    clear_token_cookie(response)
     
-    return [{"id": c.id, "name": c.name} for c in cities]
+    return {"status": "success"}
 
 
 # API для роботи з замовленнями
 @app.get("/api/cities/{city_id}/couriers")
-async def get_city_couriers(city_id: int, token: str, db: AsyncSession = Depends(get_db)):
-    _ = require_admin(token)
-    
-    result = await db.execute(
-        select(User).where(User.city_id == city_id, User.is_active == True)
+async def get_city_couriers(city_id: int, admin_id: int = Depends(require_admin), db: AsyncSession = Depends(get_db)):
+    async def load():
+        result = await db.execute(
+            select(User.id, User.username, User.tg_id).where(User.city_id == city_id, User.is_active == True)
+        )
+        return [{"id": u.id, "username": u.username, "tg_id": u.tg_id} for u in result.all()]
+    
+    return await cache.get_or_load(couriers_key(city_id), load)
+
+
+@app.get("/api/cities/{city_id}/couriers/recommend")
+async def recommend_couriers(
+    city_id: int,
+    delivery_time: datetime,
+    limit: int = Query(5, ge=1, le=50),
+    admin_id: int = Depends(require_admin),
+    db: AsyncSession = Depends(get_db)
+):
+    # Кур'єри з кешу, навантаження з індексу в пам'яті - без сканування orders на кожен запит
+    couriers = await get_city_couriers(city_id, admin_id, db)
+    index = await courier_index.get(db, city_id)
+    return courier_index.rank(index, couriers, delivery_time, limit)
+
+
+@app.get("/api/cities/{city_id}/couriers/{courier_id}/free-slots")
+async def get_courier_free_slots(
+    city_id: int,
+    courier_id: int,
+    delivery_time: datetime,
+    count: int = Query(MAX_FREE_SLOTS, ge=1, le=20),
+    admin_id: int = Depends(require_admin),
+    db: AsyncSession = Depends(get_db)
+):
+    index = await courier_index.get(db, city_id)
+    slots = free_slots(
+        index.load(courier_id).pending_slots,
+        to_timestamp(delivery_time),
+        courier_index.slot_duration,
+        count,
+        datetime.now(timezone.utc).timestamp()
     )
-    users = result.scalars().all()
-    
-    return [{"id": u.id, "username": u.username, "tg_id": u.tg_id} for u in users]
+    return [to_datetime(slot).isoformat() for slot in slots]
+
+
+@app.post("/api/cities/{city_id}/schedule/replan")
+async def replan_city_schedule(
+    city_id: int,
+    day: date | None = None,
+    apply: bool = False,
+    admin_id: int = Depends(require_admin),
+    db: AsyncSession = Depends(get_db)
+):
+    # Без apply повертає лише план змін (courier_id / delivery_time) для pending-замовлень дня
+    day_start, day_end = day_bounds(day or today_utc())
+    result = await replan_city_day(db, city_id, day_start, day_end, courier_index.slot_duration, apply)
+    if apply:
+        await db.commit()
+        order_events.publish_committed(db)
+    return result
+
+
+@app.get("/api/dispatch/stats")
+async def get_dispatch_stats(admin_id: int = Depends(require_admin)):
+    return courier_index.stats()
 
 
 class OrderCreate(BaseModel):
@@ -342,55 +557,354 @@ class OrderCreate(BaseModel):
     receiver_id: int
     delivery_time: str
     delivery_address: str
-    products: str
+    items: list[OrderItemCreate] | None = None
+    products: str | None = None  # застарілий JSON-формат
+    allow_overlap: bool = False  # перетин слотів кур'єра - попередження замість 409
 
 
 @app.post("/api/orders")
-async def create_order(order: OrderCreate, token: str, db: AsyncSession = Depends(get_db)):
-    _ = require_admin(token)
+async def create_order(order: OrderCreate, admin_id: int = Depends(require_admin), db: AsyncSession = Depends(get_db)):
+    if order.items is not None:
+        items = order.items
+    else:
+        try:
+            items = parse_legacy_products(order.products)
+        except (ValueError, TypeError, AttributeError):
+            raise HTTPException(status_code=400, detail="Invalid products")
+    
+    order_items = await build_order_items(db, order.city_id, items)
+    
+    delivery_time = datetime.fromisoformat(order.delivery_time)
+    index = await courier_index.get(db, order.city_id)
+    warnings = check_slot(
+        index.load(order.courier_id).pending_slots,
+        to_timestamp(delivery_time),
+        courier_index.slot_duration,
+        order.allow_overlap
+    )
     
     new_order = Order(
         city_id=order.city_id,
         courier_id=order.courier_id,
         receiver_id=order.receiver_id,
-        delivery_time=datetime.fromisoformat(order.delivery_time),
+        delivery_time=delivery_time,
         delivery_address=order.delivery_address,
-        products=order.products,
+        products=json.dumps(serialize_items(order_items)),
+        items=order_items,
         status="pending"
     )
     
     db.add(new_order)
+    await db.flush()
+    # Резервуємо товар і ставимо повідомлення кур'єру в outbox у тій самій транзакції
+    await reserve_stock(db, new_order.id, order_items)
+    await enqueue_courier_notification(db, new_order, order_items)
+    await stage_order_created(db, new_order, order_items)
+    # Останнім перед комітом: UPDATE рядка міста тримає блокування до коміту і серіалізує замовлення міста
+    await bump_city_versions(db, order.city_id, products=True, orders=True)
     await db.commit()
+    order_events.publish_committed(db)
     
-    # Тут буде відправка повідомлення в Telegram
-    # TODO: Додати відправку повідомлення
+    return {"status": "success", "id": new_order.id, "warnings": warnings}
+
+
+class OrderStatusUpdate(BaseModel):
+    status: str
+
+
+@app.put("/api/orders/{order_id}/status")
+async def update_order_status(order_id: int, body: OrderStatusUpdate, admin_id: int = Depends(require_admin), db: AsyncSession = Depends(get_db)):
+    previous_status = await change_order_status(db, order_id, body.status)
+    await db.commit()
+    order_events.publish_committed(db)
     
-    return {"status": "success", "id": new_order.id}
+    return {"status": "success", "previous_status": previous_status}
+
+
+@app.post("/api/orders/{order_id}/cancel")
+async def cancel_order(order_id: int, admin_id: int = Depends(require_admin), db: AsyncSession = Depends(get_db)):
+    await change_order_status(db, order_id, "cancelled")
+    await db.commit()
+    order_events.publish_committed(db)
+    
+    return {"status": "success"}
+
+
+@app.get("/api/orders/stream")
+async def stream_orders(request: Request, city_id: int, admin_id: int = Depends(require_admin)):
+    # SSE: order_created, order_status_changed по місту; дашборди не опитують /api/orders
+    await order_events.ensure_listening()
+    channel = orders_channel(city_id)
+    queue = broker.subscribe(channel)
+    return StreamingResponse(
+        sse_stream(request, channel, queue),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.websocket("/ws/orders")
+async def orders_websocket(websocket: WebSocket, city_id: int):
+    # Те саме, що /api/orders/stream, для клієнтів з WebSocket; токен - як і для HTTP (cookie сторінки адмінки)
+    try:
+        require_admin(websocket)
+    except HTTPException:
+        await websocket.close(code=1008)
+        return
+    await websocket.accept()
+    await order_events.ensure_listening()
+    channel = orders_channel(city_id)
+    await websocket_stream(websocket, channel, broker.subscribe(channel))
+
+
+def encode_order_cursor(created_at: datetime, order_id: int) -> str:
+    raw = f"{created_at.isoformat()}|{order_id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def decode_order_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8")
+        created_at, order_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(order_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
 
 
 @app.get("/api/orders")
-async def get_orders(token: str, city_id: int | None = None, db: AsyncSession = Depends(get_db)):
-    _ = require_admin(token)
+async def get_orders(
+    request: Request,
+    response: Response,
+    city_id: int | None = None,
+    status: str | None = None,
+    delivery_from: datetime | None = None,
+    delivery_to: datetime | None = None,
+    cursor: str | None = None,
+    limit: int = Query(50, ge=1, le=200),
+    admin_id: int = Depends(require_admin),
+    db: AsyncSession = Depends(get_db)
+):
+    etag = make_etag("orders", city_id, await orders_version(db, city_id))
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    response.headers.update(cache_headers(etag))
+    
+    # Зв'язки підтягуються одним батчем, без lazy-load на кожен рядок
+    query = (
+        select(Order)
+        .options(
+            joinedload(Order.city),
+            selectinload(Order.courier),
+            selectinload(Order.receiver),
+            selectinload(Order.items)
+        )
+        .order_by(created_key(db, Order.created_at).desc(), Order.id.desc())
+    )
+    
+    if city_id:
+        query = query.where(Order.city_id == city_id)
+    if status:
+        query = query.where(Order.status == status)
+    if delivery_from:
+        query = query.where(Order.delivery_time >= delivery_from)
+    if delivery_to:
+        query = query.where(Order.delivery_time < delivery_to)
+    
+    # Keyset-пагінація по (created_at, id)
+    if cursor:
+        cursor_created_at, cursor_id = decode_order_cursor(cursor)
+        query = query.where(before_cursor(db, Order.created_at, Order.id, cursor_created_at, cursor_id))
+    
+    result = await db.execute(query.limit(limit + 1))
+    orders = result.scalars().all()
     
-    query = select(Order).order_by(Order.created_at.desc())
+    has_more = len(orders) > limit
+    orders = orders[:limit]
+    next_cursor = None
+    if has_more:
+        last = orders[-1]
+        next_cursor = encode_order_cursor(last.created_at, last.id)
+    
+    return {
+        "items": [
+            {
+                "id": o.id,
+                "city": o.city.name,
+                "courier": o.courier.username,
+                "receiver": o.receiver.username,
+                "delivery_time": o.delivery_time.isoformat(),
+                "delivery_address": o.delivery_address,
+                "products": o.products,
+                "items": serialize_items(o.items),
+                "status": o.status,
+                "created_at": o.created_at.isoformat()
+            }
+            for o in orders
+        ],
+        "next_cursor": next_cursor
+    }
+
+
+@app.get("/api/products/sales")
+async def get_product_sales(
+    city_id: int | None = None,
+    date_from: datetime | None = None,
+    date_to: datetime | None = None,
+    admin_id: int = Depends(require_admin),
+    db: AsyncSession = Depends(get_db)
+):
+    # Продажі по товарах рахуються в SQL по order_items
+    query = (
+        select(
+            OrderItem.product_id,
+            Product.code,
+            Product.name,
+            Product.flavor,
+            func.sum(OrderItem.quantity).label("quantity"),
+            func.sum(OrderItem.quantity * OrderItem.unit_price).label("revenue")
+        )
+        .join(Order, Order.id == OrderItem.order_id)
+        .join(Product, Product.id == OrderItem.product_id)
+        .where(Order.status != "cancelled")
+        .group_by(OrderItem.product_id, Product.code, Product.name, Product.flavor)
+        .order_by(func.sum(OrderItem.quantity).desc())
+    )
     
     if city_id:
         query = query.where(Order.city_id == city_id)
+    if date_from:
+        query = query.where(Order.created_at >= date_from)
+    if date_to:
+        query = query.where(Order.created_at < date_to)
     
     result = await db.execute(query)
-    orders = result.scalars().all()
     
     return [
         {
-            "id": o.id,
-            "city": o.city.name,
-            "courier": o.courier.username,
-            "receiver": o.receiver.username,
-            "delivery_time": o.delivery_time.isoformat(),
-            "delivery_address": o.delivery_address,
-            "products": o.products,
-            "status": o.status,
-            "created_at": o.created_at.isoformat()
+            "product_id": r.product_id,
+            "code": r.code,
+            "name": r.name,
+            "flavor": r.flavor,
+            "quantity": int(r.quantity or 0),
+            "revenue": float(r.revenue or 0)
+        }
+        for r in result.all()
+    ]
+
+
+@app.get("/api/statements")
+async def get_statements(
+    group_by: str = "city",
+    date_from: date | None = None,
+    date_to: date | None = None,
+    city_id: int | None = None,
+    admin_id: int = Depends(require_admin),
+    db: AsyncSession = Depends(get_db)
+):
+    # За замовчуванням - поточний місяць
+    today = today_utc()
+    date_to = date_to or today
+    date_from = date_from or date_to.replace(day=1)
+    
+    rows = await build_statement(db, group_by, date_from, date_to, city_id)
+    
+    return {
+        "group_by": group_by,
+        "date_from": date_from.isoformat(),
+        "date_to": date_to.isoformat(),
+        "rows": rows,
+        "total": {
+            "quantity": sum(r["quantity"] for r in rows),
+            "revenue": round(sum(r["revenue"] for r in rows), 2),
+            "cost": round(sum(r["cost"] for r in rows), 2),
+            "margin": round(sum(r["margin"] for r in rows), 2)
+        }
+    }
+
+
+# API для роботи з витратами
+class ExpenseCreate(BaseModel):
+    city_id: int
+    category: str
+    amount: float
+    description: str | None = None
+    spent_at: datetime | None = None
+
+
+@app.post("/api/expenses")
+async def create_expense(expense: ExpenseCreate, admin_id: int = Depends(require_admin), db: AsyncSession = Depends(get_db)):
+    if expense.amount <= 0:
+        raise HTTPException(status_code=400, detail="Amount must be positive")
+    
+    new_expense = Expense(
+        city_id=expense.city_id,
+        category=expense.category.strip().lower(),
+        amount=expense.amount,
+        description=expense.description,
+        spent_at=expense.spent_at or datetime.now(timezone.utc)
+    )
+    
+    db.add(new_expense)
+    await db.commit()
+    
+    return {"status": "success", "id": new_expense.id}
+
+
+@app.get("/api/expenses")
+async def get_expenses(
+    city_id: int | None = None,
+    date_from: date | None = None,
+    date_to: date | None = None,
+    limit: int = Query(100, ge=1, le=500),
+    offset: int = Query(0, ge=0),
+    admin_id: int = Depends(require_admin),
+    db: AsyncSession = Depends(get_db)
+):
+    query = select(Expense).order_by(Expense.spent_at.desc(), Expense.id.desc())
+    
+    if city_id:
+        query = query.where(Expense.city_id == city_id)
+    if date_from:
+        query = query.where(Expense.spent_at >= day_bounds(date_from)[0])
+    if date_to:
+        query = query.where(Expense.spent_at < day_bounds(date_to)[1])
+    
+    result = await db.execute(query.limit(limit).offset(offset))
+    
+    return [
+        {
+            "id": e.id,
+            "city_id": e.city_id,
+            "category": e.category,
+            "amount": e.amount,
+            "description": e.description,
+            "spent_at": e.spent_at.isoformat()
         }
-        for o in orders
+        for e in result.scalars().all()
     ]
+
+
+@app.delete("/api/expenses/{expense_id}")
+async def delete_expense(expense_id: int, admin_id: int = Depends(require_admin), db: AsyncSession = Depends(get_db)):
+    await db.execute(
+        delete(Expense).where(Expense.id == expense_id)
+    )
+    await db.commit()
+    
+    return {"status": "success"}
+
+
+@app.get("/api/expenses/report")
+async def get_expense_report(
+    period: str = "day",
+    date_from: date | None = None,
+    date_to: date | None = None,
+    city_id: int | None = None,
+    admin_id: int = Depends(require_admin),
+    db: AsyncSession = Depends(get_db)
+):
+    today = today_utc()
+    date_to = date_to or today
+    date_from = date_from or date_to.replace(day=1)
+    
+    return await build_expense_report(db, date_from, date_to, period, city_id)
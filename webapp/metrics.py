@@ -0,0 +1,148 @@
+import time
+from bisect import bisect_left
+from starlette.templating import Jinja2Templates
+from database.session import pool_metrics
+from database.instrumentation import query_registry
+from webapp.events import broker
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+RENDER_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+def escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(names: tuple[str, ...], values: tuple) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{escape_label(value)}"' for name, value in zip(names, values)) + "}"
+
+
+class Histogram:
+    # Лічильники по бакетах зберігаються некумулятивно (один інкремент на спостереження),
+    # кумулятивні значення рахуються лише при віддачі /metrics
+    def __init__(self, name: str, help_text: str, buckets: tuple, label_names: tuple[str, ...] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.label_names = label_names
+        self.series: dict[tuple, list] = {}
+
+    def observe(self, labels: tuple, value: float):
+        series = self.series.get(labels)
+        if series is None:
+            # [лічильники бакетів..., +Inf, сума]
+            series = self.series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for labels, series in self.series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series):
+                cumulative += count
+                lines.append(
+                    f"{self.name}_bucket{format_labels(self.label_names + ('le',), labels + (bound,))} {cumulative}"
+                )
+            label_text = format_labels(self.label_names, labels)
+            lines.append(f"{self.name}_sum{label_text} {series[-1]}")
+            lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+
+def render_value(name: str, kind: str, help_text: str, value: float) -> list[str]:
+    return [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}", f"{name} {value}"]
+
+
+request_latency = Histogram(
+    "http_request_duration_seconds", "HTTP request latency", LATENCY_BUCKETS, ("method", "route", "status")
+)
+response_size = Histogram(
+    "http_response_size_bytes", "HTTP response body size", SIZE_BUCKETS, ("method", "route")
+)
+template_render = Histogram(
+    "template_render_seconds", "Jinja2 template render time", RENDER_BUCKETS, ("template",)
+)
+
+
+class MetricsState:
+    def __init__(self):
+        self.in_flight = 0
+        self.started_at = time.time()
+
+
+metrics_state = MetricsState()
+
+
+class MetricsMiddleware:
+    # Чистий ASGI middleware (без BaseHTTPMiddleware): на запит - два виклики
+    # perf_counter і кілька інкрементів у словниках
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        size = 0
+
+        async def send_wrapper(message):
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        metrics_state.in_flight += 1
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            metrics_state.in_flight -= 1
+            # Шаблон маршруту замість шляху, щоб id в URL не плодили серії
+            route = scope.get("route")
+            route_path = route.path if route is not None else "unmatched"
+            method = scope["method"]
+            request_latency.observe((method, route_path, status), elapsed)
+            response_size.observe((method, route_path), size)
+
+
+class TimedJinja2Templates(Jinja2Templates):
+    # Шаблон рендериться в конструкторі відповіді, тому час TemplateResponse - це час рендера
+    def TemplateResponse(self, *args, **kwargs):
+        name = kwargs.get("name") or next((a for a in args if isinstance(a, str)), "unknown")
+        started = time.perf_counter()
+        try:
+            return super().TemplateResponse(*args, **kwargs)
+        finally:
+            template_render.observe((name,), time.perf_counter() - started)
+
+
+def render_metrics() -> str:
+    pool = pool_metrics.snapshot()
+    lines = []
+    lines += render_value("http_requests_in_flight", "gauge", "HTTP requests in progress", metrics_state.in_flight)
+    lines += request_latency.render()
+    lines += response_size.render()
+    lines += template_render.render()
+    lines += render_value("db_pool_checked_out", "gauge", "Connections checked out of the pool", pool["checked_out"])
+    lines += render_value("db_pool_overflow", "gauge", "Connections above pool_size", pool["overflow"])
+    lines += render_value("db_pool_checkouts_total", "counter", "Pool checkouts", pool["checkouts"])
+    lines += render_value("db_pool_wait_seconds_total", "counter", "Time spent waiting for a connection", pool_metrics.wait_total)
+    lines += render_value("db_pool_overflow_events_total", "counter", "Connections opened above pool_size", pool["overflow_events"])
+    lines += render_value("db_pool_timeouts_total", "counter", "Pool checkout timeouts", pool["timeouts"])
+    lines += render_value("db_queries_total", "counter", "SQL statements executed", query_registry.total_queries)
+    lines += render_value("db_query_seconds_total", "counter", "Time spent in SQL statements", query_registry.total_db_time)
+    events = broker.stats()
+    lines += render_value("events_subscribers", "gauge", "Open SSE/WebSocket subscriptions", events["subscribers"])
+    lines += render_value("events_published_total", "counter", "Events published to the broker", events["published"])
+    lines += render_value("events_dropped_total", "counter", "Slow subscribers reset with resync", events["dropped"])
+    lines += render_value("process_start_time_seconds", "gauge", "Process start time", metrics_state.started_at)
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,282 @@
+import json
+import html
+from collections import defaultdict
+from datetime import datetime, timezone
+from fastapi import HTTPException
+from pydantic import BaseModel
+from sqlalchemy import select, update, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from entities.models import Product, Order, OrderItem, StockMovement, User, City, NotificationOutbox
+from webapp.statements import apply_order_to_rollups
+from webapp.etag import bump_city_versions
+from webapp.events import NotifyRelay
+
+# Дозволені переходи статусів замовлення
+ORDER_TRANSITIONS = {
+    "pending": {"delivered", "cancelled"},
+}
+
+# Події замовлень для дашбордів: канал orders:<city_id>, між воркерами - через NOTIFY order_events
+order_events = NotifyRelay("order_events")
+
+
+def orders_channel(city_id: int) -> str:
+    return f"orders:{city_id}"
+
+
+class OrderItemCreate(BaseModel):
+    product_id: int
+    quantity: int
+    unit_price: float | None = None
+
+
+def parse_legacy_products(raw: str | None) -> list[OrderItemCreate]:
+    # Старий формат Order.products: [{"product_id"|"id", "quantity"|"qty", "price"|"unit_price"}] або {product_id: qty}
+    if not raw:
+        return []
+    data = json.loads(raw)
+    if isinstance(data, dict):
+        data = [{"product_id": k, "quantity": v} for k, v in data.items()]
+
+    items = []
+    for entry in data:
+        product_id = entry.get("product_id", entry.get("id"))
+        quantity = entry.get("quantity", entry.get("qty", 1))
+        unit_price = entry.get("unit_price", entry.get("price"))
+        items.append(OrderItemCreate(
+            product_id=int(product_id),
+            quantity=int(quantity),
+            unit_price=float(unit_price) if unit_price is not None else None
+        ))
+    return items
+
+
+async def build_order_items(db: AsyncSession, city_id: int, items: list[OrderItemCreate]) -> list[OrderItem]:
+    # Ціни та належність до міста перевіряються одним запитом
+    if not items:
+        return []
+
+    product_ids = {item.product_id for item in items}
+    result = await db.execute(
+        select(Product.id, Product.sale_price).where(
+            Product.id.in_(product_ids),
+            Product.city_id == city_id
+        )
+    )
+    prices = {row.id: row.sale_price for row in result.all()}
+
+    missing = product_ids - prices.keys()
+    if missing:
+        raise HTTPException(status_code=400, detail=f"Unknown products: {sorted(missing)}")
+
+    order_items = []
+    for item in items:
+        if item.quantity <= 0:
+            raise HTTPException(status_code=400, detail="Quantity must be positive")
+        order_items.append(OrderItem(
+            product_id=item.product_id,
+            quantity=item.quantity,
+            unit_price=item.unit_price if item.unit_price is not None else prices[item.product_id]
+        ))
+    return order_items
+
+
+def serialize_items(order_items: list[OrderItem]) -> list[dict]:
+    return [
+        {
+            "product_id": i.product_id,
+            "quantity": i.quantity,
+            "unit_price": i.unit_price
+        }
+        for i in order_items
+    ]
+
+
+async def reserve_stock(db: AsyncSession, order_id: int | None, order_items: list[OrderItem]):
+    # Атомарне списання: UPDATE ... WHERE stock >= n, без SELECT FOR UPDATE.
+    # Товари обробляються в порядку id, щоб паралельні транзакції не взаємоблокувались
+    quantities: dict[int, int] = defaultdict(int)
+    for item in order_items:
+        quantities[item.product_id] += item.quantity
+
+    for product_id in sorted(quantities):
+        quantity = quantities[product_id]
+        result = await db.execute(
+            update(Product)
+            .where(Product.id == product_id, Product.stock >= quantity)
+            .values(stock=Product.stock - quantity, version=Product.version + 1)
+            .returning(Product.id)
+            .execution_options(synchronize_session=False)
+        )
+        if result.scalar_one_or_none() is None:
+            raise HTTPException(status_code=409, detail=f"Insufficient stock for product {product_id}")
+
+        db.add(StockMovement(
+            product_id=product_id,
+            order_id=order_id,
+            quantity=-quantity,
+            reason="reserve"
+        ))
+
+
+async def release_stock(db: AsyncSession, order_id: int):
+    result = await db.execute(
+        select(OrderItem.product_id, func.sum(OrderItem.quantity).label("quantity"))
+        .where(OrderItem.order_id == order_id)
+        .group_by(OrderItem.product_id)
+        .order_by(OrderItem.product_id)
+    )
+    for row in result.all():
+        await db.execute(
+            update(Product)
+            .where(Product.id == row.product_id)
+            .values(stock=Product.stock + row.quantity, version=Product.version + 1)
+            .execution_options(synchronize_session=False)
+        )
+        db.add(StockMovement(
+            product_id=row.product_id,
+            order_id=order_id,
+            quantity=int(row.quantity),
+            reason="release"
+        ))
+
+
+async def record_sale(db: AsyncSession, order_id: int):
+    # Доставлене замовлення збільшує sold_quantity та перераховує середню ціну продажу
+    result = await db.execute(
+        select(
+            OrderItem.product_id,
+            func.sum(OrderItem.quantity).label("quantity"),
+            func.sum(OrderItem.quantity * OrderItem.unit_price).label("revenue")
+        )
+        .where(OrderItem.order_id == order_id)
+        .group_by(OrderItem.product_id)
+        .order_by(OrderItem.product_id)
+    )
+    for row in result.all():
+        await db.execute(
+            update(Product)
+            .where(Product.id == row.product_id)
+            .values(
+                avg_sale_price=(
+                    func.coalesce(Product.avg_sale_price, 0) * Product.sold_quantity + row.revenue
+                ) / (Product.sold_quantity + row.quantity),
+                sold_quantity=Product.sold_quantity + row.quantity,
+                version=Product.version + 1
+            )
+            .execution_options(synchronize_session=False)
+        )
+
+
+async def change_order_status(db: AsyncSession, order_id: int, new_status: str) -> str:
+    # Повертає попередній статус; коміт робить викликач
+    current_status = await db.scalar(select(Order.status).where(Order.id == order_id))
+    if current_status is None:
+        raise HTTPException(status_code=404, detail="Order not found")
+    if new_status not in ORDER_TRANSITIONS.get(current_status, set()):
+        raise HTTPException(status_code=400, detail=f"Cannot change status from {current_status} to {new_status}")
+
+    # Умовний UPDATE: паралельна зміна статусу не застосується двічі
+    values = {"status": new_status}
+    if new_status == "delivered":
+        # Фактичний час доставки - за ним рахуються виписки та підсумки продажів
+        values["delivered_at"] = datetime.now(timezone.utc)
+    result = await db.execute(
+        update(Order)
+        .where(Order.id == order_id, Order.status == current_status)
+        .values(**values)
+        .returning(Order.city_id)
+        .execution_options(synchronize_session=False)
+    )
+    city_id = result.scalar_one_or_none()
+    if city_id is None:
+        raise HTTPException(status_code=409, detail="Order status was changed concurrently")
+
+    if new_status == "cancelled":
+        await release_stock(db, order_id)
+    if new_status == "delivered":
+        await record_sale(db, order_id)
+        await apply_order_to_rollups(db, order_id, +1)
+    if current_status == "delivered":
+        await apply_order_to_rollups(db, order_id, -1)
+
+    await order_events.stage(db, orders_channel(city_id), "order_status_changed", {
+        "id": order_id,
+        "city_id": city_id,
+        "status": new_status,
+        "previous_status": current_status
+    })
+    # Скасування та доставка змінюють залишки/продажі товарів. Останній запит перед комітом
+    # викликача: блокування рядка міста не тримається під час решти запитів транзакції
+    await bump_city_versions(db, city_id, products=new_status in ("cancelled", "delivered"), orders=True)
+    return current_status
+
+
+async def stage_order_created(db: AsyncSession, order: Order, order_items: list[OrderItem]):
+    # Рядок у форматі GET /api/orders, щоб дашборд не перечитував список
+    result = await db.execute(
+        select(User.id, User.username).where(User.id.in_({order.courier_id, order.receiver_id}))
+    )
+    usernames = dict(result.all())
+    # created_at заповнює БД (server_default) - читаємо його разом з назвою міста
+    created = (await db.execute(
+        select(Order.created_at, City.name).join(City, City.id == Order.city_id).where(Order.id == order.id)
+    )).one()
+    await order_events.stage(db, orders_channel(order.city_id), "order_created", {
+        "id": order.id,
+        "city_id": order.city_id,
+        "city": created.name,
+        "courier_id": order.courier_id,
+        "courier": usernames.get(order.courier_id),
+        "receiver": usernames.get(order.receiver_id),
+        "delivery_time": order.delivery_time.isoformat(),
+        "delivery_address": order.delivery_address,
+        "items": serialize_items(order_items),
+        "status": order.status,
+        "created_at": created.created_at.isoformat()
+    }, compact=("id", "city_id", "courier_id", "delivery_time", "status"))
+
+
+async def enqueue_courier_notification(db: AsyncSession, order: Order, order_items: list[OrderItem]):
+    # Повідомлення пишеться в outbox у тій самій транзакції; відправляє його процес бота
+    courier_tg_id = await db.scalar(select(User.tg_id).where(User.id == order.courier_id))
+    if courier_tg_id is None:
+        raise HTTPException(status_code=400, detail="Courier not found")
+
+    result = await db.execute(
+        select(Product.id, Product.code, Product.name, Product.flavor)
+        .where(Product.id.in_({item.product_id for item in order_items}))
+    )
+    products = {row.id: row for row in result.all()}
+    db.add(NotificationOutbox(chat_id=courier_tg_id, text=courier_notification_text(order, order_items, products), order_id=order.id))
+
+
+def courier_notification_text(order: Order, order_items: list[OrderItem], products: dict) -> str:
+    lines = []
+    for item in order_items:
+        product = products[item.product_id]
+        title = f"{product.code} {product.name}" + (f" {product.flavor}" if product.flavor else "")
+        lines.append(f"• {html.escape(title)} × {item.quantity}")
+
+    return (
+        f"📦 <b>Нове замовлення #{order.id}</b>\n\n"
+        f"🕒 {order.delivery_time.strftime('%d.%m.%Y %H:%M')}\n"
+        f"📍 {html.escape(order.delivery_address)}\n\n"
+        + "\n".join(lines)
+    )
+
+
+def courier_reschedule_text(order: Order) -> str:
+    return (
+        f"🕒 <b>Замовлення #{order.id} перенесено</b>\n\n"
+        f"Новий час: {order.delivery_time.strftime('%d.%m.%Y %H:%M')}\n"
+        f"📍 {html.escape(order.delivery_address)}"
+    )
+
+
+def courier_unassigned_text(order: Order) -> str:
+    return (
+        f"❌ <b>Замовлення #{order.id} передано іншому кур'єру</b>\n\n"
+        f"📍 {html.escape(order.delivery_address)}\n"
+        f"Це замовлення доставляти не потрібно."
+    )
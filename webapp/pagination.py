@@ -0,0 +1,23 @@
+from datetime import datetime, timezone
+from sqlalchemy import func, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# Keyset-пагінація по (created_at, id). SQLite зберігає server_default CURRENT_TIMESTAMP рядком
+# без дробової частини, а прив'язаний datetime - з мікросекундами, і рядки порівнюються посимвольно.
+# Тому на SQLite обидві сторони (і сортування) зводяться до одного формату через strftime
+SQLITE_TIMESTAMP = "%Y-%m-%d %H:%M:%f"
+
+
+def created_key(db: AsyncSession, column):
+    if db.bind.dialect.name == "sqlite":
+        return func.strftime(SQLITE_TIMESTAMP, column)
+    return column
+
+
+def before_cursor(db: AsyncSession, created_column, id_column, created_at: datetime, row_id: int):
+    if db.bind.dialect.name == "sqlite":
+        if created_at.tzinfo is not None:
+            created_at = created_at.astimezone(timezone.utc).replace(tzinfo=None)
+        bound = func.strftime(SQLITE_TIMESTAMP, created_at.isoformat(sep=" "))
+        return tuple_(created_key(db, created_column), id_column) < tuple_(bound, row_id)
+    return tuple_(created_column, id_column) < tuple_(created_at, row_id)
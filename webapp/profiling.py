@@ -0,0 +1,22 @@
+from database.instrumentation import profile_scope
+
+
+class QueryProfileMiddleware:
+    # ASGI middleware: запити до БД кожного HTTP-запиту збираються в окремий профіль,
+    # ім'я профілю - метод і шаблон маршруту (GET /api/orders/{order_id})
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        # Шлях без маршруту (сканери, 404) не потрапляє в ім'я, інакше QueryRegistry росте без меж
+        with profile_scope(f"{scope['method']} unmatched", "request") as profile:
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                route = scope.get("route")
+                if route is not None:
+                    profile.name = f"{scope['method']} {route.path}"
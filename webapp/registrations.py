@@ -0,0 +1,205 @@
+import base64
+from datetime import datetime
+from fastapi import HTTPException
+from sqlalchemy import select, func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from configuration.settings import settings
+from database.session import AsyncSessionLocal
+from entities.models import RegistrationRequest, User, City
+from webapp.events import ChangeFeed, broker
+from webapp.pagination import created_key, before_cursor
+
+MAX_BATCH_SIZE = 500
+REGISTRATIONS_CHANNEL = "registration_requests"
+
+
+async def process_registrations(db: AsyncSession, request_ids: list[int], action: str) -> list[dict]:
+    # action: approve | reject. Усі заявки обробляються в одній транзакції,
+    # результат повертається окремо для кожного id; коміт робить викликач
+    request_ids = list(dict.fromkeys(request_ids))
+    result = await db.execute(
+        select(RegistrationRequest)
+        .where(RegistrationRequest.id.in_(request_ids))
+        .order_by(RegistrationRequest.id)
+        .with_for_update()
+    )
+    found = {r.id: r for r in result.scalars().all()}
+
+    outcomes: dict[int, str] = {}
+    pending = []
+    for request_id in request_ids:
+        reg_request = found.get(request_id)
+        if reg_request is None:
+            outcomes[request_id] = "not_found"
+        elif reg_request.status != "pending":
+            outcomes[request_id] = "already_processed"
+        else:
+            pending.append(reg_request)
+
+    if action == "reject":
+        for reg_request in pending:
+            reg_request.status = "rejected"
+            outcomes[reg_request.id] = "rejected"
+        return build_results(request_ids, outcomes, found)
+
+    # Кілька заявок з одним tg_id у пачці: підтверджуємо лише першу
+    first_by_tg_id: dict[int, RegistrationRequest] = {}
+    for reg_request in pending:
+        if reg_request.tg_id in first_by_tg_id:
+            outcomes[reg_request.id] = "duplicate_tg_id"
+        else:
+            first_by_tg_id[reg_request.tg_id] = reg_request
+
+    inserted_tg_ids = set()
+    if first_by_tg_id:
+        # ON CONFLICT DO NOTHING: вже зареєстровані tg_id не обривають пачку
+        dialect_insert = postgresql.insert if db.bind.dialect.name == "postgresql" else sqlite.insert
+        stmt = (
+            dialect_insert(User)
+            .on_conflict_do_nothing(index_elements=[User.tg_id])
+            .returning(User.tg_id)
+        )
+        result = await db.execute(stmt, [
+            {
+                "tg_id": r.tg_id,
+                "username": r.username,
+                "password_hash": r.password_hash,
+                "city_id": r.city_id,
+                "is_active": True
+            }
+            for r in first_by_tg_id.values()
+        ])
+        inserted_tg_ids = set(result.scalars().all())
+
+    for tg_id, reg_request in first_by_tg_id.items():
+        if tg_id in inserted_tg_ids:
+            reg_request.status = "approved"
+            outcomes[reg_request.id] = "approved"
+        else:
+            outcomes[reg_request.id] = "duplicate_tg_id"
+
+    return build_results(request_ids, outcomes, found)
+
+
+def build_results(request_ids: list[int], outcomes: dict[int, str], found: dict[int, RegistrationRequest]) -> list[dict]:
+    return [
+        {
+            "id": request_id,
+            "outcome": outcomes[request_id],
+            "city_id": found[request_id].city_id if request_id in found else None
+        }
+        for request_id in request_ids
+    ]
+
+
+def serialize_request(reg_request: RegistrationRequest, city_name: str | None) -> dict:
+    return {
+        "id": reg_request.id,
+        "username": reg_request.username,
+        "tg_id": reg_request.tg_id,
+        "city_id": reg_request.city_id,
+        "city": city_name,
+        "status": reg_request.status,
+        "created_at": reg_request.created_at.isoformat() if reg_request.created_at else None
+    }
+
+
+def encode_cursor(created_at: datetime, request_id: int) -> str:
+    raw = f"{created_at.isoformat()}|{request_id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8")
+        created_at, request_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(request_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+async def list_pending_requests(
+    db: AsyncSession,
+    limit: int,
+    cursor: str | None = None,
+    city_id: int | None = None
+) -> dict:
+    # Keyset-пагінація по (created_at, id) від нових до старих;
+    # обидва запити йдуть по частковому індексу status = 'pending'
+    query = (
+        select(RegistrationRequest, City.name)
+        .join(City, City.id == RegistrationRequest.city_id)
+        .where(RegistrationRequest.status == "pending")
+        .order_by(created_key(db, RegistrationRequest.created_at).desc(), RegistrationRequest.id.desc())
+    )
+    count_query = select(func.count()).select_from(RegistrationRequest).where(RegistrationRequest.status == "pending")
+    if city_id:
+        query = query.where(RegistrationRequest.city_id == city_id)
+        count_query = count_query.where(RegistrationRequest.city_id == city_id)
+    if cursor:
+        cursor_created_at, cursor_id = decode_cursor(cursor)
+        query = query.where(
+            before_cursor(db, RegistrationRequest.created_at, RegistrationRequest.id, cursor_created_at, cursor_id)
+        )
+
+    rows = (await db.execute(query.limit(limit + 1))).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = None
+    if has_more:
+        last = rows[-1][0]
+        next_cursor = encode_cursor(last.created_at, last.id)
+
+    return {
+        "items": [serialize_request(reg_request, city_name) for reg_request, city_name in rows],
+        "total": await db.scalar(count_query),
+        "next_cursor": next_cursor
+    }
+
+
+class RegistrationFeed:
+    # Публікує нові pending-заявки, створені ботом, у канал registration_requests.
+    # Id видаються до коміту, тому транзакція з меншим id може закомітитись пізніше -
+    # перечитуємо невелике вікно перед last_id і пропускаємо вже відомі заявки
+    LOOKBACK = 50
+
+    def __init__(self):
+        self.last_id: int | None = None
+        self.known_ids: set[int] = set()
+        self.feed = ChangeFeed(REGISTRATIONS_CHANNEL, self.fetch, settings.EVENTS_POLL_SEC)
+
+    async def fetch(self) -> int:
+        async with AsyncSessionLocal() as db:
+            if self.last_id is None:
+                # Перший запуск: усе, що вже є в БД, вважається відомим
+                self.last_id = await db.scalar(select(func.coalesce(func.max(RegistrationRequest.id), 0)))
+                result = await db.execute(
+                    select(RegistrationRequest.id).where(RegistrationRequest.id > self.last_id - self.LOOKBACK)
+                )
+                self.known_ids = set(result.scalars().all())
+                return 0
+            rows = (await db.execute(
+                select(RegistrationRequest, City.name)
+                .join(City, City.id == RegistrationRequest.city_id)
+                .where(
+                    RegistrationRequest.id > self.last_id - self.LOOKBACK,
+                    RegistrationRequest.status == "pending"
+                )
+                .order_by(RegistrationRequest.id)
+            )).all()
+
+        published = 0
+        for reg_request, city_name in rows:
+            if reg_request.id in self.known_ids:
+                continue
+            broker.publish(REGISTRATIONS_CHANNEL, "registration_created", serialize_request(reg_request, city_name))
+            self.known_ids.add(reg_request.id)
+            self.last_id = max(self.last_id, reg_request.id)
+            published += 1
+
+        self.known_ids = {i for i in self.known_ids if i > self.last_id - self.LOOKBACK}
+        return published
+
+
+registration_feed = RegistrationFeed()
@@ -0,0 +1,246 @@
+import heapq
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timezone
+from fastapi import HTTPException
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from entities.models import Order, User, Product, NotificationOutbox
+from webapp.etag import bump_city_versions
+from webapp.orders import (
+    order_events, orders_channel, courier_notification_text, courier_reschedule_text, courier_unassigned_text
+)
+
+# Слот доставки - [delivery_time, delivery_time + duration). Слоти кур'єра зберігаються
+# відсортованим списком початків, тож перетин шукається двома bisect за O(log n)
+MAX_FREE_SLOTS = 5
+
+
+def overlapping(slots: list[float], start: float, duration: float) -> list[float]:
+    # Слот s перетинається з [start, start + duration), якщо start - duration < s < start + duration
+    return slots[bisect_right(slots, start - duration):bisect_left(slots, start + duration)]
+
+
+def free_slots(slots: list[float], start: float, duration: float, count: int, not_before: float) -> list[float]:
+    # Найближчі вільні початки: крокуємо від бажаного часу в обидва боки,
+    # перестрибуючи через зайняті слоти, і беремо ближчі до start
+    found = []
+    later = start
+    for _ in range(count):
+        while True:
+            busy = overlapping(slots, later, duration)
+            if not busy:
+                break
+            later = busy[-1] + duration
+        found.append(later)
+        later += duration
+
+    earlier = start
+    for _ in range(count):
+        while True:
+            busy = overlapping(slots, earlier, duration)
+            if not busy:
+                break
+            earlier = busy[0] - duration
+        if earlier < not_before:
+            break
+        found.append(earlier)
+        earlier -= duration
+
+    return sorted(set(found), key=lambda s: (abs(s - start), s))[:count]
+
+
+def to_timestamp(value: datetime) -> float:
+    # SQLite повертає naive datetime - вважаємо його UTC
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def to_datetime(timestamp: float) -> datetime:
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc)
+
+
+def check_slot(slots: list[float], start: float, duration: float, allow_overlap: bool) -> list[dict]:
+    # Перетин або відхиляє замовлення (409 з вільними слотами), або повертається як попередження
+    busy = overlapping(slots, start, duration)
+    if not busy:
+        return []
+    conflict = {
+        "conflicts": [to_datetime(s).isoformat() for s in busy],
+        "free_slots": [
+            to_datetime(s).isoformat()
+            for s in free_slots(slots, start, duration, MAX_FREE_SLOTS, datetime.now(timezone.utc).timestamp())
+        ]
+    }
+    if not allow_overlap:
+        raise HTTPException(status_code=409, detail={"message": "Courier slot is already booked", **conflict})
+    return [{"type": "slot_overlap", **conflict}]
+
+
+def plan_day(
+    orders: list[tuple[int, int, float]],
+    couriers: list[int],
+    duration: float,
+    day_end: float
+) -> tuple[list[tuple[int, int, float]], list[int]]:
+    # Жадібне перепланування дня за O(n log n): замовлення йдуть за часом,
+    # кур'єр лишається своїм, якщо його попередній слот уже закінчився; інакше замовлення
+    # отримує найменш завантажений вільний активний кур'єр, а якщо вільних немає - зсувається
+    # на найближчий вільний час свого кур'єра, але не за межі дня (наступний день не завантажено).
+    # Повертає план (order_id, courier_id, start) і id замовлень, які не вдалося розмістити
+    active = set(couriers)
+    end: dict[int, float] = {c: float("-inf") for c in couriers}
+    load: dict[int, int] = {c: 0 for c in couriers}
+    # Кур'єри, зайняті до end, і вільні, впорядковані за навантаженням (ліниве видалення).
+    # У available потрапляють лише активні кур'єри: неактивний лише доводить свої замовлення
+    busy: list[tuple[float, int]] = []
+    available: list[tuple[int, int]] = [(0, c) for c in sorted(couriers)]
+
+    plan = []
+    unplaceable = []
+    for order_id, courier_id, start in sorted(orders, key=lambda o: (o[2], o[0])):
+        while busy and busy[0][0] <= start:
+            released_at, c = heapq.heappop(busy)
+            if end[c] == released_at and c in active:
+                heapq.heappush(available, (load[c], c))
+
+        chosen = courier_id if end.get(courier_id, float("-inf")) <= start else None
+        while chosen is None and available:
+            c_load, c = heapq.heappop(available)
+            if end[c] <= start and load[c] == c_load:
+                chosen = c
+        if chosen is None:
+            if end[courier_id] + duration > day_end:
+                unplaceable.append(order_id)
+                continue
+            chosen = courier_id
+            start = end[courier_id]
+
+        end[chosen] = start + duration
+        load[chosen] = load.get(chosen, 0) + 1
+        heapq.heappush(busy, (end[chosen], chosen))
+        plan.append((order_id, chosen, start))
+    return plan, unplaceable
+
+
+async def replan_city_day(
+    db: AsyncSession,
+    city_id: int,
+    day_start: datetime,
+    day_end: datetime,
+    duration: float,
+    apply: bool
+) -> dict:
+    result = await db.execute(
+        select(Order.id, Order.courier_id, Order.delivery_time).where(
+            Order.city_id == city_id,
+            Order.status == "pending",
+            Order.delivery_time >= day_start,
+            Order.delivery_time < day_end
+        )
+    )
+    rows = result.all()
+    courier_ids = (await db.execute(
+        select(User.id).where(User.city_id == city_id, User.is_active == True)
+    )).scalars().all()
+
+    current = {row.id: (row.courier_id, row.delivery_time) for row in rows}
+    plan, unplaceable = plan_day(
+        [(row.id, row.courier_id, to_timestamp(row.delivery_time)) for row in rows],
+        list(courier_ids),
+        duration,
+        to_timestamp(day_end)
+    )
+    changes = []
+    for order_id, courier_id, start in plan:
+        previous_courier_id, previous_time = current[order_id]
+        if courier_id != previous_courier_id or start != to_timestamp(previous_time):
+            changes.append({
+                "id": order_id,
+                "courier_id": courier_id,
+                "delivery_time": to_datetime(start),
+                "previous_courier_id": previous_courier_id,
+                "previous_delivery_time": previous_time
+            })
+
+    if apply and changes:
+        await apply_changes(db, city_id, changes)
+
+    return {
+        "orders": len(rows),
+        "couriers": len(courier_ids),
+        "changed": len(changes),
+        "applied": apply,
+        # Лишаються як є: свого кур'єра до кінця дня звільнити не вдалося, потрібне ручне рішення
+        "unplaceable": [
+            {"id": order_id, "courier_id": current[order_id][0], "delivery_time": current[order_id][1].isoformat()}
+            for order_id in unplaceable
+        ],
+        "changes": [
+            {**change, "delivery_time": change["delivery_time"].isoformat(),
+             "previous_delivery_time": change["previous_delivery_time"].isoformat()}
+            for change in changes
+        ]
+    }
+
+
+async def apply_changes(db: AsyncSession, city_id: int, changes: list[dict]):
+    # Один executemany по первинному ключу; status у WHERE не дає переписати
+    # замовлення, яке паралельно доставили або скасували
+    await db.execute(
+        update(Order).where(Order.status == "pending"),
+        [{"id": c["id"], "courier_id": c["courier_id"], "delivery_time": c["delivery_time"]} for c in changes],
+        execution_options={"synchronize_session": False}
+    )
+
+    # Новий кур'єр отримує повне повідомлення про замовлення, той самий кур'єр - про перенесення часу,
+    # попередній кур'єр - що замовлення в нього забрали (інакше за адресою поїдуть двоє).
+    # Кур'єри й товари вантажаться одним запитом на всі замовлення
+    orders = (await db.execute(
+        select(Order).options(selectinload(Order.items)).where(Order.id.in_({c["id"] for c in changes}))
+    )).scalars().all()
+    previous = {c["id"]: c["previous_courier_id"] for c in changes if c["courier_id"] != c["previous_courier_id"]}
+    tg_ids = dict((await db.execute(
+        select(User.id, User.tg_id).where(User.id.in_({order.courier_id for order in orders} | set(previous.values())))
+    )).all())
+    products = {}
+    if previous:
+        result = await db.execute(
+            select(Product.id, Product.code, Product.name, Product.flavor).where(Product.id.in_({
+                item.product_id for order in orders if order.id in previous for item in order.items
+            }))
+        )
+        products = {row.id: row for row in result.all()}
+
+    notifications = []
+    for order in orders:
+        if order.status != "pending":
+            continue
+        if order.id in previous:
+            notifications.append(NotificationOutbox(
+                chat_id=tg_ids[order.courier_id],
+                text=courier_notification_text(order, order.items, products),
+                order_id=order.id
+            ))
+            if previous[order.id] in tg_ids:
+                notifications.append(NotificationOutbox(
+                    chat_id=tg_ids[previous[order.id]],
+                    text=courier_unassigned_text(order),
+                    order_id=order.id
+                ))
+        else:
+            notifications.append(NotificationOutbox(
+                chat_id=tg_ids[order.courier_id],
+                text=courier_reschedule_text(order),
+                order_id=order.id
+            ))
+    db.add_all(notifications)
+
+    # Одна подія на все перепланування: payload NOTIFY обмежений 8000 байт,
+    # а дашборди та індекс навантаження все одно перечитують місто цілком
+    await order_events.stage(db, orders_channel(city_id), "orders_replanned", {
+        "city_id": city_id,
+        "changed": len(changes)
+    })
+    await bump_city_versions(db, city_id, orders=True)
@@ -0,0 +1,144 @@
+import asyncio
+from collections import defaultdict
+from sqlalchemy import select, func, literal, case
+from sqlalchemy.ext.asyncio import AsyncSession
+from entities.models import Product
+
+# Мінімальна схожість для нечіткого збігу (аналог pg_trgm.similarity_threshold)
+SIMILARITY_THRESHOLD = 0.3
+
+
+def escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def make_ngrams(text: str | None, n: int = 3) -> set[str]:
+    # Та сама схема, що і в pg_trgm: нижній регістр, пробіли по краях слова
+    if not text:
+        return set()
+    grams = set()
+    for word in text.lower().split():
+        padded = f"  {word} "
+        for i in range(len(padded) - n + 1):
+            grams.add(padded[i:i + n])
+    return grams
+
+
+class NgramIndex:
+    # Індекс товарів одного міста в пам'яті: n-грама -> id товарів
+    def __init__(self):
+        self.postings: dict[str, set[int]] = defaultdict(set)
+        self.docs: dict[int, tuple[str, str, str]] = {}
+
+    def add(self, product_id: int, name: str | None, code: str | None, flavor: str | None):
+        fields = ((name or "").lower(), (code or "").lower(), (flavor or "").lower())
+        self.docs[product_id] = fields
+        for field in fields:
+            for gram in make_ngrams(field):
+                self.postings[gram].add(product_id)
+
+    def search(self, query: str) -> list[tuple[int, float]]:
+        query = query.lower().strip()
+        query_grams = make_ngrams(query)
+        if not query_grams:
+            return []
+
+        hits: dict[int, int] = defaultdict(int)
+        for gram in query_grams:
+            for product_id in self.postings.get(gram, ()):
+                hits[product_id] += 1
+
+        ranked = []
+        for product_id, common in hits.items():
+            name, code, flavor = self.docs[product_id]
+            score = common / len(query_grams)
+            # Точний збіг коду та входження підрядка піднімаються вгору
+            if code == query:
+                score += 2.0
+            elif query in code or query in name or query in flavor:
+                score += 1.0
+            if score >= SIMILARITY_THRESHOLD:
+                ranked.append((product_id, score))
+
+        ranked.sort(key=lambda item: (-item[1], item[0]))
+        return ranked
+
+
+class ProductSearch:
+    # pg_trgm на PostgreSQL, n-грамний індекс у пам'яті для SQLite
+    def __init__(self):
+        self.indexes: dict[int, NgramIndex] = {}
+        self.lock = asyncio.Lock()
+
+    def invalidate(self, city_id: int | None = None):
+        if city_id is None:
+            self.indexes.clear()
+        else:
+            self.indexes.pop(city_id, None)
+
+    async def search(self, db: AsyncSession, city_id: int, text: str, limit: int, offset: int) -> list[Product]:
+        if db.bind.dialect.name == "postgresql":
+            return await self._search_trgm(db, city_id, text, limit, offset)
+        return await self._search_ngram(db, city_id, text, limit, offset)
+
+    async def _search_trgm(self, db: AsyncSession, city_id: int, text: str, limit: int, offset: int) -> list[Product]:
+        pattern = f"%{escape_like(text)}%"
+        flavor = func.coalesce(Product.flavor, "")
+        rank = func.greatest(
+            func.similarity(Product.name, text),
+            func.similarity(Product.code, text),
+            func.similarity(flavor, text),
+        ) + case((Product.code == text, 2.0), else_=0.0)
+
+        # ILIKE та оператор % обслуговуються GIN-індексами gin_trgm_ops
+        query = (
+            select(Product)
+            .where(
+                Product.city_id == city_id,
+                Product.name.ilike(pattern, escape="\\")
+                | Product.code.ilike(pattern, escape="\\")
+                | Product.flavor.ilike(pattern, escape="\\")
+                | Product.name.op("%")(literal(text))
+                | flavor.op("%")(literal(text))
+            )
+            .order_by(rank.desc(), Product.id)
+            .limit(limit)
+            .offset(offset)
+        )
+        result = await db.execute(query)
+        return list(result.scalars().all())
+
+    async def _search_ngram(self, db: AsyncSession, city_id: int, text: str, limit: int, offset: int) -> list[Product]:
+        index = await self._get_index(db, city_id)
+        page = index.search(text)[offset:offset + limit]
+        if not page:
+            return []
+
+        result = await db.execute(
+            select(Product).where(Product.id.in_([product_id for product_id, _ in page]))
+        )
+        by_id = {p.id: p for p in result.scalars().all()}
+        return [by_id[product_id] for product_id, _ in page if product_id in by_id]
+
+    async def _get_index(self, db: AsyncSession, city_id: int) -> NgramIndex:
+        index = self.indexes.get(city_id)
+        if index is not None:
+            return index
+
+        async with self.lock:
+            index = self.indexes.get(city_id)
+            if index is not None:
+                return index
+
+            index = NgramIndex()
+            result = await db.execute(
+                select(Product.id, Product.name, Product.code, Product.flavor)
+                .where(Product.city_id == city_id)
+            )
+            for row in result.all():
+                index.add(row.id, row.name, row.code, row.flavor)
+            self.indexes[city_id] = index
+            return index
+
+
+product_search = ProductSearch()
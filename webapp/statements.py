@@ -0,0 +1,240 @@
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta, timezone
+from fastapi import HTTPException
+from sqlalchemy import select, delete, func, literal
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from entities.models import City, Order, OrderItem, Product, SalesDailyRollup, User
+
+GROUP_COLUMNS = {
+    "city": (SalesDailyRollup.city_id, Order.city_id),
+    "courier": (SalesDailyRollup.courier_id, Order.courier_id),
+    "product": (SalesDailyRollup.product_id, OrderItem.product_id),
+}
+
+
+def today_utc() -> date:
+    return datetime.now(timezone.utc).date()
+
+
+def day_bounds(day: date) -> tuple[datetime, datetime]:
+    start = datetime.combine(day, time.min, tzinfo=timezone.utc)
+    return start, start + timedelta(days=1)
+
+
+def order_sales_query():
+    # Рядки продажів доставлених замовлень: кількість, виручка, собівартість.
+    # Продаж належить дню фактичної доставки (delivered_at), а не запланованому delivery_time:
+    # замовлення, доставлене раніше слоту, інакше випало б з виписки до настання слоту
+    return (
+        select(
+            Order.city_id,
+            Order.courier_id,
+            OrderItem.product_id,
+            func.sum(OrderItem.quantity).label("quantity"),
+            func.sum(OrderItem.quantity * OrderItem.unit_price).label("revenue"),
+            func.sum(OrderItem.quantity * Product.purchase_price).label("cost")
+        )
+        .join(OrderItem, OrderItem.order_id == Order.id)
+        .join(Product, Product.id == OrderItem.product_id)
+        .group_by(Order.city_id, Order.courier_id, OrderItem.product_id)
+    )
+
+
+async def apply_order_to_rollups(db: AsyncSession, order_id: int, sign: int):
+    # sign=+1 коли замовлення стає delivered, -1 коли виходить з delivered
+    result = await db.execute(
+        order_sales_query()
+        .add_columns(func.min(Order.delivered_at).label("delivered_at"))
+        .where(Order.id == order_id)
+    )
+    rows = [
+        {
+            "day": row.delivered_at.astimezone(timezone.utc).date() if row.delivered_at.tzinfo else row.delivered_at.date(),
+            "city_id": row.city_id,
+            "courier_id": row.courier_id,
+            "product_id": row.product_id,
+            "quantity": sign * int(row.quantity),
+            "revenue": sign * float(row.revenue),
+            "cost": sign * float(row.cost),
+        }
+        for row in result.all()
+    ]
+    if not rows:
+        return
+
+    dialect_insert = postgresql.insert if db.bind.dialect.name == "postgresql" else sqlite.insert
+    stmt = dialect_insert(SalesDailyRollup)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[
+            SalesDailyRollup.day, SalesDailyRollup.city_id,
+            SalesDailyRollup.courier_id, SalesDailyRollup.product_id
+        ],
+        set_={
+            "quantity": SalesDailyRollup.quantity + stmt.excluded.quantity,
+            "revenue": SalesDailyRollup.revenue + stmt.excluded.revenue,
+            "cost": SalesDailyRollup.cost + stmt.excluded.cost,
+        }
+    )
+    await db.execute(stmt, rows)
+
+
+async def rebuild_rollups(db: AsyncSession, date_from: date, date_to: date):
+    # Повний перерахунок днів [date_from, date_to] з сирих замовлень
+    await db.execute(
+        delete(SalesDailyRollup).where(SalesDailyRollup.day >= date_from, SalesDailyRollup.day <= date_to)
+    )
+    day = date_from
+    while day <= date_to:
+        start, end = day_bounds(day)
+        sales = order_sales_query().where(
+            Order.status == "delivered",
+            Order.delivered_at >= start,
+            Order.delivered_at < end
+        ).subquery()
+        await db.execute(
+            SalesDailyRollup.__table__.insert().from_select(
+                ["day", "city_id", "courier_id", "product_id", "quantity", "revenue", "cost"],
+                select(
+                    literal(day, SalesDailyRollup.day.type),
+                    sales.c.city_id, sales.c.courier_id, sales.c.product_id,
+                    sales.c.quantity, sales.c.revenue, sales.c.cost
+                )
+            )
+        )
+        day += timedelta(days=1)
+
+
+async def build_statement(
+    db: AsyncSession,
+    group_by: str,
+    date_from: date,
+    date_to: date,
+    city_id: int | None = None
+) -> list[dict]:
+    if group_by not in GROUP_COLUMNS:
+        raise HTTPException(status_code=400, detail="group_by must be city, courier or product")
+    if date_from > date_to:
+        raise HTTPException(status_code=400, detail="date_from is after date_to")
+
+    rollup_key, live_key = GROUP_COLUMNS[group_by]
+    totals: dict[int, list[float]] = defaultdict(lambda: [0, 0.0, 0.0])
+    today = today_utc()
+
+    def add_totals(rows):
+        for key, quantity, revenue, cost in rows:
+            totals[key][0] += int(quantity or 0)
+            totals[key][1] += float(revenue or 0)
+            totals[key][2] += float(cost or 0)
+
+    # Завершені дні - з rollup-таблиці
+    rollup_to = min(date_to, today - timedelta(days=1))
+    if date_from <= rollup_to:
+        query = (
+            select(
+                rollup_key.label("key"),
+                func.sum(SalesDailyRollup.quantity),
+                func.sum(SalesDailyRollup.revenue),
+                func.sum(SalesDailyRollup.cost)
+            )
+            .where(SalesDailyRollup.day >= date_from, SalesDailyRollup.day <= rollup_to)
+            .group_by(rollup_key)
+        )
+        if city_id:
+            query = query.where(SalesDailyRollup.city_id == city_id)
+        add_totals((await db.execute(query)).all())
+
+    # Сьогоднішній день - наживо з замовлень
+    if date_from <= today <= date_to:
+        start, end = day_bounds(today)
+        query = (
+            select(
+                live_key.label("key"),
+                func.sum(OrderItem.quantity),
+                func.sum(OrderItem.quantity * OrderItem.unit_price),
+                func.sum(OrderItem.quantity * Product.purchase_price)
+            )
+            .select_from(Order)
+            .join(OrderItem, OrderItem.order_id == Order.id)
+            .join(Product, Product.id == OrderItem.product_id)
+            .where(Order.status == "delivered", Order.delivered_at >= start, Order.delivered_at < end)
+            .group_by(live_key)
+        )
+        if city_id:
+            query = query.where(Order.city_id == city_id)
+        add_totals((await db.execute(query)).all())
+
+    names = await load_names(db, group_by, list(totals))
+    rows = [
+        {
+            "id": key,
+            "name": names.get(key),
+            "quantity": quantity,
+            "revenue": round(revenue, 2),
+            "cost": round(cost, 2),
+            "margin": round(revenue - cost, 2)
+        }
+        for key, (quantity, revenue, cost) in totals.items()
+    ]
+    rows.sort(key=lambda r: r["revenue"], reverse=True)
+    return rows
+
+
+async def daily_revenue(
+    db: AsyncSession,
+    date_from: date,
+    date_to: date,
+    city_id: int | None = None
+) -> list[tuple[date, float, float]]:
+    # Виручка та собівартість по днях: rollup для завершених днів, сьогодні наживо
+    rows = []
+    today = today_utc()
+
+    rollup_to = min(date_to, today - timedelta(days=1))
+    if date_from <= rollup_to:
+        query = (
+            select(SalesDailyRollup.day, func.sum(SalesDailyRollup.revenue), func.sum(SalesDailyRollup.cost))
+            .where(SalesDailyRollup.day >= date_from, SalesDailyRollup.day <= rollup_to)
+            .group_by(SalesDailyRollup.day)
+        )
+        if city_id:
+            query = query.where(SalesDailyRollup.city_id == city_id)
+        rows.extend((day, float(revenue or 0), float(cost or 0)) for day, revenue, cost in (await db.execute(query)).all())
+
+    if date_from <= today <= date_to:
+        start, end = day_bounds(today)
+        query = (
+            select(
+                func.sum(OrderItem.quantity * OrderItem.unit_price),
+                func.sum(OrderItem.quantity * Product.purchase_price)
+            )
+            .select_from(Order)
+            .join(OrderItem, OrderItem.order_id == Order.id)
+            .join(Product, Product.id == OrderItem.product_id)
+            .where(Order.status == "delivered", Order.delivered_at >= start, Order.delivered_at < end)
+        )
+        if city_id:
+            query = query.where(Order.city_id == city_id)
+        revenue, cost = (await db.execute(query)).one()
+        if revenue:
+            rows.append((today, float(revenue), float(cost or 0)))
+
+    return rows
+
+
+async def load_names(db: AsyncSession, group_by: str, keys: list[int]) -> dict[int, str]:
+    if not keys:
+        return {}
+    if group_by == "city":
+        result = await db.execute(select(City.id, City.name).where(City.id.in_(keys)))
+        return {row.id: row.name for row in result.all()}
+    if group_by == "courier":
+        result = await db.execute(select(User.id, User.username).where(User.id.in_(keys)))
+        return {row.id: row.username for row in result.all()}
+    result = await db.execute(
+        select(Product.id, Product.code, Product.name, Product.flavor).where(Product.id.in_(keys))
+    )
+    return {
+        row.id: f"{row.code} {row.name}" + (f" {row.flavor}" if row.flavor else "")
+        for row in result.all()
+    }
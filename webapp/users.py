@@ -0,0 +1,156 @@
+import csv
+import io
+from typing import AsyncIterator
+from fastapi import HTTPException
+from sqlalchemy import select, func, case, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from database.session import AsyncSessionLocal
+from entities.models import User, City, Order
+from webapp.search import escape_like
+
+EXPORT_BATCH_SIZE = 1000
+EXPORT_COLUMNS = ["id", "tg_id", "username", "is_active", "created_at", "courier_orders", "received_orders"]
+
+
+async def city_user_counts(db: AsyncSession) -> list[dict]:
+    # Один GROUP BY по users(city_id, is_active): на PostgreSQL - index-only scan без читання рядків
+    counts = (
+        select(
+            User.city_id,
+            func.count().label("total"),
+            func.sum(case((User.is_active == True, 1), else_=0)).label("active")
+        )
+        .group_by(User.city_id)
+        .subquery()
+    )
+    result = await db.execute(
+        select(City.id, City.name, counts.c.total, counts.c.active)
+        .outerjoin(counts, counts.c.city_id == City.id)
+        .order_by(City.name)
+    )
+    return [
+        {
+            "city_id": row.id,
+            "name": row.name,
+            "total": row.total or 0,
+            "active": row.active or 0,
+            "inactive": (row.total or 0) - (row.active or 0)
+        }
+        for row in result.all()
+    ]
+
+
+def users_filter(query, city_id: int | None, search: str, is_active: bool | None):
+    if city_id:
+        query = query.where(User.city_id == city_id)
+    if is_active is not None:
+        query = query.where(User.is_active == is_active)
+    if search:
+        # ILIKE по username (триграмний індекс на PostgreSQL) або точний tg_id
+        condition = User.username.ilike(f"%{escape_like(search)}%", escape="\\")
+        if search.isdigit():
+            condition = or_(condition, User.tg_id == int(search))
+        query = query.where(condition)
+    return query
+
+
+async def order_counts(db: AsyncSession, user_ids: list[int]) -> tuple[dict[int, int], dict[int, int]]:
+    # Лічильники лише для користувачів сторінки: два GROUP BY по індексах orders.courier_id / receiver_id
+    if not user_ids:
+        return {}, {}
+    as_courier = await db.execute(
+        select(Order.courier_id, func.count()).where(Order.courier_id.in_(user_ids)).group_by(Order.courier_id)
+    )
+    as_receiver = await db.execute(
+        select(Order.receiver_id, func.count()).where(Order.receiver_id.in_(user_ids)).group_by(Order.receiver_id)
+    )
+    return dict(as_courier.all()), dict(as_receiver.all())
+
+
+async def list_users(
+    db: AsyncSession,
+    limit: int,
+    cursor: str | None = None,
+    city_id: int | None = None,
+    search: str = "",
+    is_active: bool | None = None
+) -> dict:
+    # Keyset-пагінація по id: сторінка не дорожчає з глибиною, на відміну від OFFSET
+    query = users_filter(
+        select(User.id, User.tg_id, User.username, User.city_id, User.is_active, User.created_at),
+        city_id, search, is_active
+    )
+    if cursor:
+        try:
+            after_id = int(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        query = query.where(User.id > after_id)
+
+    rows = (await db.execute(query.order_by(User.id).limit(limit + 1))).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    as_courier, as_receiver = await order_counts(db, [row.id for row in rows])
+    total = await db.scalar(users_filter(select(func.count()).select_from(User), city_id, search, is_active))
+
+    return {
+        "items": [
+            {
+                "id": row.id,
+                "tg_id": row.tg_id,
+                "username": row.username,
+                "city_id": row.city_id,
+                "is_active": row.is_active,
+                "created_at": row.created_at.isoformat() if row.created_at else None,
+                "courier_orders": as_courier.get(row.id, 0),
+                "received_orders": as_receiver.get(row.id, 0)
+            }
+            for row in rows
+        ],
+        "total": total,
+        "next_cursor": str(rows[-1].id) if has_more else None
+    }
+
+
+async def export_users_csv(city_id: int) -> AsyncIterator[str]:
+    # Як і експорт товарів: окрема сесія та серверний курсор, у пам'яті лише одна партія.
+    # Лічильники замовлень - згруповані підзапити по місту, а не запит на кожного користувача
+    courier_counts = (
+        select(Order.courier_id.label("user_id"), func.count().label("orders"))
+        .where(Order.city_id == city_id)
+        .group_by(Order.courier_id)
+        .subquery()
+    )
+    receiver_counts = (
+        select(Order.receiver_id.label("user_id"), func.count().label("orders"))
+        .where(Order.city_id == city_id)
+        .group_by(Order.receiver_id)
+        .subquery()
+    )
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+
+    async with AsyncSessionLocal() as session:
+        result = await session.stream(
+            select(
+                User.id, User.tg_id, User.username, User.is_active, User.created_at,
+                func.coalesce(courier_counts.c.orders, 0),
+                func.coalesce(receiver_counts.c.orders, 0)
+            )
+            .outerjoin(courier_counts, courier_counts.c.user_id == User.id)
+            .outerjoin(receiver_counts, receiver_counts.c.user_id == User.id)
+            .where(User.city_id == city_id)
+            .order_by(User.id)
+            .execution_options(yield_per=EXPORT_BATCH_SIZE)
+        )
+        async for partition in result.partitions():
+            writer.writerows(partition)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue()